@@ -0,0 +1,77 @@
+import imp
+import os
+import tempfile
+import disasm
+import translator
+from cpu import Cpu
+
+# Ahead of time compiler: translates every block the disassembler reaches from
+# the rom start into one python module, cached by rom crc32 and translator
+# version so later starts import its .pyc instead of translating again. Blocks
+# the walk could not see (indirect jump targets) or whose code changed since
+# are translated at run time as usual, see translator.bind.
+
+CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.pchip16', 'aot')
+
+def module_name(rom):
+    return "rom_%08x_v%d" % (rom.crc32, translator.VERSION)
+
+def compile_rom(rom, graph=None):
+    # source of the module holding the blocks of rom
+    graph = graph or disasm.build(rom)
+    cpu = Cpu()
+    cpu.write_block(0x0000, rom.rom)
+    source = ["# generated by pchip16.aot, do not edit",
+              "import sys",
+              "VERSION = %d" % translator.VERSION,
+              "CRC32 = 0x%08X" % rom.crc32,
+              "SIZE = %d" % rom.size,
+              "BLOCKS = {}"]
+    for address in sorted(graph.blocks):
+        instructions = translator.scan(cpu, address)
+        if not instructions:
+            continue
+        name = "block_%04x" % address
+        block, line_instruction, fallbacks = translator.generate(instructions, name)
+        arguments = ["valid", "lines", "addresses", "fallbacks"]
+        arguments += ["execute_%d, params_%d" % (index, index) for index in sorted(fallbacks)]
+        source.append("")
+        source.append("def make_%s(%s):" % (name, ", ".join(arguments)))
+        # the generated lines move below the factory, and so do the lines the block maps to its instructions
+        offset = len(source)
+        source += ["    " + line for line in block.splitlines()]
+        source.append("    return %s" % name)
+        end = instructions[-1][0] + 4
+        lines = dict((offset + line, index) for line, index in line_instruction.items())
+        source.append("BLOCKS[0x%04X] = (make_%s, 0x%04X, %r, %r, %r, %r)" % (
+            address, name, end, str(cpu.read_block(address, end - address)),
+            translator.idle_loop(instructions), lines, tuple(sorted(fallbacks))))
+    return "\n".join(source) + "\n"
+
+def load(rom, directory=CACHE_DIRECTORY):
+    # the compiled module of rom, compiled and written to directory on the first load
+    name = module_name(rom)
+    path = os.path.join(directory, name + ".py")
+    if not os.path.exists(path):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # several processes may compile the same rom, each one renames a whole module in place
+        descriptor, temporary = tempfile.mkstemp('.py', name, directory)
+        with os.fdopen(descriptor, 'w') as module:
+            module.write(compile_rom(rom))
+        os.chmod(temporary, 0644)
+        os.rename(temporary, path)
+    found = imp.find_module(name, [directory])
+    try:
+        compiled = imp.load_module(name, *found)
+    finally:
+        found[0].close()
+    if compiled.CRC32 != rom.crc32 or compiled.SIZE != rom.size or compiled.VERSION != translator.VERSION:
+        raise ValueError("%s was not compiled from this rom" % path)
+    return compiled
+
+def attach(machine, directory=CACHE_DIRECTORY):
+    # runs the machine rom from its compiled blocks in TRANSLATION_MODE
+    machine.cpu.compiled = load(machine.rom, directory)
+    machine.cpu.TRANSLATION_MODE = True
+    return machine.cpu.compiled
@@ -0,0 +1,72 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import timeit
+import loader
+from chip16 import Chip16
+from rom_chip16 import RomChip16
+
+# Runs roms headless over a process pool, one machine per (rom, seed, frames)
+# job, and streams a result per job back as the jobs finish.
+
+def jobs(directory, seeds, frames):
+    # [(rom path, seed, frames)] for every .c16 file in directory
+    roms = sorted(name for name in os.listdir(directory) if name.endswith('.c16'))
+    return [(os.path.join(directory, name), seed, count) for name in roms for seed in seeds for count in frames]
+
+def run_job(job):
+    path, seed, frames = job
+    result = {'rom': path, 'seed': seed, 'frames': frames, 'cycles': 0, 'seconds': 0.0,
+              'instructions_per_second': 0.0, 'error': None}
+    timer = timeit.default_timer
+    start = timer()
+    machine = None
+    try:
+        machine = Chip16(RomChip16(loader.load(path)))
+        machine.cpu.seed(seed)
+        for frame in range(frames):
+            machine.run_frame()
+    except Exception as error:
+        result['error'] = "%s: %s" % (type(error).__name__, error)
+    elapsed = timer() - start
+    if machine is not None:
+        cpu = machine.cpu
+        result['cycles'] = cpu.current_cyles
+        result['seconds'] = elapsed
+        result['instructions_per_second'] = cpu.current_cyles / elapsed if elapsed > 0 else 0.0
+        result['pc'] = cpu.pc
+        result['sp'] = cpu.sp
+        result['registers'] = list(cpu.r)
+        result['gpu_hash'] = hashlib.sha1(machine.gpu.save_state()).hexdigest()
+    return result
+
+def run(directory, seeds, frames, processes=None, chunksize=4):
+    # yields the result of every job in the order they finish
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(run_job, jobs(directory, seeds, frames), chunksize):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='runs every rom of a directory headless, one json result per line')
+    parser.add_argument('directory')
+    parser.add_argument('--seeds', default='0', help='comma separated seeds')
+    parser.add_argument('--frames', default='60', help='comma separated frame counts')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=4)
+    arguments = parser.parse_args(argv)
+    seeds = [int(seed) for seed in arguments.seeds.split(',')]
+    frames = [int(count) for count in arguments.frames.split(',')]
+    for result in run(arguments.directory, seeds, frames, arguments.processes, arguments.chunksize):
+        sys.stdout.write(json.dumps(result, sort_keys=True) + "\n")
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
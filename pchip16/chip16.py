@@ -1,19 +1,166 @@
 from cpu import Cpu
-from gpu import Gpu
+from scheduler import Scheduler
+from rewind import Rewind
+import struct
+import zlib
+
+# magic, version, frames, number of events, then the cpu, gpu and spu states each preceded by its size
+STATE_MAGIC = 'C16S'
+STATE_VERSION = 3
+STATE = struct.Struct('<4sHQH')
+EVENT = struct.Struct('<Q8s')
+SECTION = struct.Struct('<I')
 
 class Chip16:
+    FRAMES_PER_SECOND = 60
+    CYCLES_PER_FRAME = Cpu.CYCLES_PER_SECOND / FRAMES_PER_SECOND
+    # controllers are read by the program from the IO ports
+    CONTROLLER_PORTS = (Cpu.IO_PORTS_START, Cpu.IO_PORTS_START + 2)
 
-    def __init__(self, rom):
+    def __init__(self, rom, cpu=None):
+        # a given cpu already holds the program, see fork
         self.rom = rom
-        self.cpu = Cpu()
-        self.gpu = Gpu()
-        self.cpu.gpu = self.gpu
+        self.cpu = cpu or Cpu()
+        # the cpu devices draw from and play for the cpu, see Cpu.fork
+        self.gpu = self.cpu.gpu
+        self.spu = self.cpu.spu
+        self.scheduler = Scheduler(lambda: self.cpu.current_cyles, Cpu.CYCLES_PER_SECOND)
+        self.spu.scheduler = self.scheduler
+        # returns the (controller 1, controller 2) states sampled at every frame end
+        self.input = None
+        self.frames = 0
+        # records a state at every frame end once started, see start_rewind
+        self.rewind = None
+        self.scheduler.schedule(Chip16.CYCLES_PER_FRAME, 'frame', self.__end_frame)
+        self.scheduler.schedule(Chip16.CYCLES_PER_FRAME, 'input', self.__sample_input)
         # fill ram/rom
-        for index, byte in enumerate(self.rom.rom):
-            self.cpu.write_8bit(index, byte)
+        if cpu is None:
+            self.cpu.write_block(0x0000, self.rom.rom)
+
+    def __end_frame(self, cycle):
+        self.frames += 1
+        self.gpu.start_vblank()
+        self.scheduler.schedule(cycle + Chip16.CYCLES_PER_FRAME, 'frame', self.__end_frame)
+        if self.rewind is not None:
+            self.rewind.record()
+
+    def __sample_input(self, cycle):
+        if self.input is not None:
+            for port, state in zip(Chip16.CONTROLLER_PORTS, self.input()):
+                self.cpu.write_16bit(port, state)
+        self.scheduler.schedule(cycle + Chip16.CYCLES_PER_FRAME, 'input', self.__sample_input)
 
     def step(self):
         self.cpu.step()
+        if self.cpu.current_cyles >= self.scheduler.next_cycle():
+            self.scheduler.run_due(self.cpu.current_cyles)
+
+    def run(self, cycles):
+        # runs the cpu from event to event, returns (cycles run, reason the last slice stopped)
+        # the clock only moves between slices: events scheduled by an instruction are timed
+        # from the start of its slice; a breakpoint or watchpoint stops right away
+        cpu = self.cpu
+        scheduler = self.scheduler
+        executed = 0
+        reason = Cpu.STOP_CYCLES
+        while executed < cycles:
+            budget = min(cycles - executed, scheduler.next_cycle() - cpu.current_cyles)
+            if budget > 0:
+                ran, reason = cpu.run(budget)
+                executed += ran
+                if reason in (Cpu.STOP_BREAKPOINT, Cpu.STOP_WATCHPOINT):
+                    return executed, reason
+            scheduler.run_due(cpu.current_cyles)
+        return executed, reason
+
+    def run_frame(self):
+        # runs up to the next frame boundary, returns (cycles run, reason)
+        return self.run(self.scheduler.due('frame') - self.cpu.current_cyles)
+
+    def run_until(self, predicate, cycles=None):
+        # steps until predicate(chip16) is true or cycles ran out, returns (cycles run, reason)
+        cpu = self.cpu
+        scheduler = self.scheduler
+        step = cpu.step
+        executed = 0
+        while not predicate(self):
+            if executed == cycles:
+                return executed, Cpu.STOP_CYCLES
+            step()
+            executed += 1
+            if cpu.current_cyles >= scheduler.next_cycle():
+                scheduler.run_due(cpu.current_cyles)
+        return executed, Cpu.STOP_PREDICATE
+
+    def start_rewind(self, seconds=10, keyframe_interval=FRAMES_PER_SECOND):
+        self.rewind = Rewind(self, seconds, keyframe_interval)
+        return self.rewind
+
+    def stop_rewind(self):
+        self.rewind = None
+
+    def step_back(self):
+        # restores the previous frame end, returns its cycle or None when there is no history
+        return self.rewind.step_back() if self.rewind is not None else None
+
+    def seek(self, cycle):
+        # goes back to an earlier cycle by restoring the frame before it and running again
+        return self.rewind.seek(cycle)
+
+    def save_state(self):
+        # everything needed to resume the machine, the rom and input callback are not part of it
+        events = self.scheduler.events()
+        parts = [STATE.pack(STATE_MAGIC, STATE_VERSION, self.frames, len(events))]
+        parts += [EVENT.pack(cycle, name) for cycle, name in events]
+        for state in (self.cpu.save_state(), self.gpu.save_state(), self.spu.save_state()):
+            parts += [SECTION.pack(len(state)), state]
+        return "".join(parts)
+
+    def load_state(self, state):
+        magic, version, frames, events = STATE.unpack_from(state)
+        if magic != STATE_MAGIC or version != STATE_VERSION:
+            raise ValueError("not a chip16 state (magic=%r, version=%s)" % (magic, version))
+        offset = STATE.size
+        restored = []
+        for index in range(events):
+            cycle, name = EVENT.unpack_from(state, offset)
+            restored.append((cycle, name.rstrip('\0')))
+            offset += EVENT.size
+        sections = []
+        for index in range(3):
+            size, = SECTION.unpack_from(state, offset)
+            offset += SECTION.size
+            sections.append(buffer(state, offset, size))
+            offset += size
+        self.cpu.load_state(sections[0])
+        self.gpu.load_state(sections[1])
+        self.spu.load_state(sections[2])
+        self.frames = frames
+        self.scheduler.restore(restored, self.__callbacks())
+
+    def __callbacks(self):
+        # scheduler event name -> callback, to restore events
+        return {'frame': self.__end_frame, 'input': self.__sample_input, 'sound': self.spu.expire}
+
+    def fork(self):
+        # independent machine in the same state sharing the rom and the input callback
+        child = Chip16(self.rom, self.cpu.fork())
+        child.frames = self.frames
+        child.input = self.input
+        child.scheduler.restore(self.scheduler.events(), child.__callbacks())
+        return child
+
+    def save_state_file(self, path, compress=True):
+        state = self.save_state()
+        with open(path, 'wb') as state_file:
+            state_file.write(zlib.compress(state) if compress else state)
+
+    def load_state_file(self, path):
+        with open(path, 'rb') as state_file:
+            state = state_file.read()
+        if not state.startswith(STATE_MAGIC):
+            state = zlib.decompress(state)
+        self.load_state(state)
 
     def print_debug(self):
         self.cpu.print_state()
@@ -0,0 +1,20 @@
+# State of a chip16 pad as the program reads it from its IO port
+# https://github.com/tykel/chip16/wiki/Machine-Specification#controllers
+class Controller:
+    UP = 0x01
+    DOWN = 0x02
+    LEFT = 0x04
+    RIGHT = 0x08
+    SELECT = 0x10
+    START = 0x20
+    A = 0x40
+    B = 0x80
+
+    def __init__(self):
+        self.state = 0x00
+
+    def press(self, button):
+        self.state |= button
+
+    def release(self, button):
+        self.state &= ~button & 0xFF
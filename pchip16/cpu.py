@@ -1,45 +1,826 @@
 import gpu
 import spu
-import logging
-import random
+import translator
+import interpreter
+import profiler
+import trace
+import log
+import struct
+import types
+import weakref
+
+REGISTERS = struct.Struct('<16H')
+# pc, sp, cycles, registers never written (bit per register), registers, carry, zero, overflow, negative, rnd state
+STATE = struct.Struct('<iiQH16i4BI')
+
+def flag_property(name):
+    field = '_flag_' + name
+
+    def get(cpu):
+        if cpu._pending_flags is not None:
+            cpu.resolve_flags()
+        return getattr(cpu, field)
+
+    def set(cpu, value):
+        if cpu._pending_flags is not None:
+            cpu.resolve_flags()
+        setattr(cpu, field, value)
+
+    return property(get, set)
+
+class IdleLoop(Exception):
+    # raised by a loop branch once an iteration left the cpu state unchanged
+    def __init__(self, target, size):
+        Exception.__init__(self, target, size)
+        self.target = target
+        self.size = size
+
+class DebugTrap(Exception):
+    # stops run() before the instruction at pc does anything, run() again goes past it once
+    reason = None
+
+class Breakpoint(DebugTrap):
+    reason = 'breakpoint'
+
+    def __init__(self, address):
+        DebugTrap.__init__(self, address)
+        self.address = address
+
+class Watchpoint(DebugTrap):
+    reason = 'watchpoint'
+
+    def __init__(self, address, access):
+        DebugTrap.__init__(self, address, access)
+        self.address = address
+        self.access = access
 
 # machine specs https://github.com/tykel/chip16/wiki/Machine-Specification
-class Cpu:
+class Cpu(object):
     RAM_ROM_START = 0x0000
     STACK_START = 0xFDF0
     IO_PORTS_START = 0xFFF0
     CYCLES_PER_SECOND = 1000000 #1MHz
     CYCLES_PER_INSTRUCTION = 1
     DEBUG_MODE = False
+    TRANSLATION_MODE = False
+    # run() uses the interpreter loops generated by interpreter.py while nothing is trapped
+    GENERATED_MODE = False
+    # op codes the generated loops test first, see interpreter.profiled_order
+    INTERPRETER_ORDER = interpreter.DEFAULT_ORDER
+    # ALU instructions record their operands and flags are only computed when read
+    LAZY_FLAGS = False
+    # why run() returned
+    STOP_CYCLES = 'cycles'
+    STOP_PREDICATE = 'predicate'
+    STOP_IDLE = 'idle'
+    STOP_BREAKPOINT = Breakpoint.reason
+    STOP_WATCHPOINT = Watchpoint.reason
+    # watchpoint accesses
+    WATCH_READ = 1
+    WATCH_WRITE = 2
+    # taken branches of an idle candidate loop between two state comparisons
+    IDLE_CHECK_INTERVAL = 16
+    # longest run of instructions run() dispatches as a single fused handler
+    FUSED_INSTRUCTIONS = 3
+    # RND draws from a xorshift32 generator owned by each cpu, seeded with seed()
+    DEFAULT_SEED = 0x2545F491
+    # modes an instance may override, the overrides carry over to forks
+    MODES = ('DEBUG_MODE', 'TRANSLATION_MODE', 'GENERATED_MODE', 'INTERPRETER_ORDER', 'LAZY_FLAGS',
+             'IDLE_CHECK_INTERVAL')
 
     def __init__(self):
-        logging.basicConfig(filename='pchip16.log', level=logging.DEBUG)
-        self.gpu = gpu.Gpu()
-        self.spu = spu.Spu()
+        self.__create_devices()
+        self.profiler = None
+        # DEBUG_MODE records every instruction here, created on first use when None
+        self.trace = None
+        # breakpoints are trap handlers installed when their address is decoded, watched
+        # addresses are checked on the pages they live in, see __remap
+        self.__breakpoints = set()
+        self.__watches = {}
+        # page -> watched accesses
+        self.__watch_pages = bytearray(0xFF + 1)
+        # memory mapped devices, see map_device
+        self.__devices = []
+        self.__watch_muted = False
+        self.last_trap = None
+        self.__seed = Cpu.DEFAULT_SEED
+        # blocks compiled ahead of time for the loaded rom, see aot
+        self.compiled = None
+        # cpus sharing this memory with each other since a fork, see fork
+        self.__shared = None
         self.reset()
 
     def reset(self):
-        self.__instruction_set = self.__instruction_table()
+        self.__instruction_set = Cpu.__instruction_sets[bool(self.LAZY_FLAGS)]
         self.current_cyles = 0
         self.pc = Cpu.RAM_ROM_START
         self.sp = Cpu.STACK_START
         self.r  = [None] * (0xF + 1)
+        self._pending_flags = None
         self.flag_carry = 0
         self.flag_zero = 0
         self.flag_overflow = 0
         self.flag_negative = 0
-        self.__memory = [None] * (0xFFFF + 1)
+        self.random_state = self.__seed
+        self.__load_memory(bytearray(0xFFFF + 1))
+
+    def __create_devices(self):
+        self.gpu = gpu.Gpu(lambda address, size: self.read_block(address, size), self.watch_sprite, self.unwatch_sprite)
+        self.spu = spu.Spu()
+
+    def __load_memory(self, memory, shared=None):
+        # starts over from memory, with nothing decoded from it, shared with the cpus of shared
+        if self.__shared is not None:
+            self.__leave_shared()
+        self.__memory = memory
+        # decoded instructions and translated blocks indexed by address and the 256 bytes pages they live in
+        self.__decoded = {}
+        # what the cpu this one was forked from had decoded and fused, see fork
+        self.__inherited = {}
+        self.__inherited_fused = {}
+        self.__blocks = {}
+        self.__page_blocks = {}
+        self.__code_pages = bytearray(0xFF + 1)
+        # pages the gpu decoded cached sprites from, see watch_sprite
+        self.__sprite_pages = bytearray(0xFF + 1)
+        self.gpu.clear_sprites()
+        # page -> byte handlers, None for plain ram
+        self.__page_readers = [None] * (0xFF + 1)
+        self.__page_writers = [None] * (0xFF + 1)
+        if shared is not None:
+            self.__share_memory(shared)
+        self.__device_pages = bytearray(0xFF + 1)
+        # watched and device pages are the only ones that are not plain ram after a reset
+        pages = set(address >> 8 for address in self.__watches)
+        for start, end, read, write in self.__devices:
+            pages.update(range(start >> 8, ((end - 1) >> 8) + 1))
+        self.__remap(*pages)
+        # branch address -> first address of the idle candidate loop it closes
+        self.__idle_loops = {}
+        # address -> (execute, params, instructions) used by run(), see __fuse
+        self.__fused = {}
+        self.__idle_state = None
+        self.__idle_watch = False
+        # address of the trapped instruction allowed to run once
+        self.__resume = None
+
+    flag_carry = flag_property('carry')
+    flag_zero = flag_property('zero')
+    flag_overflow = flag_property('overflow')
+    flag_negative = flag_property('negative')
+
+    def resolve_flags(self):
+        pending, self._pending_flags = self._pending_flags, None
+        operations = []
+        while pending is not None:
+            operations.append(pending)
+            pending = pending[2]
+        for update, operands, owner in reversed(operations):
+            update(self, *operands)
+
+    def seed(self, value):
+        # restarts the RND sequence, reset() goes back to the start of it
+        # xorshift never leaves 0, that seed maps to the default one
+        self.__seed = (value & 0xFFFFFFFF) or Cpu.DEFAULT_SEED
+        self.random_state = self.__seed
+
+    def random(self, maximum):
+        # next number of the RND sequence in [0, maximum]
+        x = self.random_state
+        x ^= (x << 13) & 0xFFFFFFFF
+        x ^= x >> 17
+        x ^= (x << 5) & 0xFFFFFFFF
+        self.random_state = x
+        return x % (maximum + 1)
 
     def step(self):
-        params = self.create_params(self.pc)
-        current_instruction = self.__instruction_set[params['op_code']]
+        try:
+            execute, params, mnemonic = self.__decoded[self.pc]
+        except KeyError:
+            execute, params, mnemonic = self.decode(self.pc)
 
         if self.DEBUG_MODE:
-            logging.info(self.__replace_constants(current_instruction['Mnemonic'], params))
+            self.__tracer().record(self.current_cyles, self.pc, self.__memory, self.r)
 
-        self.pc += current_instruction['execute'](params)
+        self.pc += execute(params)
         self.current_cyles += 1
 
+    def start_profiling(self):
+        # swaps in a step recording every instruction, run() then goes one step at a time
+        self.profiler = profiler.Profiler(self)
+        self.step = self.__step_profiled
+        return self.profiler
+
+    def stop_profiling(self):
+        del self.step
+        stopped, self.profiler = self.profiler, None
+        return stopped
+
+    def __step_profiled(self):
+        try:
+            execute, params, mnemonic = self.__decoded[self.pc]
+        except KeyError:
+            execute, params, mnemonic = self.decode(self.pc)
+
+        timer = self.profiler.timer
+        start = timer()
+        offset = execute(params)
+        self.profiler.record(self.pc, mnemonic, timer() - start)
+        self.pc += offset
+        self.current_cyles += 1
+
+    def run(self, cycles):
+        # runs up to cycles instructions in a single loop, returns (cycles run, reason)
+        # loops which can't change anything until an external event are fast-forwarded
+        # by whole iterations and reported as idle
+        start = self.current_cyles
+        generated = self.GENERATED_MODE and not self.__breakpoints and self.__resume is None
+        try:
+            if self.profiler is not None:
+                if generated:
+                    return self.__run_generated(cycles, interpreter.PROFILING, self.profiler.record)
+                for x in range(0, cycles):
+                    self.step()
+                return cycles, Cpu.STOP_CYCLES
+            if self.DEBUG_MODE:
+                if generated:
+                    return self.__run_generated(cycles, interpreter.TRACING, self.__tracer().record)
+                return self.__run_traced(cycles)
+            if self.TRANSLATION_MODE:
+                return self.__run_translated(cycles)
+            if generated:
+                return self.__run_generated(cycles, interpreter.PLAIN)
+            return self.__run_interpreted(cycles)
+        except DebugTrap as trap:
+            self.last_trap = trap
+            self.__resume_at(self.pc)
+            return self.current_cyles - start, trap.reason
+
+    def __run_interpreted(self, cycles):
+        decoded = self.__decoded
+        decode = self.decode
+        fused = self.__fused
+        fuse = self.__fuse
+        executed = 0
+        # fused groups only start while the longest one still fits in the budget
+        limit = cycles - Cpu.FUSED_INSTRUCTIONS + 1
+        reason = Cpu.STOP_CYCLES
+        self.__idle_state = None
+        self.__idle_watch = True
+        try:
+            while executed < cycles:
+                try:
+                    while executed < limit:
+                        try:
+                            execute, params, size = fused[self.pc]
+                        except KeyError:
+                            execute, params, size = fuse(self.pc)
+                        self.pc += execute(params)
+                        executed += size
+                    while executed < cycles:
+                        try:
+                            execute, params, mnemonic = decoded[self.pc]
+                        except KeyError:
+                            execute, params, mnemonic = decode(self.pc)
+                        self.pc += execute(params)
+                        executed += 1
+                except IdleLoop as loop:
+                    self.pc = loop.target
+                    executed += 1
+                    executed += (cycles - executed) // loop.size * loop.size
+                    reason = Cpu.STOP_IDLE
+        finally:
+            self.__idle_watch = False
+            self.current_cyles += executed
+        return executed, reason
+
+    def __fuse(self, address):
+        # superinstructions: an instruction that can only fail before changing anything (LDI,
+        # ALU), then LDIs and NOPs, optionally closed by JMP or Jx whose target is folded
+        execute, params, mnemonic = self.decode(address)
+        inherited = self.__inherited_fused.get(address)
+        if inherited is not None:
+            # fused before a fork: only the handler of the first instruction is bound to the cpu
+            group, size = inherited[1], inherited[2]
+            if size == 1:
+                fused = (execute, params, 1)
+            else:
+                fused = (self.__run_fused, (execute if group[0] is not None else None,) + group[1:], size)
+            self.__fused[address] = fused
+            return fused
+        fused = (execute, params, 1)
+        first = translator.TEMPLATES.get(params['op_code'], translator.FALLBACK)
+        if self.trapped(address):
+            self.__fused[address] = fused
+            return fused
+        if first['kind'] == translator.PLAIN and params['op_code'] not in (0x00, 0x20):
+            group = (execute, params)
+        elif params['op_code'] in (0x00, 0x20):
+            group = (None, None)
+        else:
+            self.__fused[address] = fused
+            return fused
+        loads = [(params['x'], params['hhll'])] if params['op_code'] == 0x20 else []
+        size = 1
+        offset = 4
+        while size < Cpu.FUSED_INSTRUCTIONS and not self.trapped(address + offset):
+            try:
+                execute, params, mnemonic = self.decode(address + offset)
+            except (KeyError, IndexError):
+                break
+            op_code = params['op_code']
+            if op_code in (0x00, 0x20):
+                if op_code == 0x20:
+                    loads.append((params['x'], params['hhll']))
+                size += 1
+                offset += 4
+                continue
+            if op_code in (0x10, 0x12) and address + offset not in self.__idle_loops:
+                size += 1
+                if op_code == 0x10 or params['x'] != 0:
+                    offset = params['hhll'] - address
+                else:
+                    offset += 4
+            break
+        if size > 1:
+            fused = (self.__run_fused, group + (tuple(loads), offset), size)
+        self.__fused[address] = fused
+        return fused
+
+    def __run_generated(self, cycles, variant, record=None):
+        run = interpreter.variant(variant, self.INTERPRETER_ORDER)
+        timer = self.profiler.timer if self.profiler is not None else None
+        return run(self, cycles, self.__memory, self.__instruction_set, self.create_params, record, timer)
+
+    def __run_fused(self, params):
+        execute, instruction, loads, offset = params
+        if execute is not None:
+            execute(instruction)
+        r = self.r
+        for index, value in loads:
+            r[index] = value
+        return offset
+
+    def __run_traced(self, cycles):
+        decoded = self.__decoded
+        decode = self.decode
+        record = self.__tracer().record
+        memory = self.__memory
+        executed = 0
+        try:
+            while executed < cycles:
+                pc = self.pc
+                try:
+                    execute, params, mnemonic = decoded[pc]
+                except KeyError:
+                    execute, params, mnemonic = decode(pc)
+                record(self.current_cyles + executed, pc, memory, self.r)
+                self.pc = pc + execute(params)
+                executed += 1
+        finally:
+            self.current_cyles += executed
+        return executed, Cpu.STOP_CYCLES
+
+    def __tracer(self):
+        if self.trace is None:
+            self.trace = trace.Trace()
+        return self.trace
+
+    def __run_translated(self, cycles):
+        # a block only runs when it fits in what is left, so the budget is never overrun
+        blocks = self.__blocks
+        translate = self.__translate
+        step = self.step
+        start = self.current_cyles
+        target = start + cycles
+        reason = Cpu.STOP_CYCLES
+        while self.current_cyles < target:
+            block = blocks.get(self.pc)
+            if block is None:
+                block = translate(self.pc)
+            if block is None or block.size > target - self.current_cyles:
+                step()
+            elif block.idle:
+                block.idle_countdown -= 1
+                if block.idle_countdown > 0:
+                    block.execute(self)
+                    continue
+                block.idle_countdown = self.IDLE_CHECK_INTERVAL
+                state = self.__idle_snapshot()
+                block.execute(self)
+                if self.pc == block.start and self.__idle_snapshot() == state:
+                    self.current_cyles += (target - self.current_cyles) // block.size * block.size
+                    reason = Cpu.STOP_IDLE
+            else:
+                block.execute(self)
+        return self.current_cyles - start, reason
+
+    def __idle_snapshot(self):
+        return (self.r[:], self.sp, self.flag_carry, self.flag_zero, self.flag_overflow, self.flag_negative)
+
+    def __idle_branch(self, execute, address, target):
+        # wraps the branch closing an idle candidate loop; the loop body has no other
+        # way out, so two taken branches in a row with the same state mean it is idle
+        size = (address - target) / 4 + 1
+        countdown = [self.IDLE_CHECK_INTERVAL]
+        def branch(params):
+            offset = execute(params)
+            if not self.__idle_watch:
+                return offset
+            if self.pc + offset != target:
+                self.__idle_state = None
+                return offset
+            countdown[0] -= 1
+            if countdown[0] > 1:
+                return offset
+            state = (address, self.__idle_snapshot())
+            if countdown[0] == 1:
+                self.__idle_state = state
+                return offset
+            countdown[0] = self.IDLE_CHECK_INTERVAL
+            if state == self.__idle_state:
+                raise IdleLoop(target, size)
+            return offset
+        return branch
+
+    def step_block(self):
+        # dynamic recompiler: runs the whole basic block at pc, returns how many instructions ran
+        try:
+            block = self.__blocks[self.pc]
+        except KeyError:
+            block = self.__translate(self.pc)
+            if block is None:
+                self.step()
+                return 1
+        try:
+            return block.execute(self)
+        except DebugTrap:
+            # the block has put pc back on the trapped instruction
+            self.__resume_at(self.pc)
+            raise
+
+    def decode(self, address):
+        try:
+            return self.__decoded[address]
+        except KeyError:
+            pass
+        # instructions decoded before a fork share their params with the forks
+        inherited = self.__inherited.get(address)
+        params = self.create_params(address) if inherited is None else inherited[1]
+        current_instruction = self.__instruction_set[params['op_code']]
+        decoded = (types.MethodType(current_instruction['execute'], self), params, current_instruction['Mnemonic'])
+        self.__decoded[address] = decoded
+        for page in (address >> 8, (address + 3) >> 8):
+            if not self.__code_pages[page & 0xFF]:
+                self.__code_pages[page & 0xFF] = 1
+                self.__remap(page)
+        target = address if params['op_code'] == 0x02 else params['hhll']
+        if params['op_code'] in (0x02, 0x10, 0x12, 0x13) and target <= address:
+            loop = translator.scan(self, target)
+            if loop and loop[-1][0] == address and translator.idle_loop(loop):
+                decoded = (self.__idle_branch(decoded[0], address, target),) + decoded[1:]
+                self.__decoded[address] = decoded
+                self.__idle_loops[address] = target
+        if address == self.__resume:
+            decoded = (self.__resume_handler(decoded[0], address),) + decoded[1:]
+            self.__decoded[address] = decoded
+        elif address in self.__breakpoints:
+            decoded = (self.__breakpoint_handler(address),) + decoded[1:]
+            self.__decoded[address] = decoded
+        return decoded
+
+    def precompile(self, addresses, blocks=()):
+        # decodes instructions known ahead of running them, blocks are only translated in TRANSLATION_MODE
+        for address in addresses:
+            self.decode(address)
+        if self.TRANSLATION_MODE:
+            for address in blocks:
+                if address not in self.__blocks:
+                    self.__translate(address)
+
+    def watch_sprite(self, address, size):
+        # the gpu cached a sprite decoded from [address, address + size), writes there are reported to gpu.invalidate
+        for page in range(address >> 8, ((address + max(size, 1) - 1) >> 8) + 1):
+            if not self.__sprite_pages[page & 0xFF]:
+                self.__sprite_pages[page & 0xFF] = 1
+                self.__remap(page)
+
+    def unwatch_sprite(self, address, size):
+        # the gpu dropped the last sprite cached from these pages
+        for page in range(address >> 8, ((address + max(size, 1) - 1) >> 8) + 1):
+            if self.__sprite_pages[page & 0xFF]:
+                self.__sprite_pages[page & 0xFF] = 0
+                self.__remap(page)
+
+    def add_breakpoint(self, address):
+        self.__breakpoints.add(address)
+        self.__invalidate_code(address, 1)
+
+    def remove_breakpoint(self, address):
+        self.__breakpoints.discard(address)
+        self.__invalidate_code(address, 1)
+
+    def breakpoints(self):
+        return sorted(self.__breakpoints)
+
+    def trapped(self, address):
+        # fused handlers and translated blocks never contain trapped instructions
+        return address in self.__breakpoints or address == self.__resume
+
+    def __breakpoint_handler(self, address):
+        def breakpoint(params):
+            self.__resume_at(address)
+            raise Breakpoint(address)
+        return breakpoint
+
+    def __resume_handler(self, execute, address):
+        def resume(params):
+            self.__resume = None
+            self.__invalidate_code(address, 1)
+            self.__watch_muted = True
+            try:
+                return execute(params)
+            finally:
+                self.__watch_muted = False
+        return resume
+
+    def __resume_at(self, address):
+        previous, self.__resume = self.__resume, address
+        if previous is not None:
+            self.__invalidate_code(previous, 1)
+        self.__invalidate_code(address, 1)
+
+    def add_watchpoint(self, address, access=WATCH_WRITE):
+        self.__watches[address] = self.__watches.get(address, 0) | access
+        self.__watch_pages[(address >> 8) & 0xFF] |= access
+        self.__remap(address >> 8)
+
+    def remove_watchpoint(self, address):
+        self.__watches.pop(address, None)
+        page = (address >> 8) & 0xFF
+        self.__watch_pages[page] = 0
+        for watched, access in self.__watches.items():
+            if (watched >> 8) & 0xFF == page:
+                self.__watch_pages[page] |= access
+        self.__remap(page)
+
+    def watchpoints(self):
+        return sorted(self.__watches.items())
+
+    def map_device(self, start, size, read=None, write=None):
+        # read(address) returns the byte at an address of [start, start + size) and
+        # write(address, value) takes the byte stored there, None leaves that access to ram;
+        # reads must not change anything: idle loops polling a device are found by comparing
+        # the cpu state
+        device = (start, start + size, read, write)
+        self.__devices.append(device)
+        for page in range(start >> 8, ((start + size - 1) >> 8) + 1):
+            self.__remap(page)
+        return device
+
+    def unmap_device(self, device):
+        self.__devices.remove(device)
+        start, end, read, write = device
+        for page in range(start >> 8, ((end - 1) >> 8) + 1):
+            self.__remap(page)
+
+    def devices(self):
+        return list(self.__devices)
+
+    def __remap(self, *pages):
+        # plain ram pages map to None and the accessors go straight to memory, the others are
+        # handled byte by byte: device, code and watched pages
+        for page in pages:
+            page &= 0xFF
+            start = page << 8
+            devices = [device for device in self.__devices if device[0] < start + 0x100 and start < device[1]]
+            readers = [device for device in devices if device[2] is not None]
+            writers = [device for device in devices if device[3] is not None]
+            if readers:
+                read = self.__device_reader(readers)
+            elif self.__watch_pages[page] & Cpu.WATCH_READ:
+                read = self.__read_ram
+            else:
+                read = None
+            if self.__code_pages[page] or self.__sprite_pages[page]:
+                write = self.__write_decoded
+            elif self.__watch_pages[page] & Cpu.WATCH_WRITE or writers:
+                write = self.__write_ram
+            elif self.__shared is not None:
+                write = self.__shared_write
+            else:
+                write = None
+            if writers:
+                write = self.__device_writer(writers, write)
+            self.__page_readers[page] = read
+            self.__page_writers[page] = write
+            self.__device_pages[page] = 1 if writers else 0
+        # reads only pay for the page lookup while a page has a reader
+        paged = self.__page_readers.count(None) < len(self.__page_readers)
+        for name in ('read_8bit', 'read_16bit', 'read_block'):
+            if paged:
+                setattr(self, name, getattr(self, '_Cpu__paged_' + name))
+            else:
+                self.__dict__.pop(name, None)
+
+    def __device_reader(self, devices):
+        def read(address):
+            location = address & 0xFFFF
+            for start, end, device_read, device_write in devices:
+                if start <= location < end:
+                    return device_read(location) & 0xFF
+            return self.__memory[address]
+        return read
+
+    def __device_writer(self, devices, fallback):
+        def write(address, value):
+            location = address & 0xFFFF
+            for start, end, device_read, device_write in devices:
+                if start <= location < end:
+                    device_write(location, value)
+                    return
+            fallback(address, value)
+        return write
+
+    def __read_ram(self, address):
+        return self.__memory[address]
+
+    def __write_ram(self, address, value):
+        self.__memory[address] = value
+
+    def __write_shared(self, address, value):
+        # stands in for plain ram while the memory is shared, stores go through __write_paged
+        self.__own_memory()
+        self.__memory[address] = value
+
+    def __share_memory(self, group):
+        # every page gets a writer, so the first store of any cpu of group goes through
+        # __write_paged and copies the memory before changing it
+        group.add(self)
+        self.__shared = group
+        write = self.__shared_write = self.__write_shared
+        writers = self.__page_writers
+        if any(writers):
+            self.__page_writers = [writer or write for writer in writers]
+        else:
+            self.__page_writers = [write] * len(writers)
+
+    def __leave_shared(self):
+        # returns the cpus left sharing the memory, the last one owns it again
+        group, self.__shared = self.__shared, None
+        group.discard(self)
+        write = self.__shared_write
+        self.__page_writers = [None if writer is write else writer for writer in self.__page_writers]
+        others = list(group)
+        if len(others) == 1:
+            others[0].__leave_shared()
+        return others
+
+    def __own_memory(self):
+        # the cpu about to store keeps the memory its running loop reads, the others move
+        # together to a copy of it
+        others = self.__leave_shared()
+        if others:
+            memory = bytearray(self.__memory)
+            for other in others:
+                other.__memory = memory
+
+    def __write_decoded(self, address, value):
+        self.__memory[address] = value
+        self.__invalidate_decoded(address, 1)
+
+    def __invalidate_decoded(self, address, size):
+        # drops the instructions and sprites decoded from the written bytes
+        pages = range(address >> 8, ((address + size - 1) >> 8) + 1)
+        if any(self.__code_pages[page & 0xFF] for page in pages):
+            self.__invalidate_code(address, size)
+        if any(self.__sprite_pages[page & 0xFF] for page in pages):
+            self.gpu.invalidate(address, size)
+
+    def __check_watch(self, address, size, access):
+        if self.__watch_muted:
+            return
+        for watched in range(address, address + size):
+            if self.__watches.get(watched, 0) & access:
+                self.__resume_at(self.pc)
+                raise Watchpoint(watched, access)
+
+    def __watched(self, address, size, access):
+        return any(self.__watch_pages[page & 0xFF] & access for page in range(address >> 8, ((address + size - 1) >> 8) + 1))
+
+    def __write_paged(self, address, data):
+        # the whole access is checked against the watchpoints before any byte is stored
+        size = len(data)
+        if self.__watches and self.__watched(address, size, Cpu.WATCH_WRITE):
+            self.__check_watch(address, size, Cpu.WATCH_WRITE)
+        if self.__shared is not None:
+            self.__own_memory()
+        pages = range(address >> 8, ((address + size - 1) >> 8) + 1)
+        if any(self.__device_pages[page & 0xFF] for page in pages):
+            writers = self.__page_writers
+            for offset, value in enumerate(data):
+                write = writers[(address + offset) >> 8]
+                if write is None:
+                    self.__memory[address + offset] = value
+                else:
+                    write(address + offset, value)
+            return
+        if address >= 0 and address + size <= 0xFFFF + 1:
+            self.__memory[address:address + size] = data
+        else:
+            for offset, value in enumerate(data):
+                self.__memory[address + offset] = value
+        self.__invalidate_decoded(address, size)
+
+    def __read_byte(self, address):
+        read = self.__page_readers[address >> 8]
+        if read is None:
+            return self.__memory[address]
+        return read(address)
+
+    def __paged_read_8bit(self, address):
+        if self.__page_readers[address >> 8] is None:
+            return self.__memory[address]
+        if self.__watch_pages[address >> 8] & Cpu.WATCH_READ:
+            self.__check_watch(address, 1, Cpu.WATCH_READ)
+        return self.__read_byte(address)
+
+    def __paged_read_16bit(self, address):
+        readers = self.__page_readers
+        if readers[address >> 8] is None and readers[((address + 1) >> 8) & 0xFF] is None:
+            return (self.__memory[address + 1] << 8) | self.__memory[address]
+        if self.__watched(address, 2, Cpu.WATCH_READ):
+            self.__check_watch(address, 2, Cpu.WATCH_READ)
+        return (self.__read_byte(address + 1) << 8) | self.__read_byte(address)
+
+    def __paged_read_block(self, address, size):
+        data = self.__memory[address:address + size]
+        if size > 0 and any(self.__page_readers[page & 0xFF] is not None for page in range(address >> 8, ((address + size - 1) >> 8) + 1)):
+            if self.__watched(address, size, Cpu.WATCH_READ):
+                self.__check_watch(address, size, Cpu.WATCH_READ)
+            for offset in range(len(data)):
+                data[offset] = self.__read_byte(address + offset)
+        return data
+
+    def __translate(self, address):
+        block = None
+        if self.compiled is not None:
+            block = translator.bind(self, self.compiled, address)
+        if block is None:
+            block = translator.translate(self, address)
+        if block is not None:
+            self.__blocks[address] = block
+            for page in range(block.start >> 8, ((block.end - 1) >> 8) + 1):
+                self.__page_blocks.setdefault(page, []).append(block)
+        return block
+
+    def __invalidate_code(self, address, size):
+        # any instruction starting up to 3 bytes before the written range may have been changed
+        for decoded in (self.__decoded, self.__inherited):
+            if size <= 4:
+                for code_address in range(address - 3, address + size):
+                    decoded.pop(code_address, None)
+            else:
+                for code_address in [x for x in decoded if address - 3 <= x < address + size]:
+                    del decoded[code_address]
+        start = address - 4 * Cpu.FUSED_INSTRUCTIONS + 1
+        for fused in (self.__fused, self.__inherited_fused):
+            if fused:
+                if size <= 4:
+                    for code_address in range(start, address + size):
+                        fused.pop(code_address, None)
+                else:
+                    for code_address in [x for x in fused if start <= x < address + size]:
+                        del fused[code_address]
+        # a loop is only idle while its body stays the same
+        for branch, target in self.__idle_loops.items():
+            if target < address + size and address - 3 <= branch:
+                del self.__idle_loops[branch]
+                self.__decoded.pop(branch, None)
+                self.__fused.pop(branch, None)
+        if self.__blocks:
+            for page in range(address >> 8, (((address + size - 1) >> 8) & 0xFF) + 1):
+                blocks = self.__page_blocks.get(page)
+                if blocks:
+                    for block in blocks[:]:
+                        if block.start < address + size and address < block.end:
+                            self.__discard_block(block)
+
+    def __discard_block(self, block):
+        block.invalidate()
+        if self.__blocks.get(block.start) is block:
+            del self.__blocks[block.start]
+        for page in range(block.start >> 8, ((block.end - 1) >> 8) + 1):
+            self.__page_blocks[page].remove(block)
+
+    def disassemble(self, address):
+        execute, params, mnemonic = self.decode(address)
+        return self.__replace_constants(mnemonic, params)
+
+    def disassemble_bytes(self, data):
+        params = self.create_params_from_bytes(*data)
+        return self.__replace_constants(self.__instruction_set[params['op_code']]['Mnemonic'], params)
+
     def register_pc(self):
         return self.__create_16bit_two_complement(self.pc)
 
@@ -51,38 +832,161 @@ class Cpu:
 
     def write_16bit(self, address, value):
         # little-endian machine
-        self.__memory[address + 0] = value & 0xFF
-        self.__memory[address + 1] = (value >> 8) & 0xFF
+        writers = self.__page_writers
+        if writers[address >> 8] is None and writers[((address + 1) >> 8) & 0xFF] is None:
+            self.__memory[address + 0] = value & 0xFF
+            self.__memory[address + 1] = (value >> 8) & 0xFF
+        else:
+            self.__write_paged(address, [value & 0xFF, (value >> 8) & 0xFF])
 
     def read_16bit(self, address):
         # little-endian machine
-        return ((self.__memory[address + 1] & 0xFF) << 8) | (self.__memory[address] & 0xFF)
+        return (self.__memory[address + 1] << 8) | self.__memory[address]
 
     def write_8bit(self, address, value):
-        self.__memory[address] = value & 0xFF
+        if self.__page_writers[address >> 8] is None:
+            self.__memory[address] = value & 0xFF
+        else:
+            self.__write_paged(address, [value & 0xFF])
 
     def read_8bit(self, address):
-        return self.__memory[address] & 0xFF
+        return self.__memory[address]
+
+    def write_block(self, address, data):
+        end = address + len(data)
+        if address < 0 or end > 0xFFFF + 1:
+            raise IndexError("block [%s, %s) is out of memory" % (hex(address), hex(end)))
+        writers = self.__page_writers
+        for page in range(address >> 8, ((end - 1) >> 8) + 1):
+            if writers[page] is not None:
+                self.__write_paged(address, bytearray(data))
+                return
+        self.__memory[address:end] = data
+
+    def read_block(self, address, size):
+        return self.__memory[address:address + size]
+
+    def memory(self):
+        # accesses through the view bypass devices, watchpoints and code invalidation, and
+        # stores go to the memory of later forks until one of them stores through the cpu
+        if self.__shared is not None:
+            self.__own_memory()
+        return memoryview(self.__memory)
+
+    def save_state(self):
+        # registers, flags and the whole memory in a flat binary string
+        unset = 0
+        for index, value in enumerate(self.r):
+            if value is None:
+                unset |= 1 << index
+        if self._pending_flags is not None:
+            self.resolve_flags()
+        header = STATE.pack(self.pc, self.sp, self.current_cyles, unset, *([x or 0 for x in self.r] +
+                            [self._flag_carry, self._flag_zero, self._flag_overflow, self._flag_negative,
+                             self.random_state]))
+        return header + bytes(self.__memory)
+
+    def load_state(self, state):
+        values = STATE.unpack_from(state)
+        self.pc, self.sp, self.current_cyles, unset = values[:4]
+        self.r = [None if unset & (1 << index) else value for index, value in enumerate(values[4:20])]
+        self._pending_flags = None
+        self._flag_carry, self._flag_zero, self._flag_overflow, self._flag_negative = values[20:24]
+        self.random_state = values[24]
+        memory = buffer(state, STATE.size, len(self.__memory))
+        # only the code and sprite pages that differ lose what was decoded from them
+        for pages, invalidate in ((self.__code_pages, self.__invalidate_code), (self.__sprite_pages, self.gpu.invalidate)):
+            page = pages.find('\x01')
+            while page != -1:
+                start = page << 8
+                if memory[start:start + 0x100] != self.__memory[start:start + 0x100]:
+                    invalidate(start, 0x100)
+                page = pages.find('\x01', page + 1)
+        if self.__shared is not None:
+            self.__own_memory()
+        self.__memory[:] = memory
+        self.__idle_state = None
+        # a restored breakpoint stop goes past the breakpoint on the next run, like the original
+        if self.pc in self.__breakpoints:
+            self.__resume_at(self.pc)
+        elif self.__resume is not None:
+            self.__invalidate_code(self.__resume, 1)
+            self.__resume = None
+
+    def fork(self):
+        # independent cpu in the same state with its own gpu and spu. Built field by field,
+        # without a reset: the memory is shared until either cpu stores to it and what was
+        # decoded and fused is bound again to the child when it runs there
+        if self._pending_flags is not None:
+            self.resolve_flags()
+        cls = type(self)
+        child = cls.__new__(cls)
+        for name in Cpu.MODES:
+            if name in self.__dict__:
+                setattr(child, name, self.__dict__[name])
+        child.__create_devices()
+        child.gpu.copy_state(self.gpu)
+        child.spu.load_state(self.spu.save_state())
+        child.profiler = None
+        child.trace = None
+        child.__breakpoints = set(self.__breakpoints)
+        child.__watches = dict(self.__watches)
+        child.__watch_pages = bytearray(self.__watch_pages)
+        # map_device callbacks are shared with the child
+        child.__devices = list(self.__devices)
+        child.__watch_muted = False
+        child.last_trap = None
+        child.__seed = self.__seed
+        child.compiled = self.compiled
+        child.__instruction_set = Cpu.__instruction_sets[bool(child.LAZY_FLAGS)]
+        child.current_cyles = self.current_cyles
+        child.pc = self.pc
+        child.sp = self.sp
+        child.r = self.r[:]
+        child._pending_flags = None
+        child._flag_carry, child._flag_zero = self._flag_carry, self._flag_zero
+        child._flag_overflow, child._flag_negative = self._flag_overflow, self._flag_negative
+        child.random_state = self.random_state
+        if self.__shared is None:
+            self.__share_memory(weakref.WeakSet())
+        child.__shared = None
+        child.__load_memory(self.__memory, self.__shared)
+        child.__inherited = dict(self.__inherited)
+        child.__inherited.update(self.__decoded)
+        child.__inherited_fused = dict(self.__inherited_fused)
+        child.__inherited_fused.update(self.__fused)
+        # writes to the pages of inherited code invalidate it
+        child.__code_pages[:] = self.__code_pages
+        pages = []
+        page = self.__code_pages.find('\x01')
+        while page != -1:
+            pages.append(page)
+            page = self.__code_pages.find('\x01', page + 1)
+        child.__remap(*pages)
+        child.__resume = self.__resume
+        return child
 
     def print_memory(self):
-        logging.debug("$$$$$$$$$$$$$$$$$ Memory State $$$$$$$$$$$$$$$$$$$$")
-        used_memory = ["[%s]=%s" % (hex(index), hex(x)) for index, x in enumerate(self.__memory) if x is not None]
-        logging.debug(used_memory)
-        logging.debug("$$$$$$$$$$$$$$$$$ Memory State $$$$$$$$$$$$$$$$$$$$")
+        log.debug("$$$$$$$$$$$$$$$$$ Memory State $$$$$$$$$$$$$$$$$$$$")
+        used_memory = ["[%s]=%s" % (hex(index), hex(x)) for index, x in enumerate(self.__memory) if x != 0]
+        log.debug(used_memory)
+        log.debug("$$$$$$$$$$$$$$$$$ Memory State $$$$$$$$$$$$$$$$$$$$")
 
     def print_state(self):
-        logging.debug("$$$$$$$$$$$$$$$$$ Cpu State $$$$$$$$$$$$$$$$$$$$")
-        logging.debug("PC=%s, SP=%s",hex(self.pc), hex(self.sp))
-        pc_memory = self.__memory[self.pc]
-        sp_memory = self.__memory[self.sp]
-        if pc_memory is not None:
-            pc_memory = hex(pc_memory)
-        if sp_memory is not None:
-            sp_memory = hex(sp_memory)
+        log.debug("$$$$$$$$$$$$$$$$$ Cpu State $$$$$$$$$$$$$$$$$$$$")
+        log.debug("PC=%s, SP=%s",hex(self.pc), hex(self.sp))
+        pc_memory = hex(self.__memory[self.pc])
+        sp_memory = hex(self.__memory[self.sp])
         r = ["R%s=%s" % (index, hex(x)) for index, x in enumerate(self.r) if x is not None]
-        logging.debug("[PC]=%s, [SP]=%s", pc_memory, sp_memory)
-        logging.debug("General regiters: %s", r)
-        logging.debug("$$$$$$$$$$$$$$$$$ Cpu State $$$$$$$$$$$$$$$$$$$$")
+        log.debug("[PC]=%s, [SP]=%s", pc_memory, sp_memory)
+        log.debug("General regiters: %s", r)
+        log.debug("$$$$$$$$$$$$$$$$$ Cpu State $$$$$$$$$$$$$$$$$$$$")
+
+    def print_trace(self, last=None):
+        if self.trace is not None:
+            log.debug("$$$$$$$$$$$$$$$$$ Trace $$$$$$$$$$$$$$$$$$$$")
+            log.debug(self.trace.dump(self, last))
+            log.debug("$$$$$$$$$$$$$$$$$ Trace $$$$$$$$$$$$$$$$$$$$")
 
     def create_16bit_two_complement(self, value):
         return self.__create_16bit_two_complement(value)
@@ -95,19 +999,23 @@ class Cpu:
         return value
 
     def create_params(self, address):
+        memory = self.__memory
+        return self.create_params_from_bytes(memory[address], memory[address + 1], memory[address + 2], memory[address + 3])
+
+    def create_params_from_bytes(self, op_code, yx, ll, hh):
         params = {}
-        params['op_code'] = self.read_8bit(address)
-        params['y'] = self.read_8bit(address + 1) >> 4
-        params['x'] = self.read_8bit(address + 1) & 0b00001111
-        params['n'] = self.read_8bit(address + 2) & 0b00001111
+        params['op_code'] = op_code
+        params['y'] = yx >> 4
+        params['x'] = yx & 0b00001111
+        params['n'] = ll & 0b00001111
         params['z'] = params['n']
-        params['ll'] = self.read_8bit(address + 2)
-        params['hh'] = self.read_8bit(address + 3)
+        params['ll'] = ll
+        params['hh'] = hh
         params['hflip'] = (params['hh'] >> 1)
         params['vflip'] = (params['hh'] & 1)
         params['hhll'] = (params['hh'] << 8) | params['ll']
         params['vtsr'] = params['hhll']
-        params['ad'] = self.read_8bit(address + 1)
+        params['ad'] = yx
         return params
 
     def __replace_constants(self, mnemonic, params):
@@ -122,11 +1030,12 @@ class Cpu:
         mnemonic = mnemonic.replace(" AD", " %s" % hex(params['ad']))
         return mnemonic.lower()
 
-    def __instruction_table(self):
+    def __instruction_table(lazy_flags):
+        # handlers take the cpu they run on, see decode
         instruction_table = {}
 
         ### 0x - Misc/Video/Audio ###
-        def nop(params):
+        def nop(cpu, params):
             return 4
 
         instruction_table[0x00] = {
@@ -134,9 +1043,9 @@ class Cpu:
             'execute': nop
         }
 
-        def cls(params):
-            self.gpu.clear_fg()
-            self.gpu.clear_bg()
+        def cls(cpu, params):
+            cpu.gpu.clear_fg()
+            cpu.gpu.clear_bg()
             return 4
 
         instruction_table[0x01] = {
@@ -144,8 +1053,8 @@ class Cpu:
             'execute': cls
         }
 
-        def vblank(params):
-            if self.gpu.vblank():
+        def vblank(cpu, params):
+            if cpu.gpu.vblank():
                 return 4
             return 0
 
@@ -154,8 +1063,8 @@ class Cpu:
             'execute': vblank
         }
 
-        def bgc(params):
-            self.gpu.bg = params['n']
+        def bgc(cpu, params):
+            cpu.gpu.bg = params['n']
             return 4
 
         instruction_table[0x03] = {
@@ -163,9 +1072,9 @@ class Cpu:
             'execute': bgc
         }
 
-        def spr(params):
-            self.gpu.spritew = params['ll']
-            self.gpu.spriteh = params['hh']
+        def spr(cpu, params):
+            cpu.gpu.spritew = params['ll']
+            cpu.gpu.spriteh = params['hh']
             return 4
 
         instruction_table[0x04] = {
@@ -173,9 +1082,9 @@ class Cpu:
             'execute': spr
         }
 
-        def drw_hhll(params):
-            carried = self.gpu.drw_hhll(params['hhll'], self.r[params['x']], self.r[params['y']])
-            self.flag_carry = carried
+        def drw_hhll(cpu, params):
+            carried = cpu.gpu.drw_hhll(params['hhll'], cpu.r[params['x']], cpu.r[params['y']])
+            cpu.flag_carry = carried
             return 4
 
         instruction_table[0x05] = {
@@ -183,9 +1092,9 @@ class Cpu:
             'execute': drw_hhll
         }
 
-        def drw_rz(params):
-            carried = self.gpu.drw_rz(self.read_16bit(self.r[params['z']]), self.r[params['x']], self.r[params['y']])
-            self.flag_carry = carried
+        def drw_rz(cpu, params):
+            carried = cpu.gpu.drw_rz(cpu.read_16bit(cpu.r[params['z']]), cpu.r[params['x']], cpu.r[params['y']])
+            cpu.flag_carry = carried
             return 4
 
         instruction_table[0x06] = {
@@ -193,8 +1102,8 @@ class Cpu:
             'execute': drw_rz
         }
 
-        def rnd(params):
-            self.r[params['x']] = random.randint(0, params['hhll'])
+        def rnd(cpu, params):
+            cpu.r[params['x']] = cpu.random(params['hhll'])
             return 4
 
         instruction_table[0x07] = {
@@ -202,8 +1111,8 @@ class Cpu:
             'execute': rnd
         }
 
-        def flip(params):
-            self.gpu.flip(params['hflip'] == 1, params['vflip'] == 1)
+        def flip(cpu, params):
+            cpu.gpu.flip(params['hflip'] == 1, params['vflip'] == 1)
             return 4
 
         instruction_table[0x08] = {
@@ -211,8 +1120,8 @@ class Cpu:
             'execute': flip
         }
 
-        def snd0(params):
-            self.spu.stop()
+        def snd0(cpu, params):
+            cpu.spu.stop()
             return 4
 
         instruction_table[0x09] = {
@@ -220,8 +1129,8 @@ class Cpu:
             'execute': snd0
         }
 
-        def snd1(params):
-            self.spu.play500hz(params['hhll'])
+        def snd1(cpu, params):
+            cpu.spu.play500hz(params['hhll'])
             return 4
 
         instruction_table[0x0A] = {
@@ -229,8 +1138,8 @@ class Cpu:
             'execute': snd1
         }
 
-        def snd2(params):
-            self.spu.play1000hz(params['hhll'])
+        def snd2(cpu, params):
+            cpu.spu.play1000hz(params['hhll'])
             return 4
 
         instruction_table[0x0B] = {
@@ -238,8 +1147,8 @@ class Cpu:
             'execute': snd2
         }
 
-        def snd3(params):
-            self.spu.play1500hz(params['hhll'])
+        def snd3(cpu, params):
+            cpu.spu.play1500hz(params['hhll'])
             return 4
 
         instruction_table[0x0C] = {
@@ -247,8 +1156,8 @@ class Cpu:
             'execute': snd3
         }
 
-        def snp(params):
-            self.spu.play_tone(self.read_16bit(self.r[params['x']]), params['hhll'])
+        def snp(cpu, params):
+            cpu.spu.play_tone(cpu.read_16bit(cpu.r[params['x']]), params['hhll'])
             return 4
 
         instruction_table[0x0D] = {
@@ -256,8 +1165,8 @@ class Cpu:
             'execute': snp
         }
 
-        def sng(params):
-            self.spu.setup(params['ad'], params['vtsr'])
+        def sng(cpu, params):
+            cpu.spu.setup(params['ad'], params['vtsr'])
             return 4
 
         instruction_table[0x0E] = {
@@ -266,17 +1175,17 @@ class Cpu:
         }
         ########################
         ### 1x - Jumps (Branches) ###
-        def jmp(params):
-            return params['hhll'] - self.pc
+        def jmp(cpu, params):
+            return params['hhll'] - cpu.pc
 
         instruction_table[0x10] = {
             'Mnemonic': 'JMP HHLL',
             'execute': jmp
         }
 
-        def jmpx(params):
+        def jmpx(cpu, params):
             if params['x'] != 0:
-                return params['hhll'] - self.pc
+                return params['hhll'] - cpu.pc
             else:
                 return 4
 
@@ -285,9 +1194,9 @@ class Cpu:
             'execute': jmpx
         }
 
-        def jme(params):
-            if self.r[params['x']] == self.r[params['y']]:
-                return params['hhll'] - self.pc
+        def jme(cpu, params):
+            if cpu.r[params['x']] == cpu.r[params['y']]:
+                return params['hhll'] - cpu.pc
             else:
                 return 4
 
@@ -296,36 +1205,37 @@ class Cpu:
             'execute': jme
         }
 
-        def call(params):
-            self.write_16bit(self.sp, self.pc + 4)
-            self.sp += 2
-            return params['hhll'] - self.pc
+        def call(cpu, params):
+            cpu.write_16bit(cpu.sp, cpu.pc + 4)
+            cpu.sp += 2
+            return params['hhll'] - cpu.pc
 
         instruction_table[0x14] = {
             'Mnemonic': 'CALL HHLL',
             'execute': call
         }
 
-        def ret(params):
-            self.sp -= 2
-            return self.read_16bit(self.sp) - self.pc
+        def ret(cpu, params):
+            offset = cpu.read_16bit(cpu.sp - 2) - cpu.pc
+            cpu.sp -= 2
+            return offset
 
         instruction_table[0x15] = {
             'Mnemonic': 'RET',
             'execute': ret
         }
 
-        def jmp_rx(params):
-            return self.r[params['x']] - self.pc
+        def jmp_rx(cpu, params):
+            return cpu.r[params['x']] - cpu.pc
 
         instruction_table[0x16] = {
             'Mnemonic': 'JMP RX',
             'execute': jmp_rx
         }
 
-        def call_x(params):
+        def call_x(cpu, params):
             if params['x'] != 0:
-                return call(params)
+                return call(cpu, params)
             else:
                 return 4
 
@@ -334,10 +1244,10 @@ class Cpu:
             'execute': call_x
         }
 
-        def call_rx(params):
-            self.write_16bit(self.sp, self.pc + 4)
-            self.sp += 2
-            return self.r[params['x']] - self.pc
+        def call_rx(cpu, params):
+            cpu.write_16bit(cpu.sp, cpu.pc + 4)
+            cpu.sp += 2
+            return cpu.r[params['x']] - cpu.pc
 
         instruction_table[0x18] = {
             'Mnemonic': 'CALL RX',
@@ -345,8 +1255,8 @@ class Cpu:
         }
         ########################
         ### 2x Load operations ###
-        def ldi_rx(params):
-            self.r[params['x']] = params['hhll']
+        def ldi_rx(cpu, params):
+            cpu.r[params['x']] = params['hhll']
             return 4
 
         instruction_table[0x20] = {
@@ -354,8 +1264,8 @@ class Cpu:
             'execute': ldi_rx
         }
 
-        def ldi_sp(params):
-            self.sp = params['hhll']
+        def ldi_sp(cpu, params):
+            cpu.sp = params['hhll']
             return 4
 
         instruction_table[0x21] = {
@@ -363,8 +1273,8 @@ class Cpu:
             'execute': ldi_sp
         }
 
-        def ldm_rx(params):
-            self.r[params['x']] = self.read_16bit(params['hhll'])
+        def ldm_rx(cpu, params):
+            cpu.r[params['x']] = cpu.read_16bit(params['hhll'])
             return 4
 
         instruction_table[0x22] = {
@@ -372,8 +1282,8 @@ class Cpu:
             'execute': ldm_rx
         }
 
-        def ldm_rx_ry(params):
-            self.r[params['x']] = self.read_16bit(self.r[params['y']])
+        def ldm_rx_ry(cpu, params):
+            cpu.r[params['x']] = cpu.read_16bit(cpu.r[params['y']])
             return 4
 
         instruction_table[0x23] = {
@@ -381,8 +1291,8 @@ class Cpu:
             'execute': ldm_rx_ry
         }
 
-        def mov_rx_ry(params):
-            self.r[params['x']] = self.read_16bit(self.r[params['y']])
+        def mov_rx_ry(cpu, params):
+            cpu.r[params['x']] = cpu.read_16bit(cpu.r[params['y']])
             return 4
 
         instruction_table[0x24] = {
@@ -392,8 +1302,8 @@ class Cpu:
         ########################
 
         ### 3x Store operations ###
-        def stm_rx(params):
-            self.write_16bit(params['hhll'], self.r[params['x']])
+        def stm_rx(cpu, params):
+            cpu.write_16bit(params['hhll'], cpu.r[params['x']])
             return 4
 
         instruction_table[0x30] = {
@@ -401,8 +1311,8 @@ class Cpu:
             'execute': stm_rx
         }
 
-        def stm_rx_ry(params):
-            self.write_16bit(self.r[params['y']], self.r[params['x']])
+        def stm_rx_ry(cpu, params):
+            cpu.write_16bit(cpu.r[params['y']], cpu.r[params['x']])
             return 4
 
         instruction_table[0x31] = {
@@ -411,43 +1321,74 @@ class Cpu:
         }
         ########################
 
-        def check_carry_add(result):
-            if result > 0b1111111111111111:
-                self.flag_carry = 1
-            else:
-                self.flag_carry = 0
-
-        def check_zero(result):
-            if result == 0:
-                self.flag_zero = 1
-            else:
-                self.flag_zero = 0
-
-        def check_overflow_add(result, operand1, operand2):
-            result_is_positive = self.__create_16bit_two_complement(result) >= 0
-            operands_are_negative = self.__create_16bit_two_complement(operand1) < 0 and self.__create_16bit_two_complement(operand2) < 0
-            result_is_negative = not result_is_positive
-            operands_are_positive =  not operands_are_negative
-
-            if (result_is_positive and operands_are_negative) or (result_is_negative and operands_are_positive):
-                self.flag_overflow = 1
-            else:
-                self.flag_overflow = 0
-
-        def check_negative(result):
-            if self.__create_16bit_two_complement(result) < 0:
-                self.flag_negative = 1
-            else:
-                self.flag_negative = 0
+        ### flags ###
+        def negative(value):
+            return 1 if (value - 0x10000 if value & 0x8000 else value) < 0 else 0
+
+        def flags_add(cpu, result, operand1, operand2):
+            result_is_negative = negative(result)
+            operands_are_negative = negative(operand1) and negative(operand2)
+            cpu._flag_carry = 1 if result > 0xFFFF else 0
+            cpu._flag_zero = 1 if result == 0 else 0
+            cpu._flag_overflow = 1 if result_is_negative != operands_are_negative else 0
+            cpu._flag_negative = result_is_negative
+
+        def flags_sub(cpu, result, operand1, operand2):
+            result_is_negative = negative(result)
+            cpu._flag_carry = result_is_negative
+            cpu._flag_zero = 1 if result == 0 else 0
+            cpu._flag_overflow = 1 if negative(operand2) and result_is_negative != negative(operand1) else 0
+            cpu._flag_negative = result_is_negative
+
+        def flags_mul(cpu, result):
+            cpu._flag_carry = 1 if result > 0xFFFF else 0
+            cpu._flag_zero = 1 if result == 0 else 0
+            cpu._flag_negative = negative(result)
+
+        def flags_div(cpu, result, operand1, operand2):
+            cpu._flag_carry = 1 if operand1 % operand2 != 0 else 0
+            cpu._flag_zero = 1 if result == 0 else 0
+            cpu._flag_negative = negative(result)
+
+        def flags_logic(cpu, result):
+            cpu._flag_zero = 1 if result == 0 else 0
+            cpu._flag_negative = negative(result)
+
+        if lazy_flags:
+            # only the last operation is kept plus, for the partial ones, the operation
+            # still owning the flags they leave untouched
+            def owner(pending, updates):
+                while pending is not None and pending[0] not in updates:
+                    pending = pending[2]
+                return pending
+
+            def update_flags_add(cpu, result, operand1, operand2):
+                cpu._pending_flags = (flags_add, (result, operand1, operand2), None)
+
+            def update_flags_sub(cpu, result, operand1, operand2):
+                cpu._pending_flags = (flags_sub, (result, operand1, operand2), None)
+
+            def update_flags_mul(cpu, result):
+                cpu._pending_flags = (flags_mul, (result,), owner(cpu._pending_flags, (flags_add, flags_sub)))
+
+            def update_flags_div(cpu, result, operand1, operand2):
+                cpu._pending_flags = (flags_div, (result, operand1, operand2), owner(cpu._pending_flags, (flags_add, flags_sub)))
+
+            def update_flags_logic(cpu, result):
+                cpu._pending_flags = (flags_logic, (result,), owner(cpu._pending_flags, (flags_add, flags_sub, flags_mul, flags_div)))
+        else:
+            update_flags_add = flags_add
+            update_flags_sub = flags_sub
+            update_flags_mul = flags_mul
+            update_flags_div = flags_div
+            update_flags_logic = flags_logic
+        ########################
 
         ### 4x - Addition ###
-        def addi_rx(params):
-            sum = self.r[params['x']] + params['hhll']
-            check_carry_add(sum)
-            check_zero(sum)
-            check_overflow_add(sum, self.r[params['x']], params['hhll'])
-            check_negative(sum)
-            self.r[params['x']] = sum & 0xFFFF
+        def addi_rx(cpu, params):
+            sum = cpu.r[params['x']] + params['hhll']
+            update_flags_add(cpu, sum, cpu.r[params['x']], params['hhll'])
+            cpu.r[params['x']] = sum & 0xFFFF
             return 4
 
         instruction_table[0x40] = {
@@ -455,13 +1396,10 @@ class Cpu:
             'execute': addi_rx
         }
 
-        def add_rx(params):
-            sum = self.r[params['x']] + self.r[params['y']]
-            check_carry_add(sum)
-            check_zero(sum)
-            check_overflow_add(sum, self.r[params['x']], params['y'])
-            check_negative(sum)
-            self.r[params['x']] = sum & 0xFFFF
+        def add_rx(cpu, params):
+            sum = cpu.r[params['x']] + cpu.r[params['y']]
+            update_flags_add(cpu, sum, cpu.r[params['x']], params['y'])
+            cpu.r[params['x']] = sum & 0xFFFF
             return 4
 
         instruction_table[0x41] = {
@@ -469,13 +1407,10 @@ class Cpu:
             'execute': add_rx
         }
 
-        def add_rz(params):
-            sum = self.r[params['x']] + self.r[params['y']]
-            check_carry_add(sum)
-            check_zero(sum)
-            check_overflow_add(sum, self.r[params['x']], params['y'])
-            check_negative(sum)
-            self.r[params['z']] = sum & 0xFFFF
+        def add_rz(cpu, params):
+            sum = cpu.r[params['x']] + cpu.r[params['y']]
+            update_flags_add(cpu, sum, cpu.r[params['x']], params['y'])
+            cpu.r[params['z']] = sum & 0xFFFF
             return 4
 
         instruction_table[0x42] = {
@@ -484,33 +1419,11 @@ class Cpu:
         }
         ########################
         ### 5x - Subtraction ###
-        def check_carry_sub(result):
-            if self.__create_16bit_two_complement(result) < 0x0:
-                self.flag_carry = 1
-            else:
-                self.flag_carry = 0
-
-        def check_overflow_sub(result, operand1, operand2):
-            result_is_positive = self.__create_16bit_two_complement(result) >= 0
-            operand1_is_posivite = self.__create_16bit_two_complement(operand1) >= 0
-            operand2_is_posivite = self.__create_16bit_two_complement(operand2) >= 0
-            result_is_negative = not result_is_positive
-            operand1_is_negative = not operand1_is_posivite
-            operand2_is_negative = not operand2_is_posivite
-
-            if (result_is_positive and operand1_is_negative and operand2_is_negative) or (result_is_negative and operand1_is_posivite and operand2_is_negative):
-                self.flag_overflow = 1
-            else:
-                self.flag_overflow = 0
-
-        def subi_rx(params):
+        def subi_rx(cpu, params):
             #Set RX to RX-HHLL.
-            result = self.r[params['x']] - params['hhll']
-            check_carry_sub(result)
-            check_zero(result)
-            check_overflow_sub(result, self.r[params['x']], params['hhll'])
-            check_negative(result)
-            self.r[params['x']] = result & 0xFFFF
+            result = cpu.r[params['x']] - params['hhll']
+            update_flags_sub(cpu, result, cpu.r[params['x']], params['hhll'])
+            cpu.r[params['x']] = result & 0xFFFF
             return 4
 
         instruction_table[0x50] = {
@@ -518,14 +1431,11 @@ class Cpu:
             'execute': subi_rx
         }
 
-        def sub_rx(params):
+        def sub_rx(cpu, params):
             #Set RX to RX-RY.
-            result = self.r[params['x']] - self.r[params['y']]
-            check_carry_sub(result)
-            check_zero(result)
-            check_overflow_sub(result, self.r[params['x']], self.r[params['y']])
-            check_negative(result)
-            self.r[params['x']] = result & 0xFFFF
+            result = cpu.r[params['x']] - cpu.r[params['y']]
+            update_flags_sub(cpu, result, cpu.r[params['x']], cpu.r[params['y']])
+            cpu.r[params['x']] = result & 0xFFFF
             return 4
 
         instruction_table[0x51] = {
@@ -533,14 +1443,11 @@ class Cpu:
             'execute': sub_rx
         }
 
-        def sub_rz(params):
+        def sub_rz(cpu, params):
             #Set RZ to RX-RY.
-            result = self.r[params['x']] - self.r[params['y']]
-            check_carry_sub(result)
-            check_zero(result)
-            check_overflow_sub(result, self.r[params['x']], self.r[params['y']])
-            check_negative(result)
-            self.r[params['z']] = result & 0xFFFF
+            result = cpu.r[params['x']] - cpu.r[params['y']]
+            update_flags_sub(cpu, result, cpu.r[params['x']], cpu.r[params['y']])
+            cpu.r[params['z']] = result & 0xFFFF
             return 4
 
         instruction_table[0x52] = {
@@ -548,13 +1455,10 @@ class Cpu:
             'execute': sub_rz
         }
 
-        def sub_cmpi_rx(params):
+        def sub_cmpi_rx(cpu, params):
             #Compute RX-HHLL, discard result.
-            result = self.r[params['x']] - params['hhll']
-            check_carry_sub(result)
-            check_zero(result)
-            check_overflow_sub(result, self.r[params['x']], params['hhll'])
-            check_negative(result)
+            result = cpu.r[params['x']] - params['hhll']
+            update_flags_sub(cpu, result, cpu.r[params['x']], params['hhll'])
             return 4
 
         instruction_table[0x53] = {
@@ -562,13 +1466,10 @@ class Cpu:
             'execute': sub_cmpi_rx
         }
 
-        def sub_cmpi_ry(params):
+        def sub_cmpi_ry(cpu, params):
             #Compute RX-RY, discard result.
-            result = self.r[params['x']] - self.r[params['y']]
-            check_carry_sub(result)
-            check_zero(result)
-            check_overflow_sub(result, self.r[params['x']], self.r[params['y']])
-            check_negative(result)
+            result = cpu.r[params['x']] - cpu.r[params['y']]
+            update_flags_sub(cpu, result, cpu.r[params['x']], cpu.r[params['y']])
             return 4
 
         instruction_table[0x54] = {
@@ -577,12 +1478,11 @@ class Cpu:
         }
         ########################
         ### 6x - Bitwise AND ###
-        def andi(params):
+        def andi(cpu, params):
             #Set RX to RX&HHLL.
-            result = self.r[params['x']] & params['hhll']
-            check_zero(result)
-            check_negative(result)
-            self.r[params['x']] = result & 0xFFFF
+            result = cpu.r[params['x']] & params['hhll']
+            update_flags_logic(cpu, result)
+            cpu.r[params['x']] = result & 0xFFFF
             return 4
 
         instruction_table[0x60] = {
@@ -590,12 +1490,11 @@ class Cpu:
             'execute': andi
         }
 
-        def and_rx(params):
+        def and_rx(cpu, params):
             #Set RX to RX&RY.
-            result = self.r[params['x']] & self.r[params['y']]
-            check_zero(result)
-            check_negative(result)
-            self.r[params['x']] = result & 0xFFFF
+            result = cpu.r[params['x']] & cpu.r[params['y']]
+            update_flags_logic(cpu, result)
+            cpu.r[params['x']] = result & 0xFFFF
             return 4
 
         instruction_table[0x61] = {
@@ -603,12 +1502,11 @@ class Cpu:
             'execute': and_rx
         }
 
-        def and_rz(params):
+        def and_rz(cpu, params):
             #Set RZ to RX&RY.
-            result = self.r[params['x']] & self.r[params['y']]
-            check_zero(result)
-            check_negative(result)
-            self.r[params['z']] = result & 0xFFFF
+            result = cpu.r[params['x']] & cpu.r[params['y']]
+            update_flags_logic(cpu, result)
+            cpu.r[params['z']] = result & 0xFFFF
             return 4
 
         instruction_table[0x62] = {
@@ -616,11 +1514,10 @@ class Cpu:
             'execute': and_rz
         }
 
-        def tsti_rx(params):
+        def tsti_rx(cpu, params):
             #Compute RX&HHLL, discard result.
-            result = self.r[params['x']] & params['hhll']
-            check_zero(result)
-            check_negative(result)
+            result = cpu.r[params['x']] & params['hhll']
+            update_flags_logic(cpu, result)
             return 4
 
         instruction_table[0x63] = {
@@ -628,11 +1525,10 @@ class Cpu:
             'execute': tsti_rx
         }
 
-        def tsti_ry(params):
+        def tsti_ry(cpu, params):
             #Compute RX&RY, discard result.
-            result = self.r[params['x']] & self.r[params['y']]
-            check_zero(result)
-            check_negative(result)
+            result = cpu.r[params['x']] & cpu.r[params['y']]
+            update_flags_logic(cpu, result)
             return 4
 
         instruction_table[0x64] = {
@@ -643,12 +1539,11 @@ class Cpu:
 
         ########################
         ### 7x - Bitwise OR ###
-        def ori_rx(params):
+        def ori_rx(cpu, params):
             #Set RX to RX|HHLL.
-            result = self.r[params['x']] | params['hhll']
-            check_zero(result)
-            check_negative(result)
-            self.r[params['x']] = result & 0xFFFF
+            result = cpu.r[params['x']] | params['hhll']
+            update_flags_logic(cpu, result)
+            cpu.r[params['x']] = result & 0xFFFF
             return 4
 
         instruction_table[0x70] = {
@@ -656,12 +1551,11 @@ class Cpu:
             'execute': ori_rx
         }
 
-        def or_ry(params):
+        def or_ry(cpu, params):
             #Set RX to RX|RY.
-            result = self.r[params['x']] | self.r[params['y']]
-            check_zero(result)
-            check_negative(result)
-            self.r[params['x']] = result & 0xFFFF
+            result = cpu.r[params['x']] | cpu.r[params['y']]
+            update_flags_logic(cpu, result)
+            cpu.r[params['x']] = result & 0xFFFF
             return 4
 
         instruction_table[0x71] = {
@@ -669,12 +1563,11 @@ class Cpu:
             'execute': or_ry
         }
 
-        def or_rz(params):
+        def or_rz(cpu, params):
             #Set RZ to RX|RY.
-            result = self.r[params['x']] | self.r[params['y']]
-            check_zero(result)
-            check_negative(result)
-            self.r[params['z']] = result & 0xFFFF
+            result = cpu.r[params['x']] | cpu.r[params['y']]
+            update_flags_logic(cpu, result)
+            cpu.r[params['z']] = result & 0xFFFF
             return 4
 
         instruction_table[0x72] = {
@@ -685,12 +1578,11 @@ class Cpu:
 
         ########################
         ### 8x - Bitwise XOR ###
-        def xori_rx(params):
+        def xori_rx(cpu, params):
             #Set RX to RX^HHLL.
-            result = self.r[params['x']] ^ params['hhll']
-            check_zero(result)
-            check_negative(result)
-            self.r[params['x']] = result & 0xFFFF
+            result = cpu.r[params['x']] ^ params['hhll']
+            update_flags_logic(cpu, result)
+            cpu.r[params['x']] = result & 0xFFFF
             return 4
 
         instruction_table[0x80] = {
@@ -698,12 +1590,11 @@ class Cpu:
             'execute': xori_rx
         }
 
-        def xor_ry(params):
+        def xor_ry(cpu, params):
             #Set RX to RX^RY.
-            result = self.r[params['x']] ^ self.r[params['y']]
-            check_zero(result)
-            check_negative(result)
-            self.r[params['x']] = result & 0xFFFF
+            result = cpu.r[params['x']] ^ cpu.r[params['y']]
+            update_flags_logic(cpu, result)
+            cpu.r[params['x']] = result & 0xFFFF
             return 4
 
         instruction_table[0x81] = {
@@ -711,12 +1602,11 @@ class Cpu:
             'execute': xor_ry
         }
 
-        def xor_rz(params):
+        def xor_rz(cpu, params):
             #Set RZ to RX^RY.
-            result = self.r[params['x']] ^ self.r[params['y']]
-            check_zero(result)
-            check_negative(result)
-            self.r[params['z']] = result & 0xFFFF
+            result = cpu.r[params['x']] ^ cpu.r[params['y']]
+            update_flags_logic(cpu, result)
+            cpu.r[params['z']] = result & 0xFFFF
             return 4
 
         instruction_table[0x82] = {
@@ -727,19 +1617,11 @@ class Cpu:
 
         ########################
         ### 9x - Multiplication ###
-        def check_carry_mul(result):
-            if result > 0xFFFF:
-                self.flag_carry = 1
-            else:
-                self.flag_carry = 0
-
-        def muli(params):
+        def muli(cpu, params):
             #Set RX to RX*HHLL
-            result = self.r[params['x']] * params['hhll']
-            check_carry_mul(result)
-            check_zero(result)
-            check_negative(result)
-            self.r[params['x']] = result & 0xFFFF
+            result = cpu.r[params['x']] * params['hhll']
+            update_flags_mul(cpu, result)
+            cpu.r[params['x']] = result & 0xFFFF
             return 4
 
         instruction_table[0x90] = {
@@ -747,13 +1629,11 @@ class Cpu:
             'execute': muli
         }
 
-        def mul_rx(params):
+        def mul_rx(cpu, params):
             #Set RX to RX*RY
-            result = self.r[params['x']] * self.r[params['y']]
-            check_carry_mul(result)
-            check_zero(result)
-            check_negative(result)
-            self.r[params['x']] = result & 0xFFFF
+            result = cpu.r[params['x']] * cpu.r[params['y']]
+            update_flags_mul(cpu, result)
+            cpu.r[params['x']] = result & 0xFFFF
             return 4
 
         instruction_table[0x91] = {
@@ -761,13 +1641,11 @@ class Cpu:
             'execute': mul_rx
         }
 
-        def mul_rz(params):
+        def mul_rz(cpu, params):
             #Set RZ to RX*RY
-            result = self.r[params['x']] * self.r[params['y']]
-            check_carry_mul(result)
-            check_zero(result)
-            check_negative(result)
-            self.r[params['z']] = result & 0xFFFF
+            result = cpu.r[params['x']] * cpu.r[params['y']]
+            update_flags_mul(cpu, result)
+            cpu.r[params['z']] = result & 0xFFFF
             return 4
 
         instruction_table[0x92] = {
@@ -778,20 +1656,11 @@ class Cpu:
 
         ########################
         ### Ax - Division ###
-        def check_carry_div(operand1, operand2):
-            reminder = operand1 % operand2
-            if reminder != 0x0:
-                self.flag_carry = 1
-            else:
-                self.flag_carry = 0
-
-        def divi_rx(params):
+        def divi_rx(cpu, params):
             #Set RX to RX\HHLL
-            result = self.r[params['x']] / params['hhll']
-            check_carry_div(self.r[params['x']], params['hhll'])
-            check_zero(result)
-            check_negative(result)
-            self.r[params['x']] = result & 0xFFFF
+            result = cpu.r[params['x']] / params['hhll']
+            update_flags_div(cpu, result, cpu.r[params['x']], params['hhll'])
+            cpu.r[params['x']] = result & 0xFFFF
             return 4
 
         instruction_table[0xA0] = {
@@ -799,13 +1668,11 @@ class Cpu:
             'execute': divi_rx
         }
 
-        def div_rx_ry(params):
+        def div_rx_ry(cpu, params):
             #Set RX to RX\RY
-            result = self.r[params['x']] / self.r[params['y']]
-            check_carry_div(self.r[params['x']], self.r[params['y']])
-            check_zero(result)
-            check_negative(result)
-            self.r[params['x']] = result & 0xFFFF
+            result = cpu.r[params['x']] / cpu.r[params['y']]
+            update_flags_div(cpu, result, cpu.r[params['x']], cpu.r[params['y']])
+            cpu.r[params['x']] = result & 0xFFFF
             return 4
 
         instruction_table[0xA1] = {
@@ -813,13 +1680,11 @@ class Cpu:
             'execute': div_rx_ry
         }
 
-        def div_rx_rz(params):
+        def div_rx_rz(cpu, params):
             #Set RZ to RX\RY
-            result = self.r[params['x']] / self.r[params['y']]
-            check_carry_div(self.r[params['x']], self.r[params['y']])
-            check_zero(result)
-            check_negative(result)
-            self.r[params['z']] = result & 0xFFFF
+            result = cpu.r[params['x']] / cpu.r[params['y']]
+            update_flags_div(cpu, result, cpu.r[params['x']], cpu.r[params['y']])
+            cpu.r[params['z']] = result & 0xFFFF
             return 4
 
         instruction_table[0xA2] = {
@@ -827,12 +1692,11 @@ class Cpu:
             'execute': div_rx_rz
         }
 
-        def mod_rx(params):
+        def mod_rx(cpu, params):
             #Set RX to RX MOD HHLL
-            result = self.r[params['x']] % params['hhll']
-            check_zero(result)
-            check_negative(result)
-            self.r[params['x']] = result & 0xFFFF
+            result = cpu.r[params['x']] % params['hhll']
+            update_flags_logic(cpu, result)
+            cpu.r[params['x']] = result & 0xFFFF
             return 4
 
         instruction_table[0xA3] = {
@@ -840,12 +1704,11 @@ class Cpu:
             'execute': mod_rx
         }
 
-        def mod_rx_ry(params):
+        def mod_rx_ry(cpu, params):
             #Set RX to RX MOD RY
-            result = self.r[params['x']] % self.r[params['y']]
-            check_zero(result)
-            check_negative(result)
-            self.r[params['x']] = result & 0xFFFF
+            result = cpu.r[params['x']] % cpu.r[params['y']]
+            update_flags_logic(cpu, result)
+            cpu.r[params['x']] = result & 0xFFFF
             return 4
 
         instruction_table[0xA4] = {
@@ -853,12 +1716,11 @@ class Cpu:
             'execute': mod_rx_ry
         }
 
-        def mod_rx_rz(params):
+        def mod_rx_rz(cpu, params):
             #Set RZ to RX MOD RY
-            result = self.r[params['x']] % self.r[params['y']]
-            check_zero(result)
-            check_negative(result)
-            self.r[params['z']] = result & 0xFFFF
+            result = cpu.r[params['x']] % cpu.r[params['y']]
+            update_flags_logic(cpu, result)
+            cpu.r[params['z']] = result & 0xFFFF
             return 4
 
         instruction_table[0xA5] = {
@@ -884,12 +1746,11 @@ class Cpu:
 
         ########################
         ### Bx - Logical/Arithmetic Shifts ###
-        def shl_rx(params):
+        def shl_rx(cpu, params):
             #Set RX to RX << N
-            result = self.r[params['x']] << params['n']
-            check_zero(result)
-            check_negative(result)
-            self.r[params['x']] = result & 0xFFFF
+            result = cpu.r[params['x']] << params['n']
+            update_flags_logic(cpu, result)
+            cpu.r[params['x']] = result & 0xFFFF
             return 4
 
         instruction_table[0xB0] = {
@@ -897,12 +1758,11 @@ class Cpu:
             'execute': shl_rx
         }
 
-        def shr_rx(params):
+        def shr_rx(cpu, params):
             #Set RX to RX >> N
-            result = self.r[params['x']] >> params['n']
-            check_zero(result)
-            check_negative(result)
-            self.r[params['x']] = result & 0xFFFF
+            result = cpu.r[params['x']] >> params['n']
+            update_flags_logic(cpu, result)
+            cpu.r[params['x']] = result & 0xFFFF
             return 4
 
         instruction_table[0xB1] = {
@@ -915,12 +1775,11 @@ class Cpu:
             'execute': shr_rx
         }
 
-        def shl_ry(params):
+        def shl_ry(cpu, params):
             #Set RY to RX << RY
-            result = self.r[params['x']] << self.r[params['y']]
-            check_zero(result)
-            check_negative(result)
-            self.r[params['y']] = result & 0xFFFF
+            result = cpu.r[params['x']] << cpu.r[params['y']]
+            update_flags_logic(cpu, result)
+            cpu.r[params['y']] = result & 0xFFFF
             return 4
 
         instruction_table[0xB3] = {
@@ -928,12 +1787,11 @@ class Cpu:
             'execute': shl_ry
         }
 
-        def shr_ry(params):
+        def shr_ry(cpu, params):
             #Set RY to RX >> RY
-            result = self.r[params['x']] >> self.r[params['y']]
-            check_zero(result)
-            check_negative(result)
-            self.r[params['y']] = result & 0xFFFF
+            result = cpu.r[params['x']] >> cpu.r[params['y']]
+            update_flags_logic(cpu, result)
+            cpu.r[params['y']] = result & 0xFFFF
             return 4
 
         instruction_table[0xB4] = {
@@ -949,10 +1807,10 @@ class Cpu:
 
         ########################
         ### Cx - Push/Pop ###
-        def push_rx(params):
+        def push_rx(cpu, params):
             #Set [SP] to RX, increase SP by 2
-            self.write_16bit(self.sp, self.r[params['x']])
-            self.sp += 2
+            cpu.write_16bit(cpu.sp, cpu.r[params['x']])
+            cpu.sp += 2
             return 4
 
         instruction_table[0xC0] = {
@@ -960,10 +1818,10 @@ class Cpu:
             'execute': push_rx
         }
 
-        def pop_rx(params):
+        def pop_rx(cpu, params):
             #Decrease SP by 2, set RX to [SP]
-            self.sp -= 2
-            self.r[params['x']] = self.read_16bit(self.sp)
+            cpu.r[params['x']] = cpu.read_16bit(cpu.sp - 2)
+            cpu.sp -= 2
             return 4
 
         instruction_table[0xC1] = {
@@ -971,10 +1829,10 @@ class Cpu:
             'execute': pop_rx
         }
 
-        def push_all(params):
+        def push_all(cpu, params):
             #Store R0..RF at [SP], increase SP by 32
-            for x in range(0x0, 0xF + 1):
-                push_rx({'x': x})
+            cpu.write_block(cpu.sp, REGISTERS.pack(*[x & 0xFFFF for x in cpu.r]))
+            cpu.sp += 32
             return 4
 
         instruction_table[0xC2] = {
@@ -982,10 +1840,10 @@ class Cpu:
             'execute': push_all
         }
 
-        def pop_all(params):
+        def pop_all(cpu, params):
             #Decrease SP by 32, load R0..RF from [SP]
-            for x in reversed(range(0x0, 0xF + 1)):
-                pop_rx({'x': x})
+            cpu.r[:] = REGISTERS.unpack(bytes(cpu.read_block(cpu.sp - 32, 32)))
+            cpu.sp -= 32
             return 4
 
         instruction_table[0xC3] = {
@@ -993,15 +1851,15 @@ class Cpu:
             'execute': pop_all
         }
 
-        def push_flags(params):
+        def push_flags(cpu, params):
             #Set [SP] to FLAGS, increase SP by 2
             #[0,Carry,Zero,0,0,0,Overflow,Negative]
-            flags = self.read_16bit(self.sp)
-            self.flag_carry = (flags >> 1) & 1
-            self.flag_zero = (flags >> 2) & 1
-            self.flag_overflow = (flags >> 6) & 1
-            self.flag_negative = (flags >> 7) & 1
-            self.sp += 2
+            flags = cpu.read_16bit(cpu.sp)
+            cpu.flag_carry = (flags >> 1) & 1
+            cpu.flag_zero = (flags >> 2) & 1
+            cpu.flag_overflow = (flags >> 6) & 1
+            cpu.flag_negative = (flags >> 7) & 1
+            cpu.sp += 2
             return 4
 
         instruction_table[0xC4] = {
@@ -1009,15 +1867,15 @@ class Cpu:
             'execute': push_flags
         }
 
-        def pop_flags(params):
+        def pop_flags(cpu, params):
             #Decrease SP by 2, set FLAGS to [SP]
             #[0,Carry,Zero,0,0,0,Overflow,Negative]
-            self.sp -= 2
-            flags = (self.flag_carry << 1) & 0xFFFF
-            flags = (self.flag_zero << 2) | flags
-            flags = (self.flag_overflow << 6) | flags
-            flags = (self.flag_negative << 7) | flags
-            self.write_16bit(self.sp, flags)
+            flags = (cpu.flag_carry << 1) & 0xFFFF
+            flags = (cpu.flag_zero << 2) | flags
+            flags = (cpu.flag_overflow << 6) | flags
+            flags = (cpu.flag_negative << 7) | flags
+            cpu.write_16bit(cpu.sp - 2, flags)
+            cpu.sp -= 2
             return 4
 
         instruction_table[0xC5] = {
@@ -1028,16 +1886,11 @@ class Cpu:
 
         ########################
         ### Dx - Palette ###
-        def pal_hhll(params):
+        def pal_hhll(cpu, params):
             #Load palette from [HHLL]
-            hhll = params['hhll']
-            pal_index = 0
-            for x in range(0, 48, 3):
-                self.gpu.set_palette(pal_index,
-                                    self.read_8bit(x + 0 + hhll),
-                                    self.read_8bit(x + 1 + hhll),
-                                    self.read_8bit(x + 2 + hhll))
-                pal_index += 1
+            palette = cpu.read_block(params['hhll'], 48)
+            for pal_index in range(0, 16):
+                cpu.gpu.set_palette(pal_index, *palette[pal_index * 3:pal_index * 3 + 3])
             return 4
 
         instruction_table[0xD0] = {
@@ -1045,16 +1898,11 @@ class Cpu:
             'execute': pal_hhll
         }
 
-        def pal_rx(params):
+        def pal_rx(cpu, params):
             #Load palette from [RX]
-            x_register = self.r[params['x']]
-            pal_index = 0
-            for x in range(0, 48, 3):
-                self.gpu.set_palette(pal_index,
-                                    self.read_8bit(x + 0 + x_register),
-                                    self.read_8bit(x + 1 + x_register),
-                                    self.read_8bit(x + 2 + x_register))
-                pal_index += 1
+            palette = cpu.read_block(cpu.r[params['x']], 48)
+            for pal_index in range(0, 16):
+                cpu.gpu.set_palette(pal_index, *palette[pal_index * 3:pal_index * 3 + 3])
             return 4
 
         instruction_table[0xD1] = {
@@ -1065,12 +1913,11 @@ class Cpu:
 
         ########################
         ### Ex - Not/Neg ###
-        def noti_rx(params):
+        def noti_rx(cpu, params):
             #Set RX to NOT HHLL
             hhll = params['hhll']
-            self.r[params['x']] = ~hhll & 0xFFFF
-            check_negative(self.r[params['x']])
-            check_zero(self.r[params['x']])
+            cpu.r[params['x']] = ~hhll & 0xFFFF
+            update_flags_logic(cpu, cpu.r[params['x']])
             return 4
 
         instruction_table[0xE0] = {
@@ -1078,11 +1925,10 @@ class Cpu:
             'execute': noti_rx
         }
 
-        def not_rx(params):
+        def not_rx(cpu, params):
             #Set RX to NOT RX
-            self.r[params['x']] = ~self.r[params['x']] & 0xFFFF
-            check_negative(self.r[params['x']])
-            check_zero(self.r[params['x']])
+            cpu.r[params['x']] = ~cpu.r[params['x']] & 0xFFFF
+            update_flags_logic(cpu, cpu.r[params['x']])
             return 4
 
         instruction_table[0xE1] = {
@@ -1090,11 +1936,10 @@ class Cpu:
             'execute': not_rx
         }
 
-        def not_rx_ry(params):
+        def not_rx_ry(cpu, params):
             #Set RX to NOT RY
-            self.r[params['x']] = ~self.r[params['y']] & 0xFFFF
-            check_negative(self.r[params['x']])
-            check_zero(self.r[params['x']])
+            cpu.r[params['x']] = ~cpu.r[params['y']] & 0xFFFF
+            update_flags_logic(cpu, cpu.r[params['x']])
             return 4
 
         instruction_table[0xE2] = {
@@ -1102,11 +1947,10 @@ class Cpu:
             'execute': not_rx_ry
         }
 
-        def neg_rx_hhll(params):
+        def neg_rx_hhll(cpu, params):
             #Set RX to NEG HHLL
-            self.r[params['x']] =  - params['hhll']
-            check_negative(self.r[params['x']])
-            check_zero(self.r[params['x']])
+            cpu.r[params['x']] =  - params['hhll']
+            update_flags_logic(cpu, cpu.r[params['x']])
             return 4
 
         instruction_table[0xE3] = {
@@ -1114,11 +1958,10 @@ class Cpu:
             'execute': neg_rx_hhll
         }
 
-        def neg_rx(params):
+        def neg_rx(cpu, params):
             #Set RX to NEG RX
-            self.r[params['x']] =  - self.r[params['x']]
-            check_negative(self.r[params['x']])
-            check_zero(self.r[params['x']])
+            cpu.r[params['x']] =  - cpu.r[params['x']]
+            update_flags_logic(cpu, cpu.r[params['x']])
             return 4
 
         instruction_table[0xE4] = {
@@ -1126,11 +1969,10 @@ class Cpu:
             'execute': neg_rx
         }
 
-        def neg_rx_ry(params):
+        def neg_rx_ry(cpu, params):
             #Set RX to NEG RY
-            self.r[params['x']] =  - self.r[params['y']]
-            check_negative(self.r[params['x']])
-            check_zero(self.r[params['x']])
+            cpu.r[params['x']] =  - cpu.r[params['y']]
+            update_flags_logic(cpu, cpu.r[params['x']])
             return 4
 
         instruction_table[0xE5] = {
@@ -1139,3 +1981,7 @@ class Cpu:
         }
         ########################
         return instruction_table
+
+    # op code -> mnemonic and handler, built once for each flags mode and shared by every cpu
+    __instruction_sets = {False: __instruction_table(False), True: __instruction_table(True)}
+    del __instruction_table
@@ -0,0 +1,186 @@
+import json
+import os
+from cpu import Cpu
+
+# Static disassembler: walks the code reachable from the rom start following
+# jumps, branches and calls and splits it in basic blocks. Graphs are cached
+# as json by rom crc32, so the blocks of a known rom are available before it
+# runs (see precompile).
+
+# bump to invalidate the graphs cached by an older disassembler
+CACHE_VERSION = 1
+CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.pchip16', 'cfg')
+
+# how an instruction ends a block
+JUMP = 'jump'
+BRANCH = 'branch'
+CALL = 'call'
+RETURN = 'return'
+INDIRECT = 'indirect'
+INVALID = 'invalid'
+FALLTHROUGH = 'fallthrough'
+
+# op code -> (block end, has a static target, continues with the next instruction)
+FLOW = {
+    0x10: (JUMP, True, False),
+    0x12: (BRANCH, True, True),
+    0x13: (BRANCH, True, True),
+    0x14: (CALL, True, True),
+    0x15: (RETURN, False, False),
+    0x16: (INDIRECT, False, False),
+    0x17: (CALL, True, True),
+    0x18: (INDIRECT, False, True),
+}
+# op codes addressing memory through HHLL, and how many bytes
+DATA_ACCESS = {0x22: 2, 0x30: 2, 0xD0: 48}
+
+class Block:
+    def __init__(self, start, kind, instructions, successors, calls):
+        self.start = start
+        self.kind = kind
+        # [(address, disassembly)]
+        self.instructions = instructions
+        self.successors = successors
+        self.calls = calls
+
+    @property
+    def end(self):
+        return self.instructions[-1][0] + 4
+
+    def __repr__(self):
+        return "<Block 0x%04X-0x%04X %s -> %s>" % (self.start, self.end, self.kind, ", ".join("0x%04X" % x for x in self.successors))
+
+class Graph:
+    def __init__(self, crc32, size, entry):
+        self.crc32 = crc32
+        self.size = size
+        self.entry = entry
+        # start address -> Block
+        self.blocks = {}
+        # addresses of JMP RX and CALL RX, their targets are unknown
+        self.indirect = []
+        # (address, address) of instructions sharing bytes
+        self.overlaps = []
+        # (address, accessed address) of loads and stores with an immediate address inside code
+        self.data_in_code = []
+
+    def instructions(self):
+        return sorted(instruction for block in self.blocks.values() for instruction in block.instructions)
+
+    def listing(self):
+        return "\n".join("0x%04X: %s" % instruction for instruction in self.instructions()) + "\n"
+
+    def to_json(self):
+        return json.dumps({
+            'version': CACHE_VERSION,
+            'crc32': self.crc32,
+            'size': self.size,
+            'entry': self.entry,
+            'blocks': [{'start': block.start, 'kind': block.kind, 'instructions': block.instructions,
+                        'successors': block.successors, 'calls': block.calls}
+                       for start, block in sorted(self.blocks.items())],
+            'indirect': self.indirect,
+            'overlaps': self.overlaps,
+            'data_in_code': self.data_in_code,
+        }, sort_keys=True)
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        if data.get('version') != CACHE_VERSION:
+            raise ValueError("graph cached by another disassembler version: %s" % data.get('version'))
+        graph = cls(data['crc32'], data['size'], data['entry'])
+        for block in data['blocks']:
+            instructions = [(address, str(text)) for address, text in block['instructions']]
+            graph.blocks[block['start']] = Block(block['start'], str(block['kind']), instructions, block['successors'], block['calls'])
+        graph.indirect = data['indirect']
+        graph.overlaps = [tuple(overlap) for overlap in data['overlaps']]
+        graph.data_in_code = [tuple(access) for access in data['data_in_code']]
+        return graph
+
+def build(rom):
+    cpu = Cpu()
+    cpu.write_block(0x0000, rom.rom)
+    graph = Graph(rom.crc32, rom.size, rom.program_start)
+    # address -> (disassembly, kind, successors, calls) of every reachable instruction
+    decoded = {}
+    # (address, accessed address, size) of the loads and stores with an immediate address
+    accesses = []
+    leaders = set([rom.program_start])
+    pending = [rom.program_start]
+    while pending:
+        address = pending.pop()
+        if address in decoded or address < 0 or address > 0xFFFF - 3:
+            continue
+        data = tuple(cpu.read_block(address, 4))
+        try:
+            text = cpu.disassemble_bytes(data)
+        except KeyError:
+            decoded[address] = ("db 0x%02X" % data[0], INVALID, [], [])
+            continue
+        params = cpu.create_params_from_bytes(*data)
+        kind, static, continues = FLOW.get(params['op_code'], (FALLTHROUGH, False, True))
+        successors = []
+        calls = []
+        if static and kind == CALL:
+            calls.append(params['hhll'])
+        elif static:
+            successors.append(params['hhll'])
+        if continues:
+            successors.append(address + 4)
+        if kind == INDIRECT:
+            graph.indirect.append(address)
+        decoded[address] = (text, kind, successors, calls)
+        for target in successors + calls:
+            pending.append(target)
+            if kind != FALLTHROUGH:
+                leaders.add(target)
+        if params['op_code'] in DATA_ACCESS:
+            accesses.append((address, params['hhll'], DATA_ACCESS[params['op_code']]))
+    graph.indirect.sort()
+    # instructions decoded from the middle of another one
+    starts = sorted(decoded)
+    for first, second in zip(starts, starts[1:]):
+        if second - first < 4:
+            graph.overlaps.append((first, second))
+            leaders.add(second)
+    code = set(x for address in starts for x in range(address, address + 4))
+    graph.data_in_code = [(address, target) for address, target, size in accesses
+                          if any(x in code for x in range(target, target + size))]
+    for start in sorted(leaders):
+        if start not in decoded:
+            continue
+        instructions = []
+        address = start
+        while True:
+            text, kind, successors, calls = decoded[address]
+            instructions.append((address, text))
+            following = address + 4
+            if kind != FALLTHROUGH or following not in decoded or following in leaders:
+                break
+            address = following
+        graph.blocks[start] = Block(start, kind, instructions, successors, calls)
+    return graph
+
+def load(rom, directory=CACHE_DIRECTORY):
+    # the graph of a rom from the cache, built and cached on a miss; directory None skips the cache
+    if directory is None:
+        return build(rom)
+    path = os.path.join(directory, "%08x.json" % rom.crc32)
+    try:
+        with open(path) as cached:
+            graph = Graph.from_json(cached.read())
+        if graph.size == rom.size and graph.entry == rom.program_start:
+            return graph
+    except (IOError, ValueError, KeyError):
+        pass
+    graph = build(rom)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as cache:
+        cache.write(graph.to_json())
+    return graph
+
+def precompile(cpu, graph):
+    # decodes every known instruction and, in TRANSLATION_MODE, translates every known block
+    cpu.precompile([address for address, text in graph.instructions()], sorted(graph.blocks))
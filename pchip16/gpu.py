@@ -1,12 +1,40 @@
-import logging
+import collections
+import log
+import struct
+import numpy as np
+
+# bg, sprite width, sprite height, hflip, vflip, in vblank, palette rgb, then
+# the framebuffer two pixels a byte
+STATE = struct.Struct('<6B48d')
 
 class Gpu:
-    def __init__(self):
+    WIDTH = 320
+    HEIGHT = 240
+    # decoded sprites kept, the least recently drawn go first
+    SPRITE_CACHE_SIZE = 256
+
+    def __init__(self, read_block=None, watch_block=None, unwatch_block=None):
+        # read_block(address, size) returns the bytes of guest memory sprites are drawn from,
+        # watch_block(address, size) asks the memory to report writes there to invalidate()
+        # and unwatch_block(address, size) tells it no cached sprite is left there;
+        # without watch_block sprites are decoded again at every DRW
+        self.read_block = read_block
+        self.watch_block = watch_block
+        self.unwatch_block = unwatch_block
+        # (address, spritew, spriteh, hflip, vflip) -> (pixels, opaque mask)
+        self.sprites = collections.OrderedDict()
+        # page -> keys of the cached sprites read from it
+        self.__page_sprites = {}
         self.bg = 0b0000
         self.spritew = 0x00
         self.spriteh = 0x00
         self.hflip = False
         self.vflip = False
+        # set when a frame ends, VBLNK waits for it and clears it
+        self.in_vblank = False
+        # foreground colour index of every pixel, 0 shows the background colour;
+        # None until something is drawn, see framebuffer
+        self.__framebuffer = None
         self.__init_palette()
 
     def __init_palette(self):
@@ -35,30 +63,165 @@ class Gpu:
         b = float(b)/255.0 if b>0 else b
         self.palette[index] = {'r': r, 'g': g, 'b': b}
 
+    @property
+    def framebuffer(self):
+        if self.__framebuffer is None:
+            self.__framebuffer = np.zeros((Gpu.HEIGHT, Gpu.WIDTH), np.uint8)
+        return self.__framebuffer
+
     def clear_fg(self):
-        pass
+        self.__framebuffer = None
 
     def clear_bg(self):
-        pass
+        self.bg = 0
+
+    def start_vblank(self):
+        self.in_vblank = True
 
     def vblank(self):
+        if self.in_vblank:
+            self.in_vblank = False
+            return True
         return False
 
     def flip(self, hflip, vflip):
         self.hflip = hflip
         self.vflip = vflip
 
-    def there_is_overlap(self, hhll):
-        return False
+    def screen(self):
+        # colour index of every pixel, the background colour where nothing was drawn
+        if self.__framebuffer is None:
+            return np.full((Gpu.HEIGHT, Gpu.WIDTH), self.bg, np.uint8)
+        return np.where(self.__framebuffer == 0, np.uint8(self.bg), self.__framebuffer)
+
+    def sprite(self, data):
+        # spritew bytes a line, two pixels a byte (high nibble first), flipped as set by FLIP
+        width, height = self.spritew, self.spriteh
+        packed = np.zeros(width * height, np.uint8)
+        data = np.frombuffer(bytes(data), np.uint8)[:width * height]
+        # a sprite running past the end of memory is transparent there
+        packed[:len(data)] = data
+        packed = packed.reshape(height, width)
+        pixels = np.empty((height, width * 2), np.uint8)
+        pixels[:, 0::2] = packed >> 4
+        pixels[:, 1::2] = packed & 0xF
+        if self.hflip:
+            pixels = pixels[:, ::-1]
+        if self.vflip:
+            pixels = pixels[::-1]
+        return pixels
+
+    def draw(self, data, x, y):
+        pixels = self.sprite(data)
+        return self.blit(pixels, pixels != 0, x, y)
+
+    def blit(self, pixels, opaque, x, y):
+        # draws decoded sprite pixels at (x, y) where opaque; returns 1 when a drawn
+        # pixel hits one already drawn
+        x = x - 0x10000 if x & 0x8000 else x
+        y = y - 0x10000 if y & 0x8000 else y
+        height, width = pixels.shape
+        left, top = max(x, 0), max(y, 0)
+        right, bottom = min(x + width, Gpu.WIDTH), min(y + height, Gpu.HEIGHT)
+        if left >= right or top >= bottom:
+            return 0
+        pixels = pixels[top - y:bottom - y, left - x:right - x]
+        opaque = opaque[top - y:bottom - y, left - x:right - x]
+        target = self.framebuffer[top:bottom, left:right]
+        hit = 1 if np.logical_and(opaque, target != 0).any() else 0
+        np.copyto(target, pixels, where=opaque)
+        return hit
 
     def drw_hhll(self, hhll, x, y):
-        # Draw using opengl/framebuffer
-        if self.there_is_overlap():
-            return 1
+        return self.__drw(hhll, x, y)
+
+    def drw_rz(self, address, x, y):
+        return self.__drw(address, x, y)
+
+    def __drw(self, address, x, y):
+        size = self.spritew * self.spriteh
+        if self.watch_block is None:
+            return self.draw(self.read_block(address, size), x, y)
+        key = (address, self.spritew, self.spriteh, self.hflip, self.vflip)
+        sprites = self.sprites
+        cached = sprites.pop(key, None)
+        if cached is None:
+            pixels = self.sprite(self.read_block(address, size))
+            cached = (pixels, pixels != 0)
+            if len(sprites) >= self.SPRITE_CACHE_SIZE:
+                self.__forget(next(iter(sprites)))
+            for page in range(address >> 8, ((address + max(size, 1) - 1) >> 8) + 1):
+                self.__page_sprites.setdefault(page, set()).add(key)
+            self.watch_block(address, size)
+        sprites[key] = cached
+        return self.blit(cached[0], cached[1], x, y)
+
+    def invalidate(self, address, size):
+        # drops the cached sprites decoded from bytes of [address, address + size)
+        end = address + size
+        for page in range(address >> 8, ((end - 1) >> 8) + 1):
+            keys = self.__page_sprites.get(page)
+            if keys:
+                for key in list(keys):
+                    start = key[0]
+                    if start < end and address < start + key[1] * key[2]:
+                        self.__forget(key)
+
+    def __forget(self, key):
+        del self.sprites[key]
+        address, size = key[0], key[1] * key[2]
+        for page in range(address >> 8, ((address + max(size, 1) - 1) >> 8) + 1):
+            keys = self.__page_sprites[page]
+            keys.discard(key)
+            if not keys:
+                del self.__page_sprites[page]
+                if self.unwatch_block is not None:
+                    self.unwatch_block(page << 8, 0x100)
+
+    def clear_sprites(self):
+        # forgets every cached sprite, for a memory that was wiped
+        if self.sprites:
+            self.sprites = collections.OrderedDict()
+            self.__page_sprites = {}
+
+    def save_state(self):
+        colors = []
+        for index in range(0xF + 1):
+            color = self.palette[index]
+            colors += [color['r'], color['g'], color['b']]
+        framebuffer = self.__framebuffer
+        if framebuffer is None:
+            packed = '\0' * (Gpu.HEIGHT * Gpu.WIDTH / 2)
         else:
-            return 0
+            packed = ((framebuffer[:, 0::2] << 4) | framebuffer[:, 1::2]).tostring()
+        return STATE.pack(self.bg, self.spritew, self.spriteh, self.hflip, self.vflip, self.in_vblank, *colors) + packed
+
+    def load_state(self, state):
+        values = STATE.unpack_from(state)
+        self.bg, self.spritew, self.spriteh = values[:3]
+        self.hflip, self.vflip, self.in_vblank = [bool(x) for x in values[3:6]]
+        colors = values[6:]
+        for index in range(0xF + 1):
+            r, g, b = colors[index * 3:index * 3 + 3]
+            self.palette[index] = {'r': r, 'g': g, 'b': b}
+        packed = np.frombuffer(state, np.uint8, Gpu.HEIGHT * Gpu.WIDTH / 2, STATE.size).reshape(Gpu.HEIGHT, Gpu.WIDTH / 2)
+        if not packed.any():
+            self.__framebuffer = None
+            return
+        framebuffer = self.framebuffer
+        framebuffer[:, 0::2] = packed >> 4
+        framebuffer[:, 1::2] = packed & 0xF
+
+    def copy_state(self, other):
+        # what load_state(other.save_state()) does, without packing the framebuffer
+        self.bg, self.spritew, self.spriteh = other.bg, other.spritew, other.spriteh
+        self.hflip, self.vflip, self.in_vblank = other.hflip, other.vflip, other.in_vblank
+        # colours are replaced whole, never changed in place
+        self.palette = dict(other.palette)
+        framebuffer = other.__framebuffer
+        self.__framebuffer = None if framebuffer is None else framebuffer.copy()
 
     def print_state(self):
-        logging.debug("$$$$$$$$$$$$$$$$$ Gpu State $$$$$$$$$$$$$$$$$$$$")
-        logging.debug("BG=%s, Sprite W=%s, Sprite H=%s, H flip=%s, V flip=%s",self.bg, self.spritew, self.spriteh, self.hflip, self.vflip)
-        logging.debug("$$$$$$$$$$$$$$$$$ Gpu State $$$$$$$$$$$$$$$$$$$$")
+        log.debug("$$$$$$$$$$$$$$$$$ Gpu State $$$$$$$$$$$$$$$$$$$$")
+        log.debug("BG=%s, Sprite W=%s, Sprite H=%s, H flip=%s, V flip=%s",self.bg, self.spritew, self.spriteh, self.hflip, self.vflip)
+        log.debug("$$$$$$$$$$$$$$$$$ Gpu State $$$$$$$$$$$$$$$$$$$$")
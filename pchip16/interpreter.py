@@ -0,0 +1,151 @@
+import re
+import translator
+
+# Generates the interpreter loop run() uses in GENERATED_MODE: one function that
+# decodes each instruction inline and runs the translator template of its op
+# code from an if/elif chain, most executed op codes first. pc, sp and flags are
+# locals. Instructions without a template call their Cpu handler. The profiling
+# and tracing variants instrument every instruction, the plain one has no
+# instrumentation at all.
+
+PLAIN = 'plain'
+PROFILING = 'profiling'
+TRACING = 'tracing'
+
+# op codes the chain tests first when nothing better is known, see profiled_order
+DEFAULT_ORDER = (0x20, 0x12, 0x10, 0x40, 0x22, 0x30, 0x53, 0x41, 0x14, 0x15, 0x02, 0x60, 0x50, 0x24, 0x31, 0x23)
+
+# operands decoded from the instruction bytes at pc
+FIELDS = {
+    'x': "x = memory[pc + 1] & 0xF",
+    'y': "y = memory[pc + 1] >> 4",
+    'z': "z = memory[pc + 2] & 0xF",
+    'n': "n = memory[pc + 2] & 0xF",
+    'll': "ll = memory[pc + 2]",
+    'hh': "hh = memory[pc + 3]",
+    'hhll': "hhll = memory[pc + 2] | (memory[pc + 3] << 8)",
+    'ad': "ad = memory[pc + 1]",
+}
+OPERANDS = {
+    'rx': ('x', "r[x]"),
+    'ry': ('y', "r[y]"),
+    'rz': ('z', "r[z]"),
+    'x': ('x', "x"),
+    'y': ('y', "y"),
+    'n': ('n', "n"),
+    'll': ('ll', "ll"),
+    'hh': ('hh', "hh"),
+    'hhll': ('hhll', "hhll"),
+    'vtsr': ('hhll', "hhll"),
+    'ad': ('ad', "ad"),
+    'pc': (None, "pc"),
+    'next': (None, "(pc + 4)"),
+}
+
+FLUSH = ["cpu.sp = sp",
+         "cpu._flag_carry = carry",
+         "cpu._flag_zero = zero",
+         "cpu._flag_overflow = overflow",
+         "cpu._flag_negative = negative"]
+LOAD = ["sp = cpu.sp",
+        "if cpu._pending_flags is not None: cpu.resolve_flags()",
+        "carry = cpu._flag_carry",
+        "zero = cpu._flag_zero",
+        "overflow = cpu._flag_overflow",
+        "negative = cpu._flag_negative"]
+
+# (variant, order) -> compiled loop
+VARIANTS = {}
+
+def template_lines(op_code, variant):
+    spec = translator.TEMPLATES[op_code]
+    lines = [line[1] if isinstance(line, tuple) else line for line in spec['lines']]
+    if variant == PLAIN and op_code == 0x02:
+        # nothing but the host ends a vblank wait, the rest of the budget is idle
+        return ["if cpu.gpu.vblank():",
+                "    pc += 4",
+                "else:",
+                "    executed = cycles",
+                "    reason = 'idle'",
+                "    break"]
+    if variant == PLAIN and op_code == 0x10:
+        lines = ["if {hhll} == {pc}:",
+                 "    executed = cycles",
+                 "    reason = 'idle'",
+                 "    break"] + lines
+    fields = set()
+    for name in re.findall(r'\{(\w+)\}', " ".join(lines)):
+        if OPERANDS[name][0] is not None:
+            fields.add(OPERANDS[name][0])
+    values = dict((name, expression) for name, (field, expression) in OPERANDS.items())
+    body = [FIELDS[field] for field in sorted(fields)] + [line.format(**values) for line in lines]
+    if 'hh' not in fields and 'hhll' not in fields:
+        # the decoder reads all 4 bytes, an instruction past the end of memory fails the same way
+        body.insert(0, "memory[pc + 3]")
+    if spec['kind'] != translator.BRANCH:
+        body.append("pc += 4")
+    return body
+
+def fallback_lines(op_code):
+    # the handler may read and write anything the cpu holds
+    return FLUSH + ["cpu.pc = pc",
+                    "try:",
+                    "    pc += instruction_set[%s]['execute'](cpu, create_params(pc))" % op_code,
+                    "finally:"] + ["    " + line for line in LOAD]
+
+def generate(variant=PLAIN, order=DEFAULT_ORDER):
+    templated = sorted(op_code for op_code, spec in translator.TEMPLATES.items() if spec['lines'] is not None)
+    chain = list(order) + [op_code for op_code in templated if op_code not in order]
+    source = ["def run_%s(cpu, cycles, memory, instruction_set, create_params, record, timer):" % variant,
+              "    r = cpu.r",
+              "    read_16bit = cpu.read_16bit",
+              "    write_16bit = cpu.write_16bit",
+              "    pc = cpu.pc",
+              "    executed = 0",
+              "    reason = 'cycles'"]
+    source += ["    " + line for line in LOAD]
+    source.append("    try:")
+    source.append("        while executed < cycles:")
+    if variant == PROFILING:
+        source.append("            address = pc")
+        source.append("            start = timer()")
+    source.append("            op_code = memory[pc]")
+    if variant == TRACING:
+        source.append("            record(cpu.current_cyles + executed, pc, memory, r)")
+    for index, op_code in enumerate(chain):
+        source.append("            %s op_code == 0x%02X:" % ("if" if index == 0 else "elif", op_code))
+        if op_code in templated:
+            body = template_lines(op_code, variant)
+        else:
+            body = fallback_lines("0x%02X" % op_code)
+        source += ["                " + line for line in body]
+    source.append("            else:")
+    source += ["                " + line for line in fallback_lines("op_code")]
+    if variant == PROFILING:
+        source.append("            record(address, instruction_set[op_code]['Mnemonic'], timer() - start)")
+    source.append("            executed += 1")
+    source.append("    finally:")
+    # pc is only moved once an instruction is done, on errors it is left on the failing one
+    source += ["        " + line for line in FLUSH]
+    source.append("        cpu.pc = pc")
+    source.append("        cpu.current_cyles += executed")
+    source.append("    return executed, reason")
+    return "\n".join(source) + "\n"
+
+def variant(name, order=DEFAULT_ORDER):
+    # the compiled loop, generated once for each variant and op code order
+    key = (name, tuple(order))
+    run = VARIANTS.get(key)
+    if run is None:
+        namespace = {}
+        exec(compile(generate(name, order), "<interpreter %s>" % name, "exec"), namespace)
+        run = VARIANTS[key] = namespace["run_%s" % name]
+    return run
+
+def profiled_order(profiler):
+    # op codes most executed first according to a profiler, see Cpu.start_profiling
+    counts = {}
+    for address, (count, elapsed) in profiler.addresses.items():
+        op_code = profiler.cpu.read_8bit(address)
+        counts[op_code] = counts.get(op_code, 0) + count
+    return tuple(sorted(counts, key=lambda op_code: (-counts[op_code], op_code)))
@@ -0,0 +1,10 @@
+import logging
+
+# pchip16.log is only created once something is logged, building and resetting
+# machines never touches the disk
+FILENAME = 'pchip16.log'
+
+def debug(message, *args):
+    if not logging.root.handlers:
+        logging.basicConfig(filename=FILENAME, level=logging.DEBUG)
+    logging.debug(message, *args)
@@ -2,15 +2,29 @@ import OpenGL
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.GLUT import *
-import random
-
 import sys
+import numpy as np
+import loader
+from chip16 import Chip16
+from controller import Controller
+from rom_chip16 import RomChip16
 
 class PChip16Window:
+    # keys -> controller 1 buttons
+    KEYS = {'z': Controller.A, 'x': Controller.B, '\r': Controller.START, ' ': Controller.SELECT}
+    SPECIAL_KEYS = {GLUT_KEY_LEFT: Controller.LEFT, GLUT_KEY_UP: Controller.UP,
+                    GLUT_KEY_RIGHT: Controller.RIGHT, GLUT_KEY_DOWN: Controller.DOWN}
 
-    def __init__(self):
+    def __init__(self, rom_path):
+        # read by the machine at every frame end through Chip16.input
+        self.controller = Controller()
+        self.chip16 = Chip16(RomChip16(loader.load(rom_path)))
+        self.chip16.input = self.input
         self.main()
 
+    def input(self):
+        return (self.controller.state, 0x00)
+
     def init_gl(self):
         glClearColor(0.0, 0.0, 0.0, 0.0)
         glMatrixMode(GL_PROJECTION)
@@ -21,12 +35,18 @@ class PChip16Window:
         glClear(GL_COLOR_BUFFER_BIT)
 
     def draw_gl_scene(self):
+        # one frame of the machine, then the drawn pixels over the background colour
+        self.chip16.run_frame()
+        gpu = self.chip16.gpu
+        background = gpu.palette[gpu.bg]
+        glClearColor(background['r'], background['g'], background['b'], 0.0)
+        glClear(GL_COLOR_BUFFER_BIT)
+        framebuffer = gpu.framebuffer
         glBegin(GL_POINTS)
-        for x in range(0, 319):
-            for y in range(0, 239):
-                if x % 15 == 0 or y % 15 == 0:
-                    glColor3f(random.random(), random.random(), random.random())
-                glVertex2f(x, y)
+        for y, x in zip(*np.nonzero(framebuffer)):
+            color = gpu.palette[int(framebuffer[y, x])]
+            glColor3f(color['r'], color['g'], color['b'])
+            glVertex2f(x, y)
         glEnd()
         glutSwapBuffers()
 
@@ -43,18 +63,20 @@ class PChip16Window:
         # If escape is pressed, kill everything.
         if key == '\x1b':
             sys.exit()
-        elif key == 'm':
-            print "Now meteoring otherwise peaceful teapot"
+        elif key in PChip16Window.KEYS:
+            self.controller.press(PChip16Window.KEYS[key])
+
+    def keyReleased(self, key, x, y):
+        if key in PChip16Window.KEYS:
+            self.controller.release(PChip16Window.KEYS[key])
 
     def keySpecialPressed(self, key, x, y):
-        if key == 100:
-            print 'Left'
-        if key == 101:
-            print 'Up'
-        if key == 102:
-            print 'Right'
-        if key == 103:
-            print 'Down'
+        if key in PChip16Window.SPECIAL_KEYS:
+            self.controller.press(PChip16Window.SPECIAL_KEYS[key])
+
+    def keySpecialReleased(self, key, x, y):
+        if key in PChip16Window.SPECIAL_KEYS:
+            self.controller.release(PChip16Window.SPECIAL_KEYS[key])
 
     def main(self):
         ## Create window
@@ -73,7 +95,9 @@ class PChip16Window:
         glutReshapeFunc(self.reshape)
         glutIdleFunc(self.draw_gl_scene)
         glutKeyboardFunc(self.keyPressed)
+        glutKeyboardUpFunc(self.keyReleased)
         glutSpecialFunc(self.keySpecialPressed)
+        glutSpecialUpFunc(self.keySpecialReleased)
         ## end setup
 
         self.init_gl()
@@ -83,4 +107,5 @@ class PChip16Window:
         ## end infinity loop
 
 if __name__ == "__main__":
-    PChip16Window()
+    # python main.py ROM
+    PChip16Window(sys.argv[1])
@@ -0,0 +1,100 @@
+import bisect
+import struct
+import sys
+import timeit
+import loader
+from chip16 import Chip16
+from cpu import Cpu
+from rom_chip16 import RomChip16
+
+# magic, version, rom crc32, rnd seed, frames, number of changes
+HEADER = struct.Struct('<4sHIIII')
+# frame, controller 1, controller 2
+CHANGE = struct.Struct('<IHH')
+
+# Controller input of a session from power on, kept as the frames where it
+# changes. Replaying it gives the same run the recording did, headless and
+# as fast as the machine goes.
+class Movie:
+    MAGIC = 'C16M'
+    VERSION = 1
+
+    def __init__(self, crc32=0, seed=Cpu.DEFAULT_SEED):
+        self.crc32 = crc32
+        self.seed = seed
+        self.frames = 0
+        # [(frame, controller 1, controller 2)] in frame order
+        self.changes = []
+
+    def record(self, machine, input):
+        # machine must be fresh, input is sampled at every frame end like Chip16.input
+        self.crc32 = machine.rom.crc32
+        machine.cpu.seed(self.seed)
+
+        def recorder():
+            states = tuple(input())
+            if not self.changes or self.changes[-1][1:] != states:
+                self.changes.append((machine.frames,) + states)
+            self.frames = machine.frames
+            return states
+
+        machine.input = recorder
+
+    def play(self, machine):
+        # feeds the recorded input to a fresh machine
+        machine.cpu.seed(self.seed)
+        frames = [change[0] for change in self.changes]
+
+        def player():
+            position = bisect.bisect_right(frames, machine.frames) - 1
+            return self.changes[position][1:] if position >= 0 else (0x00, 0x00)
+
+        machine.input = player
+
+    def replay(self, rom):
+        # runs a new machine through the whole movie and returns it
+        machine = Chip16(rom)
+        self.play(machine)
+        for frame in range(self.frames):
+            machine.run_frame()
+        return machine
+
+    def to_bytes(self):
+        parts = [HEADER.pack(Movie.MAGIC, Movie.VERSION, self.crc32, self.seed, self.frames, len(self.changes))]
+        parts += [CHANGE.pack(*change) for change in self.changes]
+        return "".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, crc32, seed, frames, changes = HEADER.unpack_from(data)
+        if magic != Movie.MAGIC or version != Movie.VERSION:
+            raise ValueError("not a chip16 movie (magic=%r, version=%s)" % (magic, version))
+        movie = cls(crc32, seed)
+        movie.frames = frames
+        movie.changes = [CHANGE.unpack_from(data, HEADER.size + index * CHANGE.size) for index in range(changes)]
+        return movie
+
+    def save(self, path):
+        with open(path, 'wb') as movie_file:
+            movie_file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as movie_file:
+            return cls.from_bytes(movie_file.read())
+
+def main(argv=None):
+    # python -m pchip16.movie ROM MOVIE: replays the movie and reports the speed
+    rom_path, movie_path = (argv or sys.argv[1:])[:2]
+    rom = RomChip16(loader.load(rom_path))
+    movie = Movie.load(movie_path)
+    if movie.crc32 != rom.crc32:
+        sys.stderr.write("warning: movie recorded with rom crc32 %s\n" % hex(movie.crc32))
+    start = timeit.default_timer()
+    machine = movie.replay(rom)
+    elapsed = timeit.default_timer() - start
+    print "frames: %d, cycles: %d, seconds: %.3f, frames/s: %.1f, cycles/s: %.0f" % (
+        movie.frames, machine.cpu.current_cyles, elapsed, movie.frames / elapsed, machine.cpu.current_cyles / elapsed)
+
+if __name__ == '__main__':
+    main()
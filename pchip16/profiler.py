@@ -0,0 +1,71 @@
+import json
+import timeit
+
+# Counts executions and host time per guest address and per mnemonic. It is
+# fed by the profiling step the cpu swaps in with Cpu.start_profiling(), the
+# regular dispatch never sees it.
+class Profiler:
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.timer = timeit.default_timer
+        # address or mnemonic -> [executions, host seconds]
+        self.addresses = {}
+        self.mnemonics = {}
+
+    def record(self, address, mnemonic, elapsed):
+        entry = self.addresses.get(address)
+        if entry is None:
+            entry = self.addresses[address] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += elapsed
+        entry = self.mnemonics.get(mnemonic)
+        if entry is None:
+            entry = self.mnemonics[mnemonic] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += elapsed
+
+    def instructions(self):
+        return sum(count for count, elapsed in self.mnemonics.values())
+
+    def seconds(self):
+        return sum(elapsed for count, elapsed in self.mnemonics.values())
+
+    def hottest_mnemonics(self, top=None):
+        # [(mnemonic, executions, host seconds)] most executed first
+        rows = sorted(self.mnemonics.items(), key=lambda item: (-item[1][0], item[0]))
+        return [(mnemonic, count, elapsed) for mnemonic, (count, elapsed) in rows[:top]]
+
+    def hottest_addresses(self, top=None):
+        # [(address, executions, host seconds, disassembly)] most executed first
+        rows = sorted(self.addresses.items(), key=lambda item: (-item[1][0], item[0]))
+        return [(address, count, elapsed, self.__disassemble(address)) for address, (count, elapsed) in rows[:top]]
+
+    def __disassemble(self, address):
+        # the code may have been overwritten since it ran
+        try:
+            return self.cpu.disassemble(address)
+        except (KeyError, IndexError):
+            return '??'
+
+    def report(self, top=20):
+        instructions = max(self.instructions(), 1)
+        lines = ["instructions: %d, host time: %.6fs" % (self.instructions(), self.seconds()),
+                 "",
+                 "%-20s %10s %7s %12s" % ("mnemonic", "count", "%", "host us")]
+        for mnemonic, count, elapsed in self.hottest_mnemonics(top):
+            lines.append("%-20s %10d %6.2f%% %12.1f" % (mnemonic, count, 100.0 * count / instructions, elapsed * 1e6))
+        lines += ["",
+                  "%-8s %-24s %10s %7s %12s" % ("address", "instruction", "count", "%", "host us")]
+        for address, count, elapsed, disassembly in self.hottest_addresses(top):
+            lines.append("0x%04X   %-24s %10d %6.2f%% %12.1f" % (address, disassembly, count, 100.0 * count / instructions, elapsed * 1e6))
+        return "\n".join(lines) + "\n"
+
+    def to_json(self, top=20):
+        return json.dumps({
+            'instructions': self.instructions(),
+            'seconds': self.seconds(),
+            'mnemonics': [{'mnemonic': mnemonic, 'count': count, 'seconds': elapsed}
+                          for mnemonic, count, elapsed in self.hottest_mnemonics(top)],
+            'addresses': [{'address': address, 'disassembly': disassembly, 'count': count, 'seconds': elapsed}
+                          for address, count, elapsed, disassembly in self.hottest_addresses(top)],
+        }, indent=2, sort_keys=True)
@@ -0,0 +1,93 @@
+import collections
+import zlib
+
+# Machine states taken at every frame end. A keyframe is kept zlib compressed
+# every keyframe_interval frames and the frames in between only keep the
+# chunks of their state that differ from their keyframe, so any frame is
+# restored from two pieces and a frame costs a few pages when little changed.
+class Rewind:
+    CHUNK_SIZE = 0x100
+
+    def __init__(self, machine, seconds=10, keyframe_interval=60):
+        self.machine = machine
+        self.keyframe_interval = keyframe_interval
+        # (cycle, compressed keyframe, ((chunk index, chunk), ...) or None for the keyframe itself)
+        self.snapshots = collections.deque(maxlen=seconds * machine.FRAMES_PER_SECOND)
+        self.__keyframe = None
+        self.__compressed = None
+        self.__since_keyframe = 0
+        # last keyframe decompressed to restore a frame
+        self.__restored = (None, None)
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def record(self):
+        state = self.machine.save_state()
+        cycle = self.machine.cpu.current_cyles
+        keyframe = self.__keyframe
+        if keyframe is None or len(state) != len(keyframe) or self.__since_keyframe >= self.keyframe_interval:
+            self.__keyframe = state
+            self.__compressed = zlib.compress(state)
+            self.__since_keyframe = 1
+            self.snapshots.append((cycle, self.__compressed, None))
+            return
+        size = Rewind.CHUNK_SIZE
+        changed = []
+        for start in range(0, len(state), size):
+            chunk = state[start:start + size]
+            if chunk != keyframe[start:start + size]:
+                changed.append((start, chunk))
+        self.__since_keyframe += 1
+        self.snapshots.append((cycle, self.__compressed, tuple(changed)))
+
+    def size(self):
+        # bytes kept by the history, each keyframe counted once
+        keyframes = {}
+        changed = 0
+        for cycle, compressed, chunks in self.snapshots:
+            keyframes[id(compressed)] = len(compressed)
+            if chunks:
+                changed += sum(len(chunk) for start, chunk in chunks)
+        return sum(keyframes.values()) + changed
+
+    def step_back(self):
+        # restores the last frame before the current cycle, returns its cycle or None without history
+        current = self.machine.cpu.current_cyles
+        snapshots = self.snapshots
+        while snapshots and snapshots[-1][0] >= current:
+            snapshots.pop()
+        if not snapshots:
+            return None
+        self.__restore(snapshots[-1])
+        return snapshots[-1][0]
+
+    def seek(self, cycle):
+        # restores the last frame up to cycle and runs the machine again up to it
+        snapshots = self.snapshots
+        if not snapshots or snapshots[0][0] > cycle:
+            raise ValueError("cycle %d is not in the rewind history" % cycle)
+        while snapshots[-1][0] > cycle:
+            snapshots.pop()
+        self.__restore(snapshots[-1])
+        return self.machine.run(cycle - snapshots[-1][0])
+
+    def clear(self):
+        self.snapshots.clear()
+        self.__keyframe = None
+        self.__compressed = None
+        self.__restored = (None, None)
+
+    def __restore(self, snapshot):
+        cycle, compressed, chunks = snapshot
+        if self.__restored[0] is not compressed:
+            self.__restored = (compressed, zlib.decompress(compressed))
+        keyframe = self.__restored[1]
+        if chunks:
+            state = bytearray(keyframe)
+            for start, chunk in chunks:
+                state[start:start + len(chunk)] = chunk
+            keyframe = str(state)
+        # frames recorded from here on are diffed against a new keyframe
+        self.__keyframe = None
+        self.machine.load_state(keyframe)
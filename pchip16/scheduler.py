@@ -0,0 +1,55 @@
+import heapq
+
+# Events due at a cpu cycle. The machine runs the cpu straight to the next
+# due cycle and fires what is due in between, so no timer is checked while
+# instructions run.
+class Scheduler:
+    def __init__(self, clock, cycles_per_second):
+        # clock returns the current cpu cycle
+        self.clock = clock
+        self.cycles_per_second = cycles_per_second
+        self.__queue = []
+        # keeps events due at the same cycle in the order they were scheduled
+        self.__sequence = 0
+
+    def schedule(self, cycle, name, callback):
+        # callback(cycle) is called once the cpu reaches cycle
+        heapq.heappush(self.__queue, (cycle, self.__sequence, name, callback))
+        self.__sequence += 1
+
+    def schedule_after(self, cycles, name, callback):
+        self.schedule(self.clock() + cycles, name, callback)
+
+    def cancel(self, name):
+        self.__queue = [event for event in self.__queue if event[2] != name]
+        heapq.heapify(self.__queue)
+
+    def due(self, name):
+        # cycle the first event with this name is due at, None when there is none
+        cycles = [event[0] for event in self.__queue if event[2] == name]
+        return min(cycles) if cycles else None
+
+    def next_cycle(self):
+        return self.__queue[0][0] if self.__queue else None
+
+    def run_due(self, cycle):
+        # fires every event due up to cycle, returns how many
+        fired = 0
+        while self.__queue and self.__queue[0][0] <= cycle:
+            due, sequence, name, callback = heapq.heappop(self.__queue)
+            callback(due)
+            fired += 1
+        return fired
+
+    def events(self):
+        # [(cycle, name)] in the order they fire
+        return [(cycle, name) for cycle, sequence, name, callback in sorted(self.__queue)]
+
+    def restore(self, events, callbacks):
+        # replaces the queue with events as returned by events(), callbacks maps names to callbacks
+        self.__queue = []
+        for cycle, name in events:
+            self.schedule(cycle, name, callbacks[name])
+
+    def milliseconds(self, ms):
+        return ms * self.cycles_per_second / 1000
@@ -1,18 +1,48 @@
+import struct
+
+# tone, -1 when silent
+STATE = struct.Struct('<i')
+
 class Spu:
+    def __init__(self):
+        # set by the machine, sounds stop by themselves once their duration expires
+        self.scheduler = None
+        # frequency being played in Hz, None when silent
+        self.tone = None
+
     def setup(self, ad, vtsr):
         pass
 
     def stop(self):
-        pass
+        self.tone = None
+        if self.scheduler is not None:
+            self.scheduler.cancel('sound')
 
     def play500hz(self, ms):
-        pass
+        self.__play(500, ms)
 
     def play1000hz(self, ms):
-        pass
+        self.__play(1000, ms)
 
     def play1500hz(self, ms):
-        pass
+        self.__play(1500, ms)
 
     def play_tone(self, tone, ms):
-        pass
+        self.__play(tone, ms)
+
+    def __play(self, tone, ms):
+        self.stop()
+        self.tone = tone
+        if self.scheduler is not None:
+            self.scheduler.schedule_after(self.scheduler.milliseconds(ms), 'sound', self.expire)
+
+    def expire(self, cycle):
+        self.tone = None
+
+    def save_state(self):
+        # the end of the sound is a scheduler event, saved by the machine
+        return STATE.pack(-1 if self.tone is None else self.tone)
+
+    def load_state(self, state):
+        tone, = STATE.unpack_from(state)
+        self.tone = None if tone == -1 else tone
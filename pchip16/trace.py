@@ -0,0 +1,63 @@
+import array
+
+# Fixed size ring buffer of executed instructions. Each record keeps the cycle,
+# the pc, the raw instruction bytes and a selection of registers in
+# preallocated arrays; nothing is formatted until the trace is dumped.
+class Trace:
+    def __init__(self, size=8192, registers=range(0, 16)):
+        self.size = size
+        self.registers = tuple(registers)
+        # pc, instruction bytes 0-1, instruction bytes 2-3, registers
+        self.stride = 3 + len(self.registers)
+        self.cycles = array.array('L', [0] * size)
+        self.records = array.array('H', [0] * (size * self.stride))
+        self.position = 0
+        self.count = 0
+
+    def record(self, cycle, pc, memory, r):
+        position = self.position
+        records = self.records
+        base = position * self.stride
+        self.cycles[position] = cycle
+        # a jump may leave pc out of memory, the cpu reports that once it fetches
+        pc &= 0xFFFF
+        records[base] = pc
+        records[base + 1] = (memory[(pc + 1) & 0xFFFF] << 8) | memory[pc]
+        records[base + 2] = (memory[(pc + 3) & 0xFFFF] << 8) | memory[(pc + 2) & 0xFFFF]
+        base += 3
+        # registers are None until written and NEG may leave them negative
+        for register in self.registers:
+            records[base] = (r[register] or 0) & 0xFFFF
+            base += 1
+        self.position = (position + 1) % self.size
+        self.count += 1
+
+    def clear(self):
+        self.position = 0
+        self.count = 0
+
+    def entries(self, last=None):
+        # [(cycle, pc, instruction bytes, {register: value})] oldest first
+        available = min(self.count, self.size)
+        if last is not None:
+            available = min(available, last)
+        entries = []
+        for index in range(self.position - available, self.position):
+            position = index % self.size
+            base = position * self.stride
+            first, second = self.records[base + 1], self.records[base + 2]
+            data = (first & 0xFF, first >> 8, second & 0xFF, second >> 8)
+            values = self.records[base + 3:base + self.stride]
+            entries.append((self.cycles[position], self.records[base], data, dict(zip(self.registers, values))))
+        return entries
+
+    def dump(self, cpu, last=None):
+        lines = []
+        for cycle, pc, data, registers in self.entries(last):
+            try:
+                instruction = cpu.disassemble_bytes(data)
+            except KeyError:
+                instruction = '??'
+            values = " ".join("r%x=%04x" % (register, registers[register]) for register in self.registers)
+            lines.append("%10d %04x %s %-24s %s" % (cycle, pc, "".join("%02x" % byte for byte in data), instruction, values))
+        return "\n".join(lines) + "\n" if lines else ""
@@ -0,0 +1,358 @@
+import re
+import sys
+
+# Translates straight-line runs of chip16 instructions (basic blocks) into a
+# single python function. Registers, SP and flags are kept in locals while the
+# block runs and are written back to the cpu when it leaves the block.
+
+MAX_BLOCK_INSTRUCTIONS = 64
+# bump whenever the generated code changes, roms compiled ahead of time by an
+# older translator are compiled again (see aot)
+VERSION = 1
+
+# placeholders: {rx}, {ry}, {rz} are registers; {x}, {y}, {n}, {ll}, {hh},
+# {hhll}, {ad}, {vtsr} are operands; {pc} is the instruction address and
+# {next} the address right after it. Flag lines are (flag, line) tuples and
+# are dropped when a later instruction of the block overwrites the flag.
+def _negative(value):
+    return "((%s - 0x10000 if %s & 0x8000 else %s) < 0)" % (value, value, value)
+
+CARRY_ADD = ('carry', "carry = 1 if t > 0xFFFF else 0")
+CARRY_SUB = ('carry', "carry = 1 if %s else 0" % _negative('t'))
+CARRY_MUL = ('carry', "carry = 1 if t > 0xFFFF else 0")
+ZERO = ('zero', "zero = 1 if t == 0 else 0")
+NEGATIVE = ('negative', "negative = 1 if %s else 0" % _negative('t'))
+
+def CARRY_DIV(operand1, operand2):
+    return ('carry', "carry = 1 if %s %% %s != 0x0 else 0" % (operand1, operand2))
+
+def OVERFLOW_ADD(operand1, operand2):
+    return ('overflow', "overflow = 1 if (not %s) == (%s and %s) else 0" % (_negative('t'), _negative(operand1), _negative(operand2)))
+
+def OVERFLOW_SUB(operand1, operand2):
+    return ('overflow', "overflow = 1 if %s and (not %s) == %s else 0" % (_negative(operand2), _negative('t'), _negative(operand1)))
+
+FLAGS = ('carry', 'zero', 'overflow', 'negative')
+
+# instruction kinds
+PLAIN = 0
+FAULT = 1 # reads memory, divides or shifts by a register: may raise and expose the flags
+STORE = 2 # writes memory, the block may have been invalidated
+BRANCH = 3 # ends the block, sets pc
+
+TEMPLATES = {}
+
+def template(op_code, kind, writes, lines):
+    text = " ".join(line[1] if isinstance(line, tuple) else line for line in lines)
+    TEMPLATES[op_code] = {
+        'kind': kind,
+        'writes': writes,
+        'lines': lines,
+        'registers': tuple(register for register in ('x', 'y', 'z') if '{r%s}' % register in text),
+        'sp': re.search(r'\bsp\b', text) is not None,
+    }
+
+### 0x - Misc/Video/Audio ###
+template(0x00, PLAIN, (), [])
+template(0x02, BRANCH, (), ["pc = {next} if cpu.gpu.vblank() else {pc}"])
+### 1x - Jumps (Branches) ###
+template(0x10, BRANCH, (), ["pc = {hhll}"])
+template(0x12, BRANCH, (), ["pc = {hhll} if {x} != 0 else {next}"])
+template(0x13, BRANCH, (), ["pc = {hhll} if {rx} == {ry} else {next}"])
+template(0x14, BRANCH, (), ["write_16bit(sp, {pc} + 4)", "sp += 2", "pc = {hhll}"])
+template(0x15, BRANCH, (), ["pc = read_16bit(sp - 2)", "sp -= 2"])
+template(0x16, BRANCH, (), ["pc = {rx}"])
+template(0x17, BRANCH, (), ["if {x} != 0:",
+                            "    write_16bit(sp, {pc} + 4)",
+                            "    sp += 2",
+                            "    pc = {hhll}",
+                            "else:",
+                            "    pc = {next}"])
+template(0x18, BRANCH, (), ["write_16bit(sp, {pc} + 4)", "sp += 2", "pc = {rx}"])
+### 2x Load operations ###
+template(0x20, PLAIN, ('x',), ["{rx} = {hhll}"])
+template(0x21, PLAIN, (), ["sp = {hhll}"])
+template(0x22, FAULT, ('x',), ["{rx} = read_16bit({hhll})"])
+template(0x23, FAULT, ('x',), ["{rx} = read_16bit({ry})"])
+template(0x24, FAULT, ('x',), ["{rx} = read_16bit({ry})"])
+### 3x Store operations ###
+template(0x30, STORE, (), ["write_16bit({hhll}, {rx})"])
+template(0x31, STORE, (), ["write_16bit({ry}, {rx})"])
+### 4x - Addition ###
+template(0x40, PLAIN, ('x',), ["t = {rx} + {hhll}", CARRY_ADD, ZERO, OVERFLOW_ADD('{rx}', '{hhll}'), NEGATIVE, "{rx} = t & 0xFFFF"])
+template(0x41, PLAIN, ('x',), ["t = {rx} + {ry}", CARRY_ADD, ZERO, OVERFLOW_ADD('{rx}', '{y}'), NEGATIVE, "{rx} = t & 0xFFFF"])
+template(0x42, PLAIN, ('z',), ["t = {rx} + {ry}", CARRY_ADD, ZERO, OVERFLOW_ADD('{rx}', '{y}'), NEGATIVE, "{rz} = t & 0xFFFF"])
+### 5x - Subtraction ###
+template(0x50, PLAIN, ('x',), ["t = {rx} - {hhll}", CARRY_SUB, ZERO, OVERFLOW_SUB('{rx}', '{hhll}'), NEGATIVE, "{rx} = t & 0xFFFF"])
+template(0x51, PLAIN, ('x',), ["t = {rx} - {ry}", CARRY_SUB, ZERO, OVERFLOW_SUB('{rx}', '{ry}'), NEGATIVE, "{rx} = t & 0xFFFF"])
+template(0x52, PLAIN, ('z',), ["t = {rx} - {ry}", CARRY_SUB, ZERO, OVERFLOW_SUB('{rx}', '{ry}'), NEGATIVE, "{rz} = t & 0xFFFF"])
+template(0x53, PLAIN, (), ["t = {rx} - {hhll}", CARRY_SUB, ZERO, OVERFLOW_SUB('{rx}', '{hhll}'), NEGATIVE])
+template(0x54, PLAIN, (), ["t = {rx} - {ry}", CARRY_SUB, ZERO, OVERFLOW_SUB('{rx}', '{ry}'), NEGATIVE])
+### 6x - Bitwise AND ###
+template(0x60, PLAIN, ('x',), ["t = {rx} & {hhll}", ZERO, NEGATIVE, "{rx} = t & 0xFFFF"])
+template(0x61, PLAIN, ('x',), ["t = {rx} & {ry}", ZERO, NEGATIVE, "{rx} = t & 0xFFFF"])
+template(0x62, PLAIN, ('z',), ["t = {rx} & {ry}", ZERO, NEGATIVE, "{rz} = t & 0xFFFF"])
+template(0x63, PLAIN, (), ["t = {rx} & {hhll}", ZERO, NEGATIVE])
+template(0x64, PLAIN, (), ["t = {rx} & {ry}", ZERO, NEGATIVE])
+### 7x - Bitwise OR ###
+template(0x70, PLAIN, ('x',), ["t = {rx} | {hhll}", ZERO, NEGATIVE, "{rx} = t & 0xFFFF"])
+template(0x71, PLAIN, ('x',), ["t = {rx} | {ry}", ZERO, NEGATIVE, "{rx} = t & 0xFFFF"])
+template(0x72, PLAIN, ('z',), ["t = {rx} | {ry}", ZERO, NEGATIVE, "{rz} = t & 0xFFFF"])
+### 8x - Bitwise XOR ###
+template(0x80, PLAIN, ('x',), ["t = {rx} ^ {hhll}", ZERO, NEGATIVE, "{rx} = t & 0xFFFF"])
+template(0x81, PLAIN, ('x',), ["t = {rx} ^ {ry}", ZERO, NEGATIVE, "{rx} = t & 0xFFFF"])
+template(0x82, PLAIN, ('z',), ["t = {rx} ^ {ry}", ZERO, NEGATIVE, "{rz} = t & 0xFFFF"])
+### 9x - Multiplication ###
+template(0x90, PLAIN, ('x',), ["t = {rx} * {hhll}", CARRY_MUL, ZERO, NEGATIVE, "{rx} = t & 0xFFFF"])
+template(0x91, PLAIN, ('x',), ["t = {rx} * {ry}", CARRY_MUL, ZERO, NEGATIVE, "{rx} = t & 0xFFFF"])
+template(0x92, PLAIN, ('z',), ["t = {rx} * {ry}", CARRY_MUL, ZERO, NEGATIVE, "{rz} = t & 0xFFFF"])
+### Ax - Division ###
+template(0xA0, FAULT, ('x',), ["t = {rx} / {hhll}", CARRY_DIV('{rx}', '{hhll}'), ZERO, NEGATIVE, "{rx} = t & 0xFFFF"])
+template(0xA1, FAULT, ('x',), ["t = {rx} / {ry}", CARRY_DIV('{rx}', '{ry}'), ZERO, NEGATIVE, "{rx} = t & 0xFFFF"])
+template(0xA2, FAULT, ('z',), ["t = {rx} / {ry}", CARRY_DIV('{rx}', '{ry}'), ZERO, NEGATIVE, "{rz} = t & 0xFFFF"])
+template(0xA3, FAULT, ('x',), ["t = {rx} % {hhll}", ZERO, NEGATIVE, "{rx} = t & 0xFFFF"])
+template(0xA4, FAULT, ('x',), ["t = {rx} % {ry}", ZERO, NEGATIVE, "{rx} = t & 0xFFFF"])
+template(0xA5, FAULT, ('z',), ["t = {rx} % {ry}", ZERO, NEGATIVE, "{rz} = t & 0xFFFF"])
+TEMPLATES[0xA6] = TEMPLATES[0xA3]
+TEMPLATES[0xA7] = TEMPLATES[0xA4]
+TEMPLATES[0xA8] = TEMPLATES[0xA5]
+### Bx - Logical/Arithmetic Shifts ###
+template(0xB0, PLAIN, ('x',), ["t = {rx} << {n}", ZERO, NEGATIVE, "{rx} = t & 0xFFFF"])
+template(0xB1, PLAIN, ('x',), ["t = {rx} >> {n}", ZERO, NEGATIVE, "{rx} = t & 0xFFFF"])
+TEMPLATES[0xB2] = TEMPLATES[0xB1]
+template(0xB3, FAULT, ('y',), ["t = {rx} << {ry}", ZERO, NEGATIVE, "{ry} = t & 0xFFFF"])
+template(0xB4, FAULT, ('y',), ["t = {rx} >> {ry}", ZERO, NEGATIVE, "{ry} = t & 0xFFFF"])
+TEMPLATES[0xB5] = TEMPLATES[0xB4]
+### Cx - Push/Pop ###
+template(0xC0, STORE, (), ["write_16bit(sp, {rx})", "sp += 2"])
+template(0xC1, FAULT, ('x',), ["{rx} = read_16bit(sp - 2)", "sp -= 2"])
+### Ex - Not/Neg ###
+template(0xE0, PLAIN, ('x',), ["t = ~{hhll} & 0xFFFF", NEGATIVE, ZERO, "{rx} = t"])
+template(0xE1, PLAIN, ('x',), ["t = ~{rx} & 0xFFFF", NEGATIVE, ZERO, "{rx} = t"])
+template(0xE2, PLAIN, ('x',), ["t = ~{ry} & 0xFFFF", NEGATIVE, ZERO, "{rx} = t"])
+template(0xE3, PLAIN, ('x',), ["t = -{hhll}", NEGATIVE, ZERO, "{rx} = t"])
+template(0xE4, PLAIN, ('x',), ["t = -{rx}", NEGATIVE, ZERO, "{rx} = t"])
+template(0xE5, PLAIN, ('x',), ["t = -{ry}", NEGATIVE, ZERO, "{rx} = t"])
+
+# instructions without a template (video, sound, palette, PUSHALL/POPALL and
+# the flags stack) call the interpreter handler and are treated as stores
+FALLBACK = {'kind': STORE, 'writes': (), 'lines': None, 'registers': (), 'sp': True}
+
+def operands(params, address):
+    return {
+        'rx': "r%d" % params['x'],
+        'ry': "r%d" % params['y'],
+        'rz': "r%d" % params['z'],
+        'x': str(params['x']),
+        'y': str(params['y']),
+        'n': str(params['n']),
+        'll': "0x%02X" % params['ll'],
+        'hh': "0x%02X" % params['hh'],
+        'hhll': "0x%04X" % params['hhll'],
+        'ad': "0x%02X" % params['ad'],
+        'vtsr': "0x%04X" % params['vtsr'],
+        'pc': "0x%04X" % address,
+        'next': "0x%04X" % (address + 4),
+    }
+
+class Block:
+    def __init__(self, start, end, size, execute, source, valid, idle=False):
+        self.start = start
+        self.end = end
+        self.size = size
+        self.execute = execute
+        self.source = source
+        self.valid = valid
+        self.idle = idle
+        self.idle_countdown = 1
+
+    def invalidate(self):
+        self.valid[0] = False
+
+    def __repr__(self):
+        return "<Block [%s, %s) %s instructions>" % (hex(self.start), hex(self.end), self.size)
+
+def scan(cpu, address):
+    # collects (address, execute, params) until a branch, an unknown op code, a breakpoint or the size limit
+    instructions = []
+    while len(instructions) < MAX_BLOCK_INSTRUCTIONS and 0 <= address <= 0xFFFF - 3 and not cpu.trapped(address):
+        try:
+            execute, params, mnemonic = cpu.decode(address)
+        except (KeyError, TypeError):
+            break
+        instructions.append((address, execute, params))
+        if TEMPLATES.get(params['op_code'], FALLBACK)['kind'] == BRANCH:
+            break
+        address += 4
+    return instructions
+
+def idle_loop(instructions):
+    # a block branching back to its own start that only reads memory and computes
+    # registers, sp and flags: once an iteration leaves those unchanged it spins
+    # until something outside the cpu (a device, the host) changes
+    start = instructions[0][0]
+    address, execute, params = instructions[-1]
+    if params['op_code'] == 0x02:
+        target = address
+    elif params['op_code'] in (0x10, 0x12, 0x13):
+        target = params['hhll']
+    else:
+        return False
+    if target != start:
+        return False
+    return all(TEMPLATES.get(params['op_code'], FALLBACK)['kind'] in (PLAIN, FAULT) for address, execute, params in instructions[:-1])
+
+def live_flag_lines(instructions):
+    # walks the block backwards dropping flag updates overwritten before anyone can see them
+    live = set(FLAGS)
+    keep = []
+    for address, execute, params in reversed(instructions):
+        spec = TEMPLATES.get(params['op_code'], FALLBACK)
+        if spec['kind'] != PLAIN or spec['lines'] is None:
+            live = set(FLAGS)
+            keep.append(set(FLAGS))
+            continue
+        flags = [line[0] for line in spec['lines'] if isinstance(line, tuple)]
+        keep.append(set(flag for flag in flags if flag in live))
+        live.difference_update(flags)
+    keep.reverse()
+    return keep
+
+def generate(instructions, name):
+    registers = set()
+    written = set()
+    flags = set()
+    uses_sp = False
+    body = []
+    line_instruction = {}
+    fallbacks = {}
+
+    def emit(index, line, indent=2):
+        body.append((index, "    " * indent + line))
+
+    keep = live_flag_lines(instructions)
+    for index, (address, execute, params) in enumerate(instructions):
+        spec = TEMPLATES.get(params['op_code'], FALLBACK)
+        fields = operands(params, address)
+        if spec['lines'] is None:
+            fallbacks[index] = (execute, params)
+            emit(index, "FLUSH")
+            emit(index, "cpu.pc = %s" % fields['pc'])
+            emit(index, "execute_%d(params_%d)" % (index, index))
+            emit(index, "RELOAD")
+            flags.update(FLAGS)
+        else:
+            for line in spec['lines']:
+                if isinstance(line, tuple):
+                    if line[0] not in keep[index]:
+                        continue
+                    flags.add(line[0])
+                    line = line[1]
+                emit(index, line.format(**fields))
+            for register in spec['registers']:
+                registers.add(params[register])
+            for register in spec['writes']:
+                written.add(params[register])
+        uses_sp = uses_sp or spec['sp']
+        if spec['kind'] == STORE and index + 1 < len(instructions):
+            emit(index, "if not valid[0]:")
+            emit(index, "FLUSH", 3)
+            emit(index, "cpu.pc = %s" % fields['next'], 3)
+            emit(index, "cpu.current_cyles += %d" % (index + 1), 3)
+            emit(index, "return %d" % (index + 1), 3)
+
+    last = instructions[-1]
+    branches = TEMPLATES.get(last[2]['op_code'], FALLBACK)['kind'] == BRANCH
+    if not branches:
+        emit(len(instructions) - 1, "pc = 0x%04X" % (last[0] + 4))
+
+    flush = ["r[%d] = r%d" % (register, register) for register in sorted(written)]
+    # flags go straight to the fields behind the cpu flag properties, once any lazy update is resolved
+    flush += ["cpu._flag_%s = %s" % (flag, flag) for flag in FLAGS if flag in flags]
+    if uses_sp:
+        flush.append("cpu.sp = sp")
+    load = ["r%d = r[%d]" % (register, register) for register in sorted(registers | written)]
+    if uses_sp:
+        load.append("sp = cpu.sp")
+    if flags:
+        load.append("if cpu._pending_flags is not None: cpu.resolve_flags()")
+    load += ["%s = cpu._flag_%s" % (flag, flag) for flag in FLAGS if flag in flags]
+
+    defaults = ["valid=valid", "lines=lines", "addresses=addresses", "fallbacks=fallbacks"]
+    defaults += ["execute_%d=execute_%d, params_%d=params_%d" % (index, index, index, index) for index in sorted(fallbacks)]
+    source = ["def %s(cpu, %s):" % (name, ", ".join(defaults)),
+              "    r = cpu.r",
+              "    read_16bit = cpu.read_16bit",
+              "    write_16bit = cpu.write_16bit"]
+    source += ["    " + line for line in load]
+    source.append("    try:")
+    for index, line in body:
+        stripped = line.lstrip()
+        indent = line[:len(line) - len(stripped)]
+        if stripped == "FLUSH":
+            expanded = flush or ["pass"]
+        elif stripped == "RELOAD":
+            expanded = load or ["pass"]
+        else:
+            expanded = [stripped]
+        for line in expanded:
+            source.append(indent + line)
+            line_instruction[len(source)] = index
+    source.append("    except BaseException:")
+    source.append("        index = lines[sys.exc_info()[2].tb_lineno]")
+    # the state was flushed before calling a fallback handler, which may have changed it since
+    source.append("        if index not in fallbacks:")
+    source += ["            " + line for line in flush or ["pass"]]
+    source.append("        cpu.pc = addresses[index]")
+    source.append("        cpu.current_cyles += index")
+    source.append("        raise")
+    source += ["    " + line for line in flush]
+    source.append("    cpu.pc = pc")
+    source.append("    cpu.current_cyles += %d" % len(instructions))
+    source.append("    return %d" % len(instructions))
+    return "\n".join(source) + "\n", line_instruction, fallbacks
+
+def bindings(valid, line_instruction, addresses, fallbacks):
+    # names the generated function takes as defaults
+    namespace = {
+        'sys': sys,
+        'valid': valid,
+        'lines': line_instruction,
+        'addresses': addresses,
+        'fallbacks': frozenset(fallbacks),
+    }
+    for index, (execute, params) in fallbacks.items():
+        namespace['execute_%d' % index] = execute
+        namespace['params_%d' % index] = params
+    return namespace
+
+def translate(cpu, address):
+    instructions = scan(cpu, address)
+    if not instructions:
+        return None
+    name = "block_%04x" % address
+    source, line_instruction, fallbacks = generate(instructions, name)
+    valid = [True]
+    namespace = bindings(valid, line_instruction, tuple(instruction[0] for instruction in instructions), fallbacks)
+    exec(compile(source, "<%s>" % name, "exec"), namespace)
+    end = instructions[-1][0] + 4
+    return Block(address, end, len(instructions), namespace[name], source, valid, idle_loop(instructions))
+
+def bind(cpu, compiled, address):
+    # the block compiled ahead of time at address, None when there is none or its code changed since
+    entry = compiled.BLOCKS.get(address)
+    if entry is None:
+        return None
+    make, end, code, idle, line_instruction, fallback_indexes = entry
+    if str(cpu.read_block(address, end - address)) != code:
+        return None
+    addresses = tuple(range(address, end, 4))
+    if any(cpu.trapped(instruction) for instruction in addresses):
+        return None
+    # decoding marks the code pages, so writes to them invalidate the block
+    decoded = [cpu.decode(instruction) for instruction in addresses]
+    fallbacks = dict((index, decoded[index][:2]) for index in fallback_indexes)
+    valid = [True]
+    namespace = bindings(valid, line_instruction, addresses, fallbacks)
+    del namespace['sys']
+    return Block(address, end, len(addresses), make(**namespace), None, valid, idle)
@@ -0,0 +1,621 @@
+from cpu import Cpu
+from gpu import Gpu
+import numpy as np
+
+# Runs many machines in lockstep: every register, flag and byte of memory is
+# an array indexed by instance. Each step fetches the instruction at every
+# running pc and executes each opcode once for all the instances sitting on
+# it, so the interpreter overhead is paid per opcode and not per machine.
+#
+# It follows the cpu instruction by instruction, including its quirks and the
+# RND sequence of each instance's seed. Video instructions run one instance at
+# a time on a Gpu of its own, created on the first one, so DRW reports the
+# same collisions. The differences: registers start at 0 instead of None,
+# sound instructions only keep their effect on the cpu, VBLNK waits for
+# start_vblank and an instruction the cpu would raise on halts its instance
+# instead, leaving it on the faulting pc with the memory the cpu leaves (a 16
+# bit store at 0xFFFF still writes its low byte).
+class VectorCpu(object):
+    def __init__(self, count, seed=Cpu.DEFAULT_SEED):
+        self.count = count
+        self.current_cyles = np.zeros(count, np.int64)
+        self.pc = np.zeros(count, np.int64) + Cpu.RAM_ROM_START
+        self.sp = np.zeros(count, np.int64) + Cpu.STACK_START
+        # int64 so NEG can leave negative values and results are flagged before masking
+        self.r = np.zeros((count, 0xF + 1), np.int64)
+        self.flag_carry = np.zeros(count, np.int64)
+        self.flag_zero = np.zeros(count, np.int64)
+        self.flag_overflow = np.zeros(count, np.int64)
+        self.flag_negative = np.zeros(count, np.int64)
+        self.memory = np.zeros((count, 0xFFFF + 1), np.uint8)
+        self.in_vblank = np.zeros(count, np.bool_)
+        self.halted = np.zeros(count, np.bool_)
+        self.random_state = np.zeros(count, np.int64)
+        # instance -> Gpu, see gpu
+        self.__gpus = [None] * count
+        # gpu state the instances start from, None for a fresh gpu
+        self.__gpu_state = None
+        self.seed(seed)
+        self.__instruction_set = self.__instruction_table()
+
+    @classmethod
+    def from_cpu(cls, cpu, count):
+        # count copies of the state of a cpu, registers never written are 0
+        vector = cls(count)
+        vector.random_state[:] = cpu.random_state
+        vector.current_cyles[:] = cpu.current_cyles
+        vector.pc[:] = cpu.pc
+        vector.sp[:] = cpu.sp
+        vector.r[:] = [x or 0 for x in cpu.r]
+        vector.flag_carry[:] = cpu.flag_carry
+        vector.flag_zero[:] = cpu.flag_zero
+        vector.flag_overflow[:] = cpu.flag_overflow
+        vector.flag_negative[:] = cpu.flag_negative
+        vector.memory[:] = np.frombuffer(bytes(cpu.read_block(0x0000, 0xFFFF + 1)), np.uint8)
+        vector.__gpu_state = Gpu()
+        vector.__gpu_state.copy_state(cpu.gpu)
+        return vector
+
+    def gpu(self, index):
+        # the gpu of one instance, drawing from its memory
+        instance = self.__gpus[index]
+        if instance is None:
+            instance = self.__gpus[index] = Gpu(lambda address, size: bytearray(self.memory[index, address:address + size].tobytes()))
+            if self.__gpu_state is not None:
+                instance.copy_state(self.__gpu_state)
+        return instance
+
+    def cpu(self, index):
+        # a cpu in the state of one instance
+        cpu = Cpu()
+        cpu.current_cyles = int(self.current_cyles[index])
+        cpu.pc = int(self.pc[index])
+        cpu.sp = int(self.sp[index])
+        cpu.r = [int(x) for x in self.r[index]]
+        cpu.flag_carry = int(self.flag_carry[index])
+        cpu.flag_zero = int(self.flag_zero[index])
+        cpu.flag_overflow = int(self.flag_overflow[index])
+        cpu.flag_negative = int(self.flag_negative[index])
+        cpu.random_state = int(self.random_state[index])
+        cpu.write_block(0x0000, bytearray(self.memory[index].tobytes()))
+        cpu.gpu.copy_state(self.gpu(index))
+        cpu.gpu.in_vblank = bool(self.in_vblank[index])
+        return cpu
+
+    def write_block(self, address, data):
+        # writes the same data to every instance
+        self.memory[:, address:address + len(data)] = np.frombuffer(bytes(bytearray(data)), np.uint8)
+
+    def seed(self, seeds):
+        # one seed for every instance or a seed per instance, like Cpu.seed
+        seeds = np.zeros(self.count, np.int64) + seeds
+        seeds &= 0xFFFFFFFF
+        seeds[seeds == 0] = Cpu.DEFAULT_SEED
+        self.random_state[:] = seeds
+
+    def random(self, index, maximum):
+        # next number of the RND sequence of every instance in index, in [0, maximum]
+        x = self.random_state[index]
+        x ^= (x << 13) & 0xFFFFFFFF
+        x ^= x >> 17
+        x ^= (x << 5) & 0xFFFFFFFF
+        self.random_state[index] = x
+        return x % (maximum + 1)
+
+    def start_vblank(self):
+        self.in_vblank[:] = True
+
+    def step(self):
+        # runs one instruction on every running instance, returns how many ran
+        index = np.flatnonzero(~self.halted)
+        pc = self.pc[index]
+        fetchable = (pc >= -0x10000) & (pc <= 0xFFFF - 3)
+        if not fetchable.all():
+            self.halted[index[~fetchable]] = True
+            index, pc = index[fetchable], pc[fetchable]
+        memory = self.memory
+        op_code = memory[index, pc]
+        yx = memory[index, pc + 1].astype(np.int64)
+        ll = memory[index, pc + 2].astype(np.int64)
+        hh = memory[index, pc + 3].astype(np.int64)
+        for code in np.unique(op_code):
+            same = op_code == code
+            selected = index[same]
+            params = self.create_params(yx[same], ll[same], hh[same])
+            execute = self.__instruction_set.get(int(code))
+            if execute is None:
+                self.halted[selected] = True
+                continue
+            execute(selected, params)
+        ran = index[~self.halted[index]]
+        self.current_cyles[ran] += 1
+        return len(ran)
+
+    def run(self, cycles):
+        # steps every running instance up to cycles times, returns the steps taken
+        for executed in range(cycles):
+            if not self.step():
+                return executed
+        return cycles
+
+    def create_params(self, yx, ll, hh):
+        params = {}
+        params['y'] = yx >> 4
+        params['x'] = yx & 0b00001111
+        params['n'] = ll & 0b00001111
+        params['z'] = params['n']
+        params['ll'] = ll
+        params['hh'] = hh
+        params['hflip'] = hh >> 1
+        params['vflip'] = hh & 1
+        params['hhll'] = (hh << 8) | ll
+        return params
+
+    def __accessible(self, index, address, size, params, stored=None):
+        # halts the instances the cpu would raise an IndexError on, returns the others;
+        # a 16 bit store of stored at 0xFFFF writes the low byte before raising, like the cpu
+        valid = (address >= -0x10000) & (address + size <= 0xFFFF + 1)
+        if stored is not None and not valid.all():
+            last = address == 0xFFFF
+            self.memory[index[last], 0xFFFF] = stored[last] & 0xFF
+        return self.__keep(valid, index, address, params)
+
+    def __block_accessible(self, index, address, size, params, write=False):
+        # blocks are slices of memory: reads come out short and writes raise unless the
+        # whole block is inside it, reads may also count from its end
+        inside = (address >= 0) & (address + size <= 0xFFFF + 1)
+        if not write:
+            inside |= (address >= -0x10000) & (address + size < 0)
+        return self.__keep(inside, index, address, params)
+
+    def __keep(self, valid, index, address, params):
+        if valid.all():
+            return index, address, params
+        self.halted[index[~valid]] = True
+        return index[valid], address[valid], dict((key, value[valid]) for key, value in params.items())
+
+    def read_16bit(self, index, address):
+        # little-endian machine
+        memory = self.memory
+        return (memory[index, address + 1].astype(np.int64) << 8) | memory[index, address]
+
+    def write_16bit(self, index, address, value):
+        # little-endian machine
+        self.memory[index, address] = value & 0xFF
+        self.memory[index, address + 1] = (value >> 8) & 0xFF
+
+    def __instruction_table(self):
+        instruction_table = {}
+        r = self.r
+
+        ### 0x - Misc/Video/Audio ###
+        def nop(index, params):
+            self.pc[index] += 4
+
+        for op_code in (0x00, 0x09, 0x0A, 0x0B, 0x0C, 0x0E):
+            instruction_table[op_code] = nop
+
+        def cls(index, params):
+            for instance in index:
+                gpu = self.gpu(instance)
+                gpu.clear_fg()
+                gpu.clear_bg()
+            self.pc[index] += 4
+
+        instruction_table[0x01] = cls
+
+        def vblank(index, params):
+            ready = self.in_vblank[index]
+            self.in_vblank[index] = False
+            self.pc[index[ready]] += 4
+
+        instruction_table[0x02] = vblank
+
+        def bgc(index, params):
+            for instance, n in zip(index, params['n']):
+                self.gpu(instance).bg = int(n)
+            self.pc[index] += 4
+
+        instruction_table[0x03] = bgc
+
+        def spr(index, params):
+            for instance, ll, hh in zip(index, params['ll'], params['hh']):
+                gpu = self.gpu(instance)
+                gpu.spritew = int(ll)
+                gpu.spriteh = int(hh)
+            self.pc[index] += 4
+
+        instruction_table[0x04] = spr
+
+        def draw(index, addresses, params):
+            x, y = r[index, params['x']], r[index, params['y']]
+            self.flag_carry[index] = [self.gpu(instance).drw_hhll(int(address), int(x[at]), int(y[at]))
+                                      for at, (instance, address) in enumerate(zip(index, addresses))]
+            self.pc[index] += 4
+
+        def drw_hhll(index, params):
+            draw(index, params['hhll'], params)
+
+        instruction_table[0x05] = drw_hhll
+
+        def drw_rz(index, params):
+            index, address, params = self.__accessible(index, r[index, params['z']], 2, params)
+            draw(index, self.read_16bit(index, address), params)
+
+        instruction_table[0x06] = drw_rz
+
+        def rnd(index, params):
+            r[index, params['x']] = self.random(index, params['hhll'])
+            self.pc[index] += 4
+
+        instruction_table[0x07] = rnd
+
+        def flip(index, params):
+            for instance, hflip, vflip in zip(index, params['hflip'], params['vflip']):
+                self.gpu(instance).flip(int(hflip) == 1, int(vflip) == 1)
+            self.pc[index] += 4
+
+        instruction_table[0x08] = flip
+
+        def snp(index, params):
+            index, address, params = self.__accessible(index, r[index, params['x']], 2, params)
+            self.pc[index] += 4
+
+        instruction_table[0x0D] = snp
+        ########################
+        ### 1x - Jumps (Branches) ###
+        def jmp(index, params):
+            self.pc[index] = params['hhll']
+
+        instruction_table[0x10] = jmp
+
+        def jmpx(index, params):
+            taken = params['x'] != 0
+            self.pc[index] = np.where(taken, params['hhll'], self.pc[index] + 4)
+
+        instruction_table[0x12] = jmpx
+
+        def jme(index, params):
+            taken = r[index, params['x']] == r[index, params['y']]
+            self.pc[index] = np.where(taken, params['hhll'], self.pc[index] + 4)
+
+        instruction_table[0x13] = jme
+
+        def call_to(index, params, target):
+            params = dict(params, target=target)
+            index, address, params = self.__accessible(index, self.sp[index], 2, params, self.pc[index] + 4)
+            self.write_16bit(index, address, self.pc[index] + 4)
+            self.sp[index] += 2
+            self.pc[index] = params['target']
+
+        def call(index, params):
+            call_to(index, params, params['hhll'])
+
+        instruction_table[0x14] = call
+
+        def ret(index, params):
+            index, address, params = self.__accessible(index, self.sp[index] - 2, 2, params)
+            self.pc[index] = self.read_16bit(index, address)
+            self.sp[index] -= 2
+
+        instruction_table[0x15] = ret
+
+        def jmp_rx(index, params):
+            self.pc[index] = r[index, params['x']]
+
+        instruction_table[0x16] = jmp_rx
+
+        def call_x(index, params):
+            taken = params['x'] != 0
+            self.pc[index[~taken]] += 4
+            call(index[taken], dict((key, value[taken]) for key, value in params.items()))
+
+        instruction_table[0x17] = call_x
+
+        def call_rx(index, params):
+            call_to(index, params, r[index, params['x']])
+
+        instruction_table[0x18] = call_rx
+        ########################
+        ### 2x Load operations ###
+        def ldi_rx(index, params):
+            r[index, params['x']] = params['hhll']
+            self.pc[index] += 4
+
+        instruction_table[0x20] = ldi_rx
+
+        def ldi_sp(index, params):
+            self.sp[index] = params['hhll']
+            self.pc[index] += 4
+
+        instruction_table[0x21] = ldi_sp
+
+        def ldm_rx(index, params):
+            index, address, params = self.__accessible(index, params['hhll'], 2, params)
+            r[index, params['x']] = self.read_16bit(index, address)
+            self.pc[index] += 4
+
+        instruction_table[0x22] = ldm_rx
+
+        def ldm_rx_ry(index, params):
+            index, address, params = self.__accessible(index, r[index, params['y']], 2, params)
+            r[index, params['x']] = self.read_16bit(index, address)
+            self.pc[index] += 4
+
+        instruction_table[0x23] = ldm_rx_ry
+        instruction_table[0x24] = ldm_rx_ry
+        ########################
+
+        ### 3x Store operations ###
+        def stm_rx(index, params):
+            index, address, params = self.__accessible(index, params['hhll'], 2, params, r[index, params['x']])
+            self.write_16bit(index, address, r[index, params['x']])
+            self.pc[index] += 4
+
+        instruction_table[0x30] = stm_rx
+
+        def stm_rx_ry(index, params):
+            index, address, params = self.__accessible(index, r[index, params['y']], 2, params, r[index, params['x']])
+            self.write_16bit(index, address, r[index, params['x']])
+            self.pc[index] += 4
+
+        instruction_table[0x31] = stm_rx_ry
+        ########################
+
+        ### flags ###
+        def negative(value):
+            return ((value < 0) | ((value >= 0x8000) & (value <= 0xFFFF))).astype(np.int64)
+
+        def flags_add(index, result, operand1, operand2):
+            result_is_negative = negative(result)
+            operands_are_negative = negative(operand1) & negative(operand2)
+            self.flag_carry[index] = result > 0xFFFF
+            self.flag_zero[index] = result == 0
+            self.flag_overflow[index] = result_is_negative != operands_are_negative
+            self.flag_negative[index] = result_is_negative
+
+        def flags_sub(index, result, operand1, operand2):
+            result_is_negative = negative(result)
+            self.flag_carry[index] = result_is_negative
+            self.flag_zero[index] = result == 0
+            self.flag_overflow[index] = negative(operand2) & (result_is_negative != negative(operand1))
+            self.flag_negative[index] = result_is_negative
+
+        def flags_mul(index, result):
+            self.flag_carry[index] = result > 0xFFFF
+            self.flag_zero[index] = result == 0
+            self.flag_negative[index] = negative(result)
+
+        def flags_div(index, result, operand1, operand2):
+            self.flag_carry[index] = operand1 % operand2 != 0
+            self.flag_zero[index] = result == 0
+            self.flag_negative[index] = negative(result)
+
+        def flags_logic(index, result):
+            self.flag_zero[index] = result == 0
+            self.flag_negative[index] = negative(result)
+        ########################
+
+        # binary operations differ in their operands, their flags and where the result goes
+        def immediate(params, index):
+            return r[index, params['x']], params['hhll']
+
+        def registers(params, index):
+            return r[index, params['x']], r[index, params['y']]
+
+        def operation(operands, compute, flags, target):
+            def execute(index, params):
+                operand1, operand2 = operands(params, index)
+                result = compute(operand1, operand2)
+                flags(index, result, operand1, operand2, params)
+                if target is not None:
+                    r[index, params[target]] = result & 0xFFFF
+                self.pc[index] += 4
+            return execute
+
+        def add_flags(index, result, operand1, operand2, params):
+            flags_add(index, result, operand1, operand2)
+
+        def add_flags_y(index, result, operand1, operand2, params):
+            # the cpu checks the overflow against the index of RY
+            flags_add(index, result, operand1, params['y'])
+
+        def sub_flags(index, result, operand1, operand2, params):
+            flags_sub(index, result, operand1, operand2)
+
+        def mul_flags(index, result, operand1, operand2, params):
+            flags_mul(index, result)
+
+        def logic_flags(index, result, operand1, operand2, params):
+            flags_logic(index, result)
+
+        add = lambda a, b: a + b
+        sub = lambda a, b: a - b
+        ### 4x - Addition ###
+        instruction_table[0x40] = operation(immediate, add, add_flags, 'x')
+        instruction_table[0x41] = operation(registers, add, add_flags_y, 'x')
+        instruction_table[0x42] = operation(registers, add, add_flags_y, 'z')
+        ### 5x - Subtraction ###
+        instruction_table[0x50] = operation(immediate, sub, sub_flags, 'x')
+        instruction_table[0x51] = operation(registers, sub, sub_flags, 'x')
+        instruction_table[0x52] = operation(registers, sub, sub_flags, 'z')
+        instruction_table[0x53] = operation(immediate, sub, sub_flags, None)
+        instruction_table[0x54] = operation(registers, sub, sub_flags, None)
+        ### 6x, 7x, 8x - Bitwise AND, OR, XOR ###
+        for base, compute in ((0x60, np.bitwise_and), (0x70, np.bitwise_or), (0x80, np.bitwise_xor)):
+            instruction_table[base] = operation(immediate, compute, logic_flags, 'x')
+            instruction_table[base + 1] = operation(registers, compute, logic_flags, 'x')
+            instruction_table[base + 2] = operation(registers, compute, logic_flags, 'z')
+        instruction_table[0x63] = operation(immediate, np.bitwise_and, logic_flags, None)
+        instruction_table[0x64] = operation(registers, np.bitwise_and, logic_flags, None)
+        ### 9x - Multiplication ###
+        mul = lambda a, b: a * b
+        instruction_table[0x90] = operation(immediate, mul, mul_flags, 'x')
+        instruction_table[0x91] = operation(registers, mul, mul_flags, 'x')
+        instruction_table[0x92] = operation(registers, mul, mul_flags, 'z')
+        ########################
+
+        ### Ax - Division ###
+        def division(operands, target, remainder):
+            def execute(index, params):
+                operand1, operand2 = operands(params, index)
+                # the cpu raises a ZeroDivisionError
+                valid = operand2 != 0
+                if not valid.all():
+                    self.halted[index[~valid]] = True
+                    index, operand1, operand2 = index[valid], operand1[valid], operand2[valid]
+                    params = dict((key, value[valid]) for key, value in params.items())
+                if remainder:
+                    result = operand1 % operand2
+                    flags_logic(index, result)
+                else:
+                    result = operand1 // operand2
+                    flags_div(index, result, operand1, operand2)
+                r[index, params[target]] = result & 0xFFFF
+                self.pc[index] += 4
+            return execute
+
+        instruction_table[0xA0] = division(immediate, 'x', False)
+        instruction_table[0xA1] = division(registers, 'x', False)
+        instruction_table[0xA2] = division(registers, 'z', False)
+        for base in (0xA3, 0xA6):
+            instruction_table[base] = division(immediate, 'x', True)
+            instruction_table[base + 1] = division(registers, 'x', True)
+            instruction_table[base + 2] = division(registers, 'z', True)
+        ########################
+
+        ### Bx - Logical/Arithmetic Shifts ###
+        def shift_n(compute):
+            def execute(index, params):
+                result = compute(r[index, params['x']], params['n'])
+                flags_logic(index, result)
+                r[index, params['x']] = result & 0xFFFF
+                self.pc[index] += 4
+            return execute
+
+        def shift_ry(compute):
+            def execute(index, params):
+                amount = r[index, params['y']]
+                # the cpu raises a ValueError on negative shift counts
+                index, amount, params = self.__keep(amount >= 0, index, amount, params)
+                # any shift past 32 bits leaves the same flags and register as an unbounded one
+                result = compute(r[index, params['x']], np.minimum(amount, 32))
+                flags_logic(index, result)
+                r[index, params['y']] = result & 0xFFFF
+                self.pc[index] += 4
+            return execute
+
+        instruction_table[0xB0] = shift_n(np.left_shift)
+        instruction_table[0xB1] = shift_n(np.right_shift)
+        instruction_table[0xB2] = shift_n(np.right_shift)
+        instruction_table[0xB3] = shift_ry(np.left_shift)
+        instruction_table[0xB4] = shift_ry(np.right_shift)
+        instruction_table[0xB5] = shift_ry(np.right_shift)
+        ########################
+
+        ### Cx - Push/Pop ###
+        def push_rx(index, params):
+            index, address, params = self.__accessible(index, self.sp[index], 2, params, r[index, params['x']])
+            self.write_16bit(index, address, r[index, params['x']])
+            self.sp[index] += 2
+            self.pc[index] += 4
+
+        instruction_table[0xC0] = push_rx
+
+        def pop_rx(index, params):
+            index, address, params = self.__accessible(index, self.sp[index] - 2, 2, params)
+            r[index, params['x']] = self.read_16bit(index, address)
+            self.sp[index] -= 2
+            self.pc[index] += 4
+
+        instruction_table[0xC1] = pop_rx
+
+        def push_all(index, params):
+            index, address, params = self.__block_accessible(index, self.sp[index], 32, params, True)
+            for register in range(0xF + 1):
+                self.write_16bit(index, address + register * 2, r[index, register] & 0xFFFF)
+            self.sp[index] += 32
+            self.pc[index] += 4
+
+        instruction_table[0xC2] = push_all
+
+        def pop_all(index, params):
+            index, address, params = self.__block_accessible(index, self.sp[index] - 32, 32, params)
+            for register in range(0xF + 1):
+                r[index, register] = self.read_16bit(index, address + register * 2)
+            self.sp[index] -= 32
+            self.pc[index] += 4
+
+        instruction_table[0xC3] = pop_all
+
+        def push_flags(index, params):
+            # loads the flags from [SP], like the cpu
+            index, address, params = self.__accessible(index, self.sp[index], 2, params)
+            flags = self.read_16bit(index, address)
+            self.flag_carry[index] = (flags >> 1) & 1
+            self.flag_zero[index] = (flags >> 2) & 1
+            self.flag_overflow[index] = (flags >> 6) & 1
+            self.flag_negative[index] = (flags >> 7) & 1
+            self.sp[index] += 2
+            self.pc[index] += 4
+
+        instruction_table[0xC4] = push_flags
+
+        def pop_flags(index, params):
+            # stores the flags at [SP-2], like the cpu
+            flags = (self.flag_carry[index] << 1) | (self.flag_zero[index] << 2) | \
+                    (self.flag_overflow[index] << 6) | (self.flag_negative[index] << 7)
+            index, address, params = self.__accessible(index, self.sp[index] - 2, 2, params, flags)
+            flags = (self.flag_carry[index] << 1) | (self.flag_zero[index] << 2) | \
+                    (self.flag_overflow[index] << 6) | (self.flag_negative[index] << 7)
+            self.write_16bit(index, address, flags)
+            self.sp[index] -= 2
+            self.pc[index] += 4
+
+        instruction_table[0xC5] = pop_flags
+        ########################
+
+        ### Dx - Palette ###
+        def palette(index, address):
+            for instance, start in zip(index, address):
+                gpu = self.gpu(instance)
+                colors = [int(x) for x in self.memory[instance, start:start + 48]]
+                for pal_index in range(0, 16):
+                    gpu.set_palette(pal_index, *colors[pal_index * 3:pal_index * 3 + 3])
+            self.pc[index] += 4
+
+        def pal_hhll(index, params):
+            index, address, params = self.__block_accessible(index, params['hhll'], 48, params)
+            palette(index, address)
+
+        instruction_table[0xD0] = pal_hhll
+
+        def pal_rx(index, params):
+            index, address, params = self.__block_accessible(index, r[index, params['x']], 48, params)
+            palette(index, address)
+
+        instruction_table[0xD1] = pal_rx
+        ########################
+
+        ### Ex - Not/Neg ###
+        def unary(operand, compute):
+            def execute(index, params):
+                result = compute(operand(params, index))
+                r[index, params['x']] = result
+                flags_logic(index, result)
+                self.pc[index] += 4
+            return execute
+
+        hhll = lambda params, index: params['hhll']
+        rx = lambda params, index: r[index, params['x']]
+        ry = lambda params, index: r[index, params['y']]
+        invert = lambda value: ~value & 0xFFFF
+        negate = lambda value: -value
+        instruction_table[0xE0] = unary(hhll, invert)
+        instruction_table[0xE1] = unary(rx, invert)
+        instruction_table[0xE2] = unary(ry, invert)
+        instruction_table[0xE3] = unary(hhll, negate)
+        instruction_table[0xE4] = unary(rx, negate)
+        instruction_table[0xE5] = unary(ry, negate)
+        ########################
+        return instruction_table
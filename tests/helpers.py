@@ -0,0 +1,10 @@
+from pchip16.rom_chip16 import RomChip16
+
+def rom(program, crc32=0x12345678):
+    # a rom holding program, with a header
+    size = len(program)
+    header = [ord(x) for x in 'CH16'] + [0x00, 0x11,
+              size & 0xFF, (size >> 8) & 0xFF, 0x00, 0x00,
+              0x00, 0x00,
+              crc32 & 0xFF, (crc32 >> 8) & 0xFF, (crc32 >> 16) & 0xFF, (crc32 >> 24) & 0xFF]
+    return RomChip16(header + program)
@@ -0,0 +1,67 @@
+from pchip16 import loader
+from pchip16 import aot
+from pchip16 import translator
+from pchip16.rom_chip16 import RomChip16
+from pchip16.chip16 import Chip16
+from tests.helpers import rom
+import sure
+
+def test_compiled_rom_runs_like_the_translator(tmpdir):
+    ascii = RomChip16(loader.load("roms/ASCII.c16"))
+    translated = Chip16(ascii)
+    translated.cpu.TRANSLATION_MODE = True
+    translated.run(5000)
+    compiled = Chip16(ascii)
+    aot.attach(compiled, str(tmpdir))
+    compiled.run(5000)
+    compiled.cpu.save_state().should.eql(translated.cpu.save_state())
+    tmpdir.join(aot.module_name(ascii) + ".py").check().should.be.ok
+
+def test_load_reuses_the_cached_module(tmpdir):
+    ascii = RomChip16(loader.load("roms/ASCII.c16"))
+    first = aot.load(ascii, str(tmpdir))
+    path = tmpdir.join(aot.module_name(ascii) + ".py")
+    modified = path.mtime()
+    aot.load(ascii, str(tmpdir)).BLOCKS.keys().should.eql(first.BLOCKS.keys())
+    path.mtime().should.eql(modified)
+
+def test_faults_inside_compiled_blocks_stop_on_the_instruction(tmpdir):
+    program = rom([0x20, 0x00, 0x05, 0x00, #LDI R0, 0x0005
+                   0x20, 0x01, 0x00, 0x00, #LDI R1, 0x0000
+                   0xA1, 0x10, 0x00, 0x00, #DIV R0, R1
+                   0x10, 0x00, 0x00, 0x00]) #JMP 0x0000
+    vm = Chip16(program)
+    aot.attach(vm, str(tmpdir))
+    f = lambda: vm.cpu.run(10)
+    f.should.throw(ZeroDivisionError)
+    vm.cpu.pc.should.eql(0x0008)
+    vm.cpu.r[0].should.eql(0x0005)
+
+def test_changed_code_falls_back_to_the_translator(tmpdir):
+    program = rom([0x20, 0x00, 0x05, 0x00, #LDI R0, 0x0005
+                   0x10, 0x00, 0x00, 0x00]) #JMP 0x0000
+    vm = Chip16(program)
+    aot.attach(vm, str(tmpdir))
+    vm.cpu.write_block(0x0000, [0x20, 0x00, 0x07, 0x00]) #LDI R0, 0x0007
+    vm.cpu.run(2)
+    vm.cpu.r[0].should.eql(0x0007)
+
+def test_forks_run_from_the_compiled_blocks(tmpdir, monkeypatch):
+    vm = Chip16(RomChip16(loader.load("roms/ASCII.c16")))
+    aot.attach(vm, str(tmpdir))
+    vm.run(2000)
+    child = vm.fork()
+    bound = []
+    bind = translator.bind
+    def counted(cpu, compiled, address):
+        block = bind(cpu, compiled, address)
+        if cpu is child.cpu and block is not None:
+            bound.append(address)
+        return block
+    monkeypatch.setattr(translator, 'bind', counted)
+    child.run(3000)
+    vm.run(3000)
+
+    child.cpu.TRANSLATION_MODE.should.be.true
+    bound.should_not.be.empty
+    child.cpu.save_state().should.eql(vm.cpu.save_state())
@@ -2,6 +2,7 @@ import sure
 from pchip16 import loader
 from pchip16.rom_chip16 import RomChip16
 from pchip16.chip16 import Chip16
+from pchip16.cpu import Cpu
 
 def test_few_steps():
     rom = RomChip16(loader.load("roms/ASCII.c16"))
@@ -13,3 +14,141 @@ def test_few_steps():
     vm.cpu.r[0xA].should.eql(0xA)
     vm.cpu.r[0xB].should.eql(0xA)
     vm.cpu.pc.should.eql(0x0050)
+
+def test_run_frame():
+    rom = RomChip16(loader.load("roms/ASCII.c16"))
+    vm = Chip16(rom)
+
+    vm.run_frame().should.eql((Chip16.CYCLES_PER_FRAME, Cpu.STOP_IDLE))
+
+    vm.cpu.current_cyles.should.eql(Chip16.CYCLES_PER_FRAME)
+
+def test_run_frame_idle_matches_step():
+    rom = RomChip16(loader.load("roms/ASCII.c16"))
+    stepped = Chip16(rom)
+    fast_forwarded = Chip16(rom)
+
+    for x in range(0, Chip16.CYCLES_PER_FRAME):
+        stepped.step()
+    fast_forwarded.run_frame()
+
+    fast_forwarded.cpu.pc.should.eql(stepped.cpu.pc)
+    fast_forwarded.cpu.r.should.eql(stepped.cpu.r)
+
+def test_run_until():
+    rom = RomChip16(loader.load("roms/ASCII.c16"))
+    vm = Chip16(rom)
+
+    vm.run_until(lambda machine: machine.cpu.pc == 0x0050).should.eql((9, Cpu.STOP_PREDICATE))
+
+    vm.cpu.r[0xC].should.eql(0xAAAA)
+    vm.run_until(lambda machine: False, 10).should.eql((10, Cpu.STOP_CYCLES))
+
+def test_vblank_waits_for_frame_end():
+    rom = RomChip16(loader.load("roms/ASCII.c16"))
+    vm = Chip16(rom)
+    vm.cpu.pc = 0x0000
+    vm.cpu.r[0x0] = 0x0000
+    vm.cpu.write_block(0x0000, [0x02, 0x00, 0x00, 0x00, #VBLNK
+                                0x40, 0x00, 0x01, 0x00, #ADDI R0, 0x0001
+                                0x10, 0x00, 0x00, 0x00]) #JMP 0x0000
+
+    vm.run_frame().should.eql((Chip16.CYCLES_PER_FRAME, Cpu.STOP_IDLE))
+    vm.cpu.r[0x0].should.eql(0)
+
+    vm.run(Chip16.CYCLES_PER_FRAME * 3)
+
+    vm.frames.should.eql(4)
+    vm.cpu.r[0x0].should.eql(3)
+    vm.cpu.current_cyles.should.eql(Chip16.CYCLES_PER_FRAME * 4)
+
+def test_sound_stops_when_duration_expires():
+    rom = RomChip16(loader.load("roms/ASCII.c16"))
+    vm = Chip16(rom)
+    vm.cpu.pc = 0x0000
+    vm.cpu.write_block(0x0000, [0x0A, 0x00, 0x0A, 0x00, #SND1 0x000A
+                                0x10, 0x00, 0x04, 0x00]) #JMP 0x0004
+
+    vm.step()
+    vm.spu.tone.should.eql(500)
+
+    vm.run_until(lambda machine: machine.spu.tone is None)
+
+    vm.cpu.current_cyles.should.eql(vm.scheduler.milliseconds(10))
+
+def test_input_is_written_to_io_ports():
+    rom = RomChip16(loader.load("roms/ASCII.c16"))
+    vm = Chip16(rom)
+    vm.input = lambda: (0x0081, 0x0002)
+
+    vm.run_frame()
+
+    vm.cpu.read_16bit(0xFFF0).should.eql(0x0081)
+    vm.cpu.read_16bit(0xFFF2).should.eql(0x0002)
+
+def test_load_state_resumes_where_it_was_saved():
+    rom = RomChip16(loader.load("roms/ASCII.c16"))
+    vm = Chip16(rom)
+    vm.step()
+    vm.spu.play500hz(100)
+    vm.gpu.set_palette(0x1, 255, 0, 0)
+    state = vm.save_state()
+    vm.run_frame()
+    vm.run_frame()
+    expected = vm.save_state()
+
+    vm.load_state(state)
+    vm.frames.should.eql(0)
+    vm.spu.tone.should.eql(500)
+    vm.gpu.palette[0x1].should.eql({'r': 1.0, 'g': 0.0, 'b': 0.0})
+    vm.run_frame()
+    vm.run_frame()
+
+    vm.save_state().should.eql(expected)
+
+def test_state_file_is_compressed(tmpdir):
+    rom = RomChip16(loader.load("roms/ASCII.c16"))
+    vm = Chip16(rom)
+    vm.run_frame()
+    path = str(tmpdir.join('ascii.state'))
+
+    vm.save_state_file(path)
+    restored = Chip16(rom)
+    restored.load_state_file(path)
+
+    len(tmpdir.join('ascii.state').read_binary()).should.be.lower_than(len(vm.save_state()))
+    restored.save_state().should.eql(vm.save_state())
+
+def test_fork_is_independent_from_its_parent():
+    rom = RomChip16(loader.load("roms/ASCII.c16"))
+    vm = Chip16(rom)
+    vm.run_frame()
+    child = vm.fork()
+
+    child.save_state().should.eql(vm.save_state())
+    child.cpu.write_16bit(0x2000, 0xBEEF)
+    child.run_frame()
+
+    vm.cpu.read_16bit(0x2000).should.eql(0x0000)
+    vm.frames.should.eql(1)
+    child.frames.should.eql(2)
+    vm.run_frame()
+    child.cpu.pc.should.eql(vm.cpu.pc)
+    child.cpu.r.should.eql(vm.cpu.r)
+
+def test_run_stops_at_breakpoints_and_watchpoints():
+    rom = RomChip16(loader.load("roms/ASCII.c16"))
+    vm = Chip16(rom)
+    vm.cpu.add_breakpoint(0x0004)
+
+    vm.run_frame().should.eql((1, Cpu.STOP_BREAKPOINT))
+    vm.cpu.pc.should.eql(0x0004)
+    vm.cpu.remove_breakpoint(0x0004)
+    vm.run_frame().should.eql((Chip16.CYCLES_PER_FRAME - 1, Cpu.STOP_IDLE))
+
+    vm = Chip16(rom)
+    vm.cpu.add_watchpoint(0xFDF0)
+    executed, reason = vm.run(5000)
+    reason.should.eql(Cpu.STOP_WATCHPOINT)
+    executed.should.be.lower_than(5000)
+    vm.cpu.current_cyles.should.eql(executed)
@@ -0,0 +1,23 @@
+from pchip16 import batch
+from pchip16.chip16 import Chip16
+import sure
+
+def test_run_job_reports_the_final_state():
+    result = batch.run_job(("roms/ASCII.c16", 1, 2))
+
+    result['error'].should.be.none
+    result['cycles'].should.eql(2 * Chip16.CYCLES_PER_FRAME)
+    result['registers'].should.have.length_of(16)
+    result['gpu_hash'].should.have.length_of(40)
+
+def test_run_job_reports_errors():
+    result = batch.run_job(("roms/missing.c16", 1, 2))
+
+    result['error'].should.contain('IOError')
+    result['cycles'].should.eql(0)
+
+def test_run_streams_a_result_per_job():
+    results = list(batch.run("roms", [1, 2], [1, 3], processes=2, chunksize=1))
+
+    sorted((result['seed'], result['frames']) for result in results).should.eql([(1, 1), (1, 3), (2, 1), (2, 3)])
+    [result['error'] for result in results].should.eql([None] * 4)
@@ -1666,3 +1666,475 @@ def test_NEG_rx_ry():
     chip16.r[0b11].should.be.eql(2)
     chip16.flag_zero.should.be.eql(0)
     chip16.flag_negative.should.be.eql(0)
+
+def test_decoded_instruction_is_reused():
+    chip16 = cpu.Cpu()
+
+    initial_address = 0x0000
+    chip16.pc = initial_address
+
+    chip16.write_8bit(initial_address + 0, 0x10) #op code
+    chip16.write_8bit(initial_address + 1, 0x00) #y,x
+    chip16.write_8bit(initial_address + 2, 0x00) #ll
+    chip16.write_8bit(initial_address + 3, 0x00) #hh
+
+    chip16.step()
+    chip16.step()
+
+    chip16.pc.should.be.eql(initial_address)
+    chip16.current_cyles.should.be.eql(2)
+
+def test_decoded_instruction_is_invalidated_on_write():
+    #self-modifying code: JMP 0x0000 becomes JMP 0x0BB0
+    chip16 = cpu.Cpu()
+
+    initial_address = 0x0000
+    chip16.pc = initial_address
+
+    chip16.write_8bit(initial_address + 0, 0x10) #op code
+    chip16.write_8bit(initial_address + 1, 0x00) #y,x
+    chip16.write_8bit(initial_address + 2, 0x00) #ll
+    chip16.write_8bit(initial_address + 3, 0x00) #hh
+
+    chip16.step()
+
+    chip16.write_16bit(initial_address + 2, 0x0BB0)
+
+    chip16.step()
+
+    chip16.pc.should.be.eql(0x0BB0)
+
+def test_read_and_write_block():
+    chip16 = cpu.Cpu()
+
+    chip16.write_block(0xBAF0, [0xFE, 0xCA, 0x0D, 0xF0])
+
+    chip16.read_16bit(0xBAF0).should.eql(0xCAFE)
+    chip16.read_16bit(0xBAF2).should.eql(0xF00D)
+    list(chip16.read_block(0xBAF0, 4)).should.eql([0xFE, 0xCA, 0x0D, 0xF0])
+    chip16.memory()[0xBAF0:0xBAF4].tobytes().should.eql(b"\xfe\xca\x0d\xf0")
+
+def test_write_block_out_of_memory():
+    chip16 = cpu.Cpu()
+
+    write_out_of_memory = lambda: chip16.write_block(0xFFFE, [0x00, 0x00, 0x00])
+
+    write_out_of_memory.should.throw(IndexError)
+
+def test_write_block_invalidates_decoded_instruction():
+    chip16 = cpu.Cpu()
+
+    initial_address = 0x0000
+    chip16.pc = initial_address
+
+    chip16.write_block(initial_address, [0x10, 0x00, 0x00, 0x00]) #JMP 0x0000
+
+    chip16.step()
+
+    chip16.write_block(initial_address, [0x10, 0x00, 0xB0, 0x0B]) #JMP 0x0BB0
+
+    chip16.step()
+
+    chip16.pc.should.be.eql(0x0BB0)
+
+def test_run():
+    chip16 = cpu.Cpu()
+
+    initial_address = 0x0000
+    chip16.pc = initial_address
+    chip16.r[0x0] = 0x0000
+
+    chip16.write_block(initial_address, [0x40, 0x00, 0x01, 0x00, #ADDI R0, 0x0001
+                                         0x10, 0x00, 0x00, 0x00]) #JMP 0x0000
+
+    chip16.run(101).should.eql((101, cpu.Cpu.STOP_CYCLES))
+
+    chip16.r[0x0].should.eql(51)
+    chip16.pc.should.eql(initial_address + 4)
+    chip16.current_cyles.should.eql(101)
+
+def test_run_translated():
+    chip16 = cpu.Cpu()
+    chip16.TRANSLATION_MODE = True
+
+    initial_address = 0x0000
+    chip16.pc = initial_address
+    chip16.r[0x0] = 0x0000
+
+    chip16.write_block(initial_address, [0x40, 0x00, 0x01, 0x00, #ADDI R0, 0x0001
+                                         0x10, 0x00, 0x00, 0x00]) #JMP 0x0000
+
+    chip16.run(101).should.eql((101, cpu.Cpu.STOP_CYCLES))
+
+    chip16.r[0x0].should.eql(51)
+    chip16.pc.should.eql(initial_address + 4)
+    chip16.current_cyles.should.eql(101)
+
+def test_lazy_flags():
+    program = [0x40, 0x00, 0x00, 0x80, #ADDI R0, 0x8000
+               0x60, 0x01, 0x00, 0x00, #ANDI R1, 0x0000
+               0x90, 0x02, 0x02, 0x00, #MULI R2, 0x0002
+               0xC5, 0x00, 0x00, 0x00] #POPF
+    eager = cpu.Cpu()
+    lazy = cpu.Cpu()
+    lazy.LAZY_FLAGS = True
+    lazy.reset()
+    for chip16 in (eager, lazy):
+        chip16.r[0x0] = 0x8000
+        chip16.r[0x1] = 0x00FF
+        chip16.r[0x2] = 0x4000
+        chip16.write_block(0x0000, program)
+        chip16.run(3)
+
+    lazy.flag_carry.should.eql(eager.flag_carry)
+    lazy.flag_zero.should.eql(eager.flag_zero)
+    lazy.flag_overflow.should.eql(1)
+    lazy.flag_overflow.should.eql(eager.flag_overflow)
+    lazy.flag_negative.should.eql(eager.flag_negative)
+
+    for chip16 in (eager, lazy):
+        chip16.step()
+    lazy.read_16bit(lazy.sp).should.eql(eager.read_16bit(eager.sp))
+
+def test_run_idle_self_jump():
+    chip16 = cpu.Cpu()
+
+    chip16.pc = 0x0000
+    chip16.write_block(0x0000, [0x20, 0x00, 0x01, 0x00, #LDI R0, 0x0001
+                                0x10, 0x00, 0x04, 0x00]) #JMP 0x0004
+
+    chip16.run(1000).should.eql((1000, cpu.Cpu.STOP_IDLE))
+
+    chip16.pc.should.eql(0x0004)
+    chip16.r[0x0].should.eql(0x0001)
+    chip16.current_cyles.should.eql(1000)
+
+def test_run_idle_polling_loop():
+    chip16 = cpu.Cpu()
+
+    chip16.pc = 0x0000
+    chip16.r[0x1] = 0x0000
+    chip16.write_block(0x0000, [0x22, 0x00, 0xF0, 0xFF, #LDM R0, 0xFFF0
+                                0x63, 0x00, 0x01, 0x00, #TSTI R0, 0x0001
+                                0x13, 0x10, 0x00, 0x00]) #JME R0, R1, 0x0000
+
+    chip16.run(1000).should.eql((1000, cpu.Cpu.STOP_IDLE))
+
+    chip16.pc.should.eql(0x0004)
+    chip16.current_cyles.should.eql(1000)
+
+    chip16.write_16bit(0xFFF0, 0x0001)
+    chip16.run(5).should.eql((5, cpu.Cpu.STOP_CYCLES))
+    chip16.pc.should.eql(0x000C)
+
+def test_run_idle_loop_rewritten():
+    chip16 = cpu.Cpu()
+
+    chip16.pc = 0x0000
+    chip16.r[0x0] = 0x0000
+    chip16.write_block(0x0000, [0x00, 0x00, 0x00, 0x00, #NOP
+                                0x10, 0x00, 0x00, 0x00]) #JMP 0x0000
+
+    chip16.run(100).should.eql((100, cpu.Cpu.STOP_IDLE))
+    chip16.write_block(0x0000, [0x40, 0x00, 0x01, 0x00]) #ADDI R0, 0x0001
+    chip16.run(10).should.eql((10, cpu.Cpu.STOP_CYCLES))
+
+    chip16.r[0x0].should.eql(5)
+
+def test_run_translated_idle():
+    chip16 = cpu.Cpu()
+    chip16.TRANSLATION_MODE = True
+
+    chip16.pc = 0x0000
+    chip16.write_block(0x0000, [0x02, 0x00, 0x00, 0x00]) #VBLNK
+
+    chip16.run(1000).should.eql((1000, cpu.Cpu.STOP_IDLE))
+
+    chip16.pc.should.eql(0x0000)
+    chip16.current_cyles.should.eql(1000)
+
+def test_run_fused_instructions_match_step():
+    program = [0x20, 0x0A, 0x01, 0x00, #LDI RA, 0x0001
+               0x20, 0x0B, 0x02, 0x00, #LDI RB, 0x0002
+               0x20, 0x0C, 0x03, 0x00, #LDI RC, 0x0003
+               0x50, 0x01, 0x01, 0x00, #SUBI R1, 0x0001
+               0x53, 0x01, 0x00, 0x00, #CMPI R1, 0x0000
+               0x12, 0x01, 0x00, 0x00] #Jx 0x0000
+    for cycles in (1, 2, 5, 13):
+        fused = cpu.Cpu()
+        stepped = cpu.Cpu()
+        for chip16 in (fused, stepped):
+            chip16.pc = 0x0000
+            chip16.r[0x1] = 0x0003
+            chip16.write_block(0x0000, program)
+
+        fused.run(cycles).should.eql((cycles, cpu.Cpu.STOP_CYCLES))
+        for x in range(0, cycles):
+            stepped.step()
+
+        fused.pc.should.eql(stepped.pc)
+        fused.r.should.eql(stepped.r)
+        fused.flag_carry.should.eql(stepped.flag_carry)
+        fused.flag_zero.should.eql(stepped.flag_zero)
+        fused.flag_negative.should.eql(stepped.flag_negative)
+        fused.current_cyles.should.eql(cycles)
+
+def test_run_fused_instructions_invalidated_on_write():
+    chip16 = cpu.Cpu()
+    chip16.pc = 0x0000
+    chip16.write_block(0x0000, [0x20, 0x00, 0x01, 0x00, #LDI R0, 0x0001
+                                0x20, 0x01, 0x02, 0x00, #LDI R1, 0x0002
+                                0x10, 0x00, 0x00, 0x00]) #JMP 0x0000
+
+    chip16.run(3)
+    chip16.write_16bit(0x0006, 0x0005)
+    chip16.run(3)
+
+    chip16.r[0x0].should.eql(0x0001)
+    chip16.r[0x1].should.eql(0x0005)
+
+def breakpoint_loop(translated=False):
+    chip16 = cpu.Cpu()
+    chip16.TRANSLATION_MODE = translated
+    chip16.pc = 0x0000
+    chip16.r[0x0] = 0x0000
+    chip16.write_block(0x0000, [0x40, 0x00, 0x01, 0x00, #ADDI R0, 0x0001
+                                0x20, 0x01, 0x02, 0x00, #LDI R1, 0x0002
+                                0x10, 0x00, 0x00, 0x00]) #JMP 0x0000
+    chip16.add_breakpoint(0x0004)
+    return chip16
+
+def test_breakpoint_stops_run_before_instruction():
+    for translated in (False, True):
+        chip16 = breakpoint_loop(translated)
+
+        chip16.run(100).should.eql((1, cpu.Cpu.STOP_BREAKPOINT))
+        chip16.pc.should.eql(0x0004)
+        chip16.r[0x1].should.eql(None)
+        chip16.last_trap.address.should.eql(0x0004)
+
+        chip16.run(100).should.eql((3, cpu.Cpu.STOP_BREAKPOINT))
+        chip16.pc.should.eql(0x0004)
+        chip16.r[0x0].should.eql(2)
+        chip16.r[0x1].should.eql(0x0002)
+
+def test_breakpoint_step_raises():
+    chip16 = breakpoint_loop()
+    chip16.step()
+
+    chip16.step.should.throw(cpu.Breakpoint)
+
+    chip16.step()
+    chip16.pc.should.eql(0x0008)
+
+def test_remove_breakpoint():
+    chip16 = breakpoint_loop()
+    chip16.breakpoints().should.eql([0x0004])
+    chip16.run(100)
+
+    chip16.remove_breakpoint(0x0004)
+
+    chip16.breakpoints().should.eql([])
+    chip16.run(100).should.eql((100, cpu.Cpu.STOP_CYCLES))
+
+def test_watchpoint_stops_run_before_access():
+    for translated in (False, True):
+        chip16 = cpu.Cpu()
+        chip16.TRANSLATION_MODE = translated
+        chip16.pc = 0x0000
+        chip16.r[0x0] = 0x1234
+        chip16.write_block(0x0000, [0x20, 0x01, 0x05, 0x00, #LDI R1, 0x0005
+                                    0x30, 0x00, 0x01, 0x02, #STM R0, 0x0201
+                                    0x22, 0x02, 0x00, 0x03, #LDM R2, 0x0300
+                                    0x10, 0x00, 0x00, 0x00]) #JMP 0x0000
+        chip16.add_watchpoint(0x0202)
+        chip16.add_watchpoint(0x0300, cpu.Cpu.WATCH_READ)
+
+        chip16.run(100).should.eql((1, cpu.Cpu.STOP_WATCHPOINT))
+        chip16.pc.should.eql(0x0004)
+        chip16.r[0x1].should.eql(0x0005)
+        chip16.read_16bit(0x0201).should.eql(0x0000)
+        chip16.last_trap.address.should.eql(0x0202)
+        chip16.last_trap.access.should.eql(cpu.Cpu.WATCH_WRITE)
+
+        chip16.run(100).should.eql((1, cpu.Cpu.STOP_WATCHPOINT))
+        chip16.pc.should.eql(0x0008)
+        chip16.read_16bit(0x0201).should.eql(0x1234)
+        chip16.last_trap.access.should.eql(cpu.Cpu.WATCH_READ)
+
+def test_watchpoints_only_swap_accessors_while_set():
+    chip16 = cpu.Cpu()
+    chip16.add_watchpoint(0x0010, cpu.Cpu.WATCH_READ | cpu.Cpu.WATCH_WRITE)
+    chip16.__dict__.should.have.key('read_16bit')
+    chip16.watchpoints().should.eql([(0x0010, cpu.Cpu.WATCH_READ | cpu.Cpu.WATCH_WRITE)])
+
+    chip16.remove_watchpoint(0x0010)
+
+    chip16.__dict__.shouldnt.have.key('read_16bit')
+    chip16.write_16bit(0x0010, 0x0001)
+    chip16.read_16bit(0x0010).should.eql(0x0001)
+
+def test_load_state_restores_registers_flags_and_code():
+    chip16 = cpu.Cpu()
+    chip16.write_block(0x0000, [0x20, 0x01, 0x05, 0x00, #LDI R1, 0x0005
+                                0x50, 0x01, 0x05, 0x00, #SUBI R1, 0x0005
+                                0x10, 0x00, 0x00, 0x00]) #JMP 0x0000
+    state = chip16.save_state()
+    chip16.run(2)
+    chip16.write_8bit(0x0002, 0x07)
+    chip16.run(3)
+    chip16.r[0x1].should.eql(0x0002)
+
+    chip16.load_state(state)
+
+    chip16.r.should.eql([None] * 16)
+    chip16.flag_zero.should.eql(0)
+    chip16.run(2)
+    chip16.r[0x1].should.eql(0x0000)
+    chip16.flag_zero.should.eql(1)
+    chip16.current_cyles.should.eql(2)
+
+def test_fork_keeps_breakpoints_and_copies_memory():
+    chip16 = breakpoint_loop()
+    chip16.run(100)
+    child = chip16.fork()
+
+    child.pc.should.eql(0x0004)
+    child.breakpoints().should.eql([0x0004])
+    child.write_8bit(0x0100, 0xFF)
+    chip16.read_8bit(0x0100).should.eql(0x00)
+    child.run(100).should.eql((3, cpu.Cpu.STOP_BREAKPOINT))
+    child.r[0x0].should.eql(0x0002)
+    chip16.r[0x0].should.eql(0x0001)
+
+def test_forks_share_memory_until_one_of_them_stores():
+    parent = cpu.Cpu()
+    parent.write_8bit(0x0100, 0x01)
+    first = parent.fork()
+    second = parent.fork()
+
+    first.write_8bit(0x0100, 0x02)
+    parent.read_8bit(0x0100).should.eql(0x01)
+    second.read_8bit(0x0100).should.eql(0x01)
+    parent.write_16bit(0x0200, 0x0304)
+    second.read_16bit(0x0200).should.eql(0x0000)
+    first.read_16bit(0x0200).should.eql(0x0000)
+    second.write_block(0x0300, [0x05])
+    second.memory()[0x0301] = '\x06'
+    parent.read_block(0x0300, 2).should.eql(bytearray([0x00, 0x00]))
+    first.read_block(0x0300, 2).should.eql(bytearray([0x00, 0x00]))
+    third = second.fork()
+    third.load_state(parent.save_state())
+    second.read_block(0x0300, 2).should.eql(bytearray([0x05, 0x06]))
+    third.read_8bit(0x0100).should.eql(0x01)
+
+def test_fork_reuses_what_was_decoded_and_invalidates_it():
+    chip16 = cpu.Cpu()
+    chip16.r[0x0] = 0x0000
+    chip16.write_block(0x0000, [0x40, 0x00, 0x01, 0x00, #ADDI R0, 0x0001
+                                0x20, 0x01, 0x02, 0x00, #LDI R1, 0x0002
+                                0x10, 0x00, 0x00, 0x00]) #JMP 0x0000
+    chip16.run(30)
+    child = chip16.fork()
+    decoded = []
+    create_params = child.create_params
+    def counted(address):
+        decoded.append(address)
+        return create_params(address)
+    child.create_params = counted
+
+    child.run(30)
+    decoded.should.be.empty
+    child.r[0x0].should.eql(20)
+    child.write_block(0x0000, [0x40, 0x00, 0x03, 0x00]) #ADDI R0, 0x0003
+    child.run(3)
+    decoded.should.eql([0x0000])
+    child.r[0x0].should.eql(23)
+    chip16.run(3)
+    chip16.r[0x0].should.eql(11)
+
+def test_RND_sequence_follows_the_seed():
+    def draws(chip16):
+        chip16.pc = 0x0000
+        chip16.write_block(0x0000, [0x07, 0x01, 0xFF, 0xFF]) #RND R1, 0xFFFF
+        values = []
+        for x in range(5):
+            chip16.pc = 0x0000
+            chip16.step()
+            values.append(chip16.r[0x1])
+        return values
+    chip16 = cpu.Cpu()
+    chip16.seed(1234)
+    first = draws(chip16)
+    state = chip16.save_state()
+    following = draws(chip16)
+
+    chip16.reset()
+    draws(chip16).should.eql(first)
+    other = cpu.Cpu()
+    other.seed(1234)
+    draws(other).should.eql(first)
+    other.seed(4321)
+    draws(other).shouldnt.eql(first)
+    chip16.load_state(state)
+    draws(chip16).should.eql(following)
+
+def test_map_device_handles_its_addresses_only():
+    chip16 = cpu.Cpu()
+    written = []
+    device = chip16.map_device(0xFFF4, 2, read=lambda address: address & 0xFF, write=lambda address, value: written.append((address, value)))
+    chip16.__dict__.should.have.key('read_16bit')
+    chip16.pc = 0x0000
+    chip16.write_block(0x0000, [0x22, 0x01, 0xF4, 0xFF, #LDM R1, 0xFFF4
+                                0x20, 0x02, 0x34, 0x12, #LDI R2, 0x1234
+                                0x30, 0x02, 0xF3, 0xFF]) #STM R2, 0xFFF3
+
+    chip16.run(3)
+
+    chip16.r[0x1].should.eql(0xF5F4)
+    written.should.eql([(0xFFF4, 0x12)])
+    chip16.read_8bit(0xFFF3).should.eql(0x34)
+    chip16.unmap_device(device)
+    chip16.__dict__.shouldnt.have.key('read_16bit')
+    chip16.read_16bit(0xFFF4).should.eql(0x0000)
+
+def test_reset_keeps_devices_watchpoints_and_the_flags_mode():
+    chip16 = cpu.Cpu()
+    chip16.LAZY_FLAGS = True
+    chip16.map_device(0xFFF4, 2, read=lambda address: 0x12)
+    chip16.add_watchpoint(0x1000)
+    chip16.write_block(0x0000, [0x40, 0x00, 0x01, 0x00]) #ADDI R0, 0x0001
+    chip16.r[0x0] = 0
+    chip16.step()
+
+    chip16.reset()
+
+    chip16.read_8bit(0xFFF4).should.eql(0x12)
+    chip16.read_8bit(0x0000).should.eql(0x00)
+    chip16.write_block(0x0000, [0x40, 0x00, 0x01, 0x00, #ADDI R0, 0x0001
+                                0x30, 0x00, 0x00, 0x10]) #STM R0, 0x1000
+    chip16.r[0x0] = 0
+    chip16.run(2).should.eql((1, cpu.Cpu.STOP_WATCHPOINT))
+    chip16._pending_flags.shouldnt.be(None)
+    chip16.r[0x0].should.eql(1)
+
+def test_machines_only_create_the_log_file_when_logging(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    chip16 = cpu.Cpu()
+    chip16.reset()
+    tmpdir.join('pchip16.log').check().shouldnt.be.ok
+
+def test_fork_keeps_the_class_and_the_instance_modes():
+    class Traced(cpu.Cpu):
+        pass
+    chip16 = Traced()
+    chip16.GENERATED_MODE = True
+    chip16.LAZY_FLAGS = True
+    chip16.IDLE_CHECK_INTERVAL = 4
+    child = chip16.fork()
+
+    type(child).should.equal(Traced)
+    child.GENERATED_MODE.should.be.true
+    child.LAZY_FLAGS.should.be.true
+    child.IDLE_CHECK_INTERVAL.should.eql(4)
+    cpu.Cpu().fork().__dict__.should_not.contain('LAZY_FLAGS')
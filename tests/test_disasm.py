@@ -0,0 +1,60 @@
+from pchip16 import loader
+from pchip16 import disasm
+from pchip16.rom_chip16 import RomChip16
+from pchip16.cpu import Cpu
+from tests.helpers import rom
+import sure
+
+def test_ascii_rom_blocks():
+    graph = disasm.build(RomChip16(loader.load("roms/ASCII.c16")))
+    sorted(graph.blocks)[:4].should.eql([0x0000, 0x001C, 0x0030, 0x0044])
+    graph.blocks[0x0000].kind.should.eql(disasm.CALL)
+    graph.blocks[0x0000].calls.should.eql([0x0048])
+    graph.blocks[0x0000].successors.should.eql([0x001C])
+    graph.blocks[0x0044].kind.should.eql(disasm.JUMP)
+    graph.blocks[0x0044].successors.should.eql([0x0044])
+    graph.blocks[0x0048].successors.should.eql([0x007C, 0x0058])
+    graph.listing().should.contain("0x0044: jmp 0x44\n")
+    graph.indirect.should.eql([])
+
+def test_flags_indirect_jumps_overlaps_and_data_in_code():
+    graph = disasm.build(rom([0x20, 0x00, 0x10, 0x00, #LDI R0, 0x0010
+                              0x12, 0x00, 0x0E, 0x00, #JZ 0x000E
+                              0x22, 0x01, 0x00, 0x00, #LDM R1, 0x0000
+                              0x18, 0x00, 0x16, 0x00, #CALL R0 / JMP R0 at 0x000E
+                              0x15, 0x00, 0x00, 0x00])) #RET
+    graph.indirect.should.eql([0x000C, 0x000E])
+    graph.overlaps.should.eql([(0x000C, 0x000E), (0x000E, 0x0010)])
+    graph.data_in_code.should.eql([(0x0008, 0x0000)])
+    graph.blocks[0x000E].kind.should.eql(disasm.INDIRECT)
+    graph.blocks[0x000E].successors.should.eql([])
+    graph.blocks[0x0010].kind.should.eql(disasm.RETURN)
+
+def test_invalid_op_codes_end_the_walk():
+    graph = disasm.build(rom([0x20, 0x00, 0x10, 0x00, #LDI R0, 0x0010
+                              0xFF, 0x00, 0x00, 0x00]))
+    graph.blocks[0x0000].instructions.should.eql([(0x0000, 'ldi r0, 0x10'), (0x0004, 'db 0xFF')])
+    graph.blocks[0x0000].kind.should.eql(disasm.INVALID)
+
+def test_load_caches_the_graph_by_crc32(tmpdir):
+    ascii = RomChip16(loader.load("roms/ASCII.c16"))
+    graph = disasm.load(ascii, str(tmpdir))
+    path = tmpdir.join("%08x.json" % ascii.crc32)
+    path.check().should.be.ok
+    disasm.load(ascii, str(tmpdir)).to_json().should.eql(graph.to_json())
+
+    path.write('{"version": 0}')
+    disasm.load(ascii, str(tmpdir)).to_json().should.eql(graph.to_json())
+    disasm.Graph.from_json(path.read()).listing().should.eql(graph.listing())
+
+def test_precompile_decodes_and_translates_known_blocks():
+    ascii = RomChip16(loader.load("roms/ASCII.c16"))
+    graph = disasm.build(ascii)
+    cpu = Cpu()
+    cpu.TRANSLATION_MODE = True
+    cpu.write_block(0x0000, ascii.rom)
+    disasm.precompile(cpu, graph)
+    for address, text in graph.instructions():
+        cpu.disassemble(address).should.eql(text)
+    cpu.run(1000)
+    cpu.pc.should.eql(0x0044)
@@ -0,0 +1,194 @@
+from pchip16.gpu import Gpu
+from pchip16 import cpu
+import sure
+
+def sprite_gpu(memory):
+    gpu = Gpu(lambda address, size: bytearray(memory[address:address + size]))
+    gpu.spritew = 0x02 #4 pixels
+    gpu.spriteh = 0x02
+    return gpu
+
+SPRITE = [0x12, 0x30, #1 2 3 0
+          0x04, 0x56] #0 4 5 6
+
+def test_drw_blits_the_sprite_skipping_colour_zero():
+    gpu = sprite_gpu(SPRITE)
+    gpu.framebuffer[10, 13] = 0x9
+
+    gpu.drw_hhll(0x0000, 10, 10).should.eql(0)
+
+    gpu.framebuffer[10, 10:14].tolist().should.eql([1, 2, 3, 9])
+    gpu.framebuffer[11, 10:14].tolist().should.eql([0, 4, 5, 6])
+    int(gpu.framebuffer.sum()).should.eql(1 + 2 + 3 + 9 + 4 + 5 + 6)
+
+def test_drw_sets_the_carry_when_drawn_pixels_overlap():
+    gpu = sprite_gpu(SPRITE)
+    gpu.drw_hhll(0x0000, 0, 0).should.eql(0)
+    # only transparent pixels over the drawn ones
+    gpu.drw_hhll(0x0000, 3, 0).should.eql(0)
+    gpu.drw_hhll(0x0000, 2, 1).should.eql(1)
+
+def test_drw_flips_and_clips():
+    gpu = sprite_gpu(SPRITE)
+    gpu.flip(True, True)
+    gpu.drw_hhll(0x0000, 0xFFFF, 0xFFFF) #(-1, -1)
+    # flipped: 6 5 4 0 / 0 3 2 1, only the last 3 pixels of the last line are on screen
+    gpu.framebuffer[0, 0:4].tolist().should.eql([3, 2, 1, 0])
+    int(gpu.framebuffer.sum()).should.eql(6)
+
+    gpu.flip(False, False)
+    gpu.drw_hhll(0x0000, 318, 239)
+    gpu.framebuffer[239, 318:320].tolist().should.eql([1, 2])
+    gpu.drw_hhll(0x0000, 320, 0).should.eql(0)
+
+def test_cls_screen_and_state():
+    gpu = sprite_gpu(SPRITE)
+    gpu.bg = 0xA
+    gpu.drw_hhll(0x0000, 0, 0)
+    gpu.screen()[0:2, 0:4].tolist().should.eql([[1, 2, 3, 0xA], [0xA, 4, 5, 6]])
+
+    restored = Gpu()
+    restored.load_state(gpu.save_state())
+    restored.framebuffer.tolist().should.eql(gpu.framebuffer.tolist())
+
+    gpu.clear_fg()
+    gpu.clear_bg()
+    gpu.screen().any().should.be.false
+
+def test_cpu_draws_from_its_memory():
+    chip16 = cpu.Cpu()
+    chip16.write_block(0x0000, [0x04, 0x00, 0x02, 0x02, #SPR 0x0202
+                                0x05, 0x10, 0x00, 0x10, #DRW R0, R1, 0x1000
+                                0x05, 0x10, 0x00, 0x10]) #DRW R0, R1, 0x1000
+    chip16.write_block(0x1000, SPRITE)
+    chip16.r[0x0] = 5
+    chip16.r[0x1] = 7
+
+    chip16.run(2)
+    chip16.flag_carry.should.eql(0)
+    chip16.gpu.framebuffer[7, 5:9].tolist().should.eql([1, 2, 3, 0])
+    chip16.run(1)
+    chip16.flag_carry.should.eql(1)
+
+def cached_sprite_gpu(memory):
+    reads = []
+    watched = []
+    unwatched = []
+    def read_block(address, size):
+        reads.append(address)
+        return bytearray(memory[address:address + size])
+    gpu = Gpu(read_block, lambda address, size: watched.append((address, size)),
+              lambda address, size: unwatched.append((address, size)))
+    gpu.spritew = 2
+    gpu.spriteh = 2
+    return gpu, reads, watched, unwatched
+
+def test_sprites_are_decoded_once_per_address_size_and_flips():
+    gpu, reads, watched, unwatched = cached_sprite_gpu(SPRITE + SPRITE)
+    gpu.drw_hhll(0x0000, 0, 0)
+    gpu.drw_hhll(0x0000, 10, 0)
+    reads.should.eql([0x0000])
+    watched.should.eql([(0x0000, 4)])
+    gpu.framebuffer[0, 10:14].tolist().should.eql([1, 2, 3, 0])
+
+    gpu.hflip = True
+    gpu.drw_hhll(0x0000, 20, 0)
+    reads.should.eql([0x0000, 0x0000])
+    gpu.framebuffer[0, 20:24].tolist().should.eql([0, 3, 2, 1])
+    len(gpu.sprites).should.eql(2)
+
+def test_sprite_cache_drops_the_least_recently_drawn_and_invalidated_sprites():
+    gpu, reads, watched, unwatched = cached_sprite_gpu([0x11] * 0x400)
+    gpu.SPRITE_CACHE_SIZE = 2
+    gpu.drw_hhll(0x0000, 0, 0)
+    gpu.drw_hhll(0x0100, 0, 0)
+    gpu.drw_hhll(0x0000, 0, 0)
+    gpu.drw_hhll(0x0200, 0, 0)
+    sorted(key[0] for key in gpu.sprites).should.eql([0x0000, 0x0200])
+    unwatched.should.eql([(0x0100, 0x100)])
+
+    gpu.invalidate(0x0203, 1)
+    sorted(key[0] for key in gpu.sprites).should.eql([0x0000])
+    gpu.invalidate(0x0004, 0x100)
+    len(gpu.sprites).should.eql(1)
+    unwatched.should.eql([(0x0100, 0x100), (0x0200, 0x100)])
+
+    gpu.clear_sprites()
+    len(gpu.sprites).should.eql(0)
+    gpu.drw_hhll(0x0000, 0, 0)
+    reads.should.eql([0x0000, 0x0100, 0x0200, 0x0000])
+
+def test_cpu_writes_drop_the_cached_sprites_they_touch():
+    chip16 = cpu.Cpu()
+    chip16.write_block(0x0000, [0x04, 0x00, 0x02, 0x02, #SPR 0x0202
+                                0x05, 0x10, 0x00, 0x10, #DRW R0, R1, 0x1000
+                                0x30, 0x02, 0x00, 0x10, #STM R2, 0x1000
+                                0x05, 0x10, 0x00, 0x10]) #DRW R0, R1, 0x1000
+    chip16.write_block(0x1000, SPRITE)
+    chip16.r[0x0] = 0
+    chip16.r[0x1] = 7
+    chip16.r[0x2] = 0x0077
+
+    chip16.run(2)
+    len(chip16.gpu.sprites).should.eql(1)
+    chip16.run(1)
+    len(chip16.gpu.sprites).should.eql(0)
+    chip16.run(1)
+    chip16.gpu.framebuffer[7, 0:4].tolist().should.eql([7, 7, 3, 0])
+
+    chip16.reset()
+    len(chip16.gpu.sprites).should.eql(0)
+
+def test_framebuffer_is_allocated_on_first_draw():
+    gpu = sprite_gpu(SPRITE)
+    gpu.bg = 0x3
+    gpu.screen()[0, 0:2].tolist().should.eql([3, 3])
+    blank = gpu.save_state()
+
+    gpu.drw_hhll(0x0000, 0, 0)
+    gpu.framebuffer[0, 0:4].tolist().should.eql([1, 2, 3, 0])
+    gpu.clear_fg()
+    gpu.save_state().should.eql(blank)
+    gpu.screen()[0, 0:2].tolist().should.eql([3, 3])
+
+def test_forked_cpu_draws_from_its_own_memory_and_framebuffer():
+    parent = cpu.Cpu()
+    parent.write_block(0x0000, [0x04, 0x00, 0x02, 0x02, #SPR 0x0202
+                                0x05, 0x10, 0x00, 0x10]) #DRW R0, R1, 0x1000
+    parent.write_block(0x1000, SPRITE)
+    parent.r[0x0] = 0
+    parent.r[0x1] = 0
+    parent.run(2)
+    child = parent.fork()
+    (child.gpu is parent.gpu).should.be.false
+    (child.spu is parent.spu).should.be.false
+    child.gpu.framebuffer.tolist().should.eql(parent.gpu.framebuffer.tolist())
+
+    child.write_block(0x1000, [0x77, 0x77, 0x77, 0x77])
+    child.r[0x0] = 8
+    child.pc = 0x0004
+    child.run(1)
+    child.gpu.framebuffer[0, 8:12].tolist().should.eql([7, 7, 7, 7])
+    parent.gpu.framebuffer[0, 8:12].tolist().should.eql([0, 0, 0, 0])
+
+    parent.pc = 0x0004
+    parent.run(1)
+    parent.flag_carry.should.eql(1)
+    parent.gpu.framebuffer[0, 0:4].tolist().should.eql([1, 2, 3, 0])
+
+    parent.gpu.start_vblank()
+    child.gpu.vblank().should.be.false
+
+def test_copy_state_matches_load_state():
+    gpu = sprite_gpu(SPRITE)
+    gpu.bg = 0x5
+    gpu.set_palette(0x3, 10, 20, 30)
+    gpu.drw_hhll(0x0000, 4, 4)
+    copied = Gpu()
+    copied.copy_state(gpu)
+    copied.save_state().should.eql(gpu.save_state())
+
+    copied.set_palette(0x3, 0, 0, 0)
+    copied.framebuffer[4, 4] = 0
+    gpu.palette[0x3]['r'].should.eql(10.0/255.0)
+    int(gpu.framebuffer[4, 4]).should.eql(1)
@@ -0,0 +1,76 @@
+from pchip16 import cpu
+from pchip16 import interpreter
+import sure
+
+PROGRAM = [0x20, 0x00, 0x00, 0x00, #LDI R0, 0x0000
+           0x40, 0x00, 0x01, 0x00, #ADDI R0, 0x0001
+           0x30, 0x00, 0x00, 0x10, #STM R0, 0x1000
+           0x07, 0x01, 0xFF, 0x00, #RND R1, 0x00FF
+           0x53, 0x00, 0x00, 0x01, #CMPI R0, 0x0100
+           0x10, 0x00, 0x04, 0x00] #JMP 0x0004
+
+def generated_cpu():
+    chip16 = cpu.Cpu()
+    chip16.GENERATED_MODE = True
+    chip16.r = [0] * 16
+    chip16.write_block(0x0000, PROGRAM)
+    return chip16
+
+def test_generated_loop_runs_like_the_interpreter():
+    interpreted = cpu.Cpu()
+    interpreted.r = [0] * 16
+    interpreted.write_block(0x0000, PROGRAM)
+    generated = generated_cpu()
+    for chip16 in (interpreted, generated):
+        chip16.run(1000).should.eql((1000, cpu.Cpu.STOP_CYCLES))
+
+    generated.save_state().should.eql(interpreted.save_state())
+
+def test_vblank_waits_are_idle():
+    chip16 = cpu.Cpu()
+    chip16.GENERATED_MODE = True
+    chip16.write_block(0x0000, [0x02, 0x00, 0x00, 0x00]) #VBLNK
+
+    chip16.run(500).should.eql((500, cpu.Cpu.STOP_IDLE))
+    chip16.pc.should.eql(0x0000)
+    chip16.gpu.start_vblank()
+    chip16.run(1).should.eql((1, cpu.Cpu.STOP_CYCLES))
+    chip16.pc.should.eql(0x0004)
+
+def test_errors_leave_pc_on_the_failing_instruction():
+    chip16 = cpu.Cpu()
+    chip16.GENERATED_MODE = True
+    chip16.write_block(0x0000, [0x20, 0x00, 0x05, 0x00, #LDI R0, 0x0005
+                                0xA0, 0x00, 0x00, 0x00]) #DIVI R0, 0x0000
+    f = lambda: chip16.run(10)
+    f.should.throw(ZeroDivisionError)
+    chip16.pc.should.eql(0x0004)
+    chip16.current_cyles.should.eql(1)
+
+def test_breakpoints_and_watchpoints_stop_the_generated_loop():
+    chip16 = generated_cpu()
+    chip16.add_breakpoint(0x0010)
+    chip16.run(100).should.eql((4, cpu.Cpu.STOP_BREAKPOINT))
+    chip16.remove_breakpoint(0x0010)
+    chip16.add_watchpoint(0x1000)
+    chip16.run(100).should.eql((3, cpu.Cpu.STOP_WATCHPOINT))
+    chip16.pc.should.eql(0x0008)
+    chip16.read_16bit(0x1000).should.eql(1)
+
+def test_profiling_and_tracing_variants():
+    chip16 = generated_cpu()
+    profiler = chip16.start_profiling()
+    chip16.run(8)
+    chip16.stop_profiling()
+    [(mnemonic, count) for mnemonic, count, elapsed in profiler.hottest_mnemonics(3)].should.eql([('ADDI RX, HHLL', 2), ('STM RX, HHLL', 2), ('CMPI RX, HHLL', 1)])
+    interpreter.profiled_order(profiler)[:2].should.eql((0x30, 0x40))
+
+    chip16.DEBUG_MODE = True
+    chip16.run(3)
+    [pc for cycle, pc, data, registers in chip16.trace.entries()].should.eql([0x000C, 0x0010, 0x0014])
+
+def test_generated_loop_order():
+    source = interpreter.generate(interpreter.PLAIN, (0x07, 0x53))
+    source.index("op_code == 0x07").should.be.lower_than(source.index("op_code == 0x53"))
+    source.index("op_code == 0x53").should.be.lower_than(source.index("op_code == 0x20"))
+    interpreter.variant(interpreter.PLAIN, (0x07, 0x53)).should.be(interpreter.variant(interpreter.PLAIN, [0x07, 0x53]))
@@ -0,0 +1,54 @@
+from pchip16 import loader
+from pchip16.rom_chip16 import RomChip16
+from pchip16.chip16 import Chip16
+from pchip16.controller import Controller
+from pchip16.movie import Movie
+import sure
+
+def pad_program(vm):
+    # adds the controller 1 state read at every vblank into r1
+    vm.cpu.write_block(0x0000, [0x02, 0x00, 0x00, 0x00, #VBLNK
+                                0x22, 0x00, 0xF0, 0xFF, #LDM R0, 0xFFF0
+                                0x41, 0x01, 0x00, 0x00, #ADD R1, R0
+                                0x10, 0x00, 0x00, 0x00]) #JMP 0x0000
+    vm.cpu.r[0x1] = 0
+
+def test_controller_buttons():
+    controller = Controller()
+    controller.press(Controller.A)
+    controller.press(Controller.LEFT)
+    controller.release(Controller.A)
+
+    controller.state.should.eql(Controller.LEFT)
+
+def test_movie_keeps_changes_and_replays_the_session():
+    rom = RomChip16(loader.load("roms/ASCII.c16"))
+    vm = Chip16(rom)
+    pad_program(vm)
+    movie = Movie(seed=42)
+    presses = {3: Controller.A, 4: Controller.A, 7: Controller.UP | Controller.B}
+    movie.record(vm, lambda: (presses.get(vm.frames, 0x00), 0x00))
+    for frame in range(10):
+        vm.run_frame()
+
+    movie.frames.should.eql(10)
+    movie.changes.should.eql([(1, 0x00, 0x00), (3, Controller.A, 0x00), (5, 0x00, 0x00),
+                              (7, Controller.UP | Controller.B, 0x00), (8, 0x00, 0x00)])
+    replayed = Chip16(rom)
+    pad_program(replayed)
+    Movie.from_bytes(movie.to_bytes()).play(replayed)
+    for frame in range(10):
+        replayed.run_frame()
+    replayed.save_state().should.eql(vm.save_state())
+    vm.cpu.r[0x1].should.eql(2 * Controller.A + (Controller.UP | Controller.B))
+
+def test_movie_file_round_trip(tmpdir):
+    movie = Movie(crc32=0x390d4da6, seed=7)
+    movie.frames = 120
+    movie.changes = [(1, 0x00, 0x00), (60, Controller.START, 0x00)]
+    path = str(tmpdir.join('session.movie'))
+
+    movie.save(path)
+    loaded = Movie.load(path)
+
+    (loaded.crc32, loaded.seed, loaded.frames, loaded.changes).should.eql((0x390d4da6, 7, 120, movie.changes))
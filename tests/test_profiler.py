@@ -0,0 +1,44 @@
+from pchip16 import cpu
+import json
+import sure
+
+def profiled_loop():
+    chip16 = cpu.Cpu()
+    chip16.pc = 0x0000
+    chip16.r[0x0] = 0x0000
+    chip16.write_block(0x0000, [0x40, 0x00, 0x01, 0x00, #ADDI R0, 0x0001
+                                0x10, 0x00, 0x00, 0x00]) #JMP 0x0000
+    profiler = chip16.start_profiling()
+    chip16.run(11)
+    chip16.stop_profiling()
+    return chip16, profiler
+
+def test_counts_per_mnemonic_and_address():
+    chip16, profiler = profiled_loop()
+
+    chip16.r[0x0].should.eql(6)
+    chip16.current_cyles.should.eql(11)
+    profiler.instructions().should.eql(11)
+    [(mnemonic, count) for mnemonic, count, elapsed in profiler.hottest_mnemonics()].should.eql([('ADDI RX, HHLL', 6), ('JMP HHLL', 5)])
+    [(address, count, disassembly) for address, count, elapsed, disassembly in profiler.hottest_addresses()].should.eql([(0x0000, 6, 'addi r0, 0x1'), (0x0004, 5, 'jmp 0x0')])
+
+def test_stop_profiling_restores_step():
+    chip16, profiler = profiled_loop()
+
+    chip16.profiler.should.be.none
+    chip16.__dict__.shouldnt.have.key('step')
+    chip16.run(2)
+    profiler.instructions().should.eql(11)
+
+def test_reports():
+    chip16, profiler = profiled_loop()
+
+    report = profiler.report()
+    report.should.contain('ADDI RX, HHLL')
+    report.should.contain('0x0004   jmp 0x0')
+
+    exported = json.loads(profiler.to_json(top=1))
+    exported['instructions'].should.eql(11)
+    exported['mnemonics'][0]['mnemonic'].should.eql('ADDI RX, HHLL')
+    exported['addresses'].should.have.length_of(1)
+    exported['addresses'][0]['disassembly'].should.eql('addi r0, 0x1')
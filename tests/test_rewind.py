@@ -0,0 +1,52 @@
+from pchip16 import loader
+from pchip16.rom_chip16 import RomChip16
+from pchip16.chip16 import Chip16
+import sure
+
+def counting_machine():
+    vm = Chip16(RomChip16(loader.load("roms/ASCII.c16")))
+    vm.cpu.write_block(0x0000, [0x20, 0x00, 0x00, 0x00, #LDI R0, 0x0000
+                                0x02, 0x00, 0x00, 0x00, #VBLNK
+                                0x40, 0x00, 0x01, 0x00, #ADDI R0, 0x0001
+                                0x30, 0x00, 0x00, 0x10, #STM R0, 0x1000
+                                0x10, 0x00, 0x04, 0x00]) #JMP 0x0004
+    return vm
+
+def test_step_back_restores_previous_frames():
+    vm = counting_machine()
+    vm.start_rewind(seconds=1, keyframe_interval=4)
+    for frame in range(10):
+        vm.run_frame()
+    vm.cpu.read_16bit(0x1000).should.eql(9)
+
+    vm.step_back().should.eql(Chip16.CYCLES_PER_FRAME * 9)
+    vm.step_back().should.eql(Chip16.CYCLES_PER_FRAME * 8)
+
+    vm.frames.should.eql(8)
+    vm.cpu.read_16bit(0x1000).should.eql(7)
+    vm.run_frame()
+    vm.cpu.read_16bit(0x1000).should.eql(8)
+    len(vm.rewind).should.eql(9)
+
+def test_seek_runs_again_from_the_previous_frame():
+    vm = counting_machine()
+    vm.start_rewind(seconds=1, keyframe_interval=4)
+    for frame in range(6):
+        vm.run_frame()
+    expected = counting_machine()
+    expected.run(Chip16.CYCLES_PER_FRAME * 3 + 100)
+
+    vm.seek(Chip16.CYCLES_PER_FRAME * 3 + 100)
+
+    vm.save_state().should.eql(expected.save_state())
+
+def test_history_is_bounded_and_stores_deltas():
+    vm = counting_machine()
+    rewind = vm.start_rewind(seconds=1)
+    for frame in range(2 * Chip16.FRAMES_PER_SECOND):
+        vm.run_frame()
+
+    len(rewind).should.eql(Chip16.FRAMES_PER_SECOND)
+    rewind.size().should.be.lower_than(len(vm.save_state()))
+    seek_before_history = lambda: vm.seek(0)
+    seek_before_history.should.throw(ValueError)
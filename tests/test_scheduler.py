@@ -0,0 +1,34 @@
+from pchip16.scheduler import Scheduler
+import sure
+
+def test_run_due_fires_in_cycle_order():
+    fired = []
+    scheduler = Scheduler(lambda: 0, 1000000)
+    scheduler.schedule(20, 'b', lambda cycle: fired.append(('b', cycle)))
+    scheduler.schedule(10, 'a', lambda cycle: fired.append(('a', cycle)))
+    scheduler.schedule(20, 'c', lambda cycle: fired.append(('c', cycle)))
+
+    scheduler.next_cycle().should.eql(10)
+    scheduler.run_due(15).should.eql(1)
+    scheduler.run_due(20).should.eql(2)
+
+    fired.should.eql([('a', 10), ('b', 20), ('c', 20)])
+    scheduler.next_cycle().should.be.none
+
+def test_cancel():
+    scheduler = Scheduler(lambda: 0, 1000000)
+    scheduler.schedule(10, 'sound', lambda cycle: None)
+    scheduler.schedule(30, 'frame', lambda cycle: None)
+
+    scheduler.cancel('sound')
+
+    scheduler.due('sound').should.be.none
+    scheduler.due('frame').should.eql(30)
+    scheduler.next_cycle().should.eql(30)
+
+def test_schedule_after_uses_clock():
+    scheduler = Scheduler(lambda: 500, 1000000)
+
+    scheduler.schedule_after(scheduler.milliseconds(2), 'sound', lambda cycle: None)
+
+    scheduler.due('sound').should.eql(2500)
@@ -0,0 +1,59 @@
+from pchip16 import cpu
+from pchip16.trace import Trace
+import sure
+
+def traced_loop(trace, cycles):
+    chip16 = cpu.Cpu()
+    chip16.DEBUG_MODE = True
+    chip16.trace = trace
+    chip16.pc = 0x0000
+    chip16.r[0x0] = 0x0000
+    chip16.write_block(0x0000, [0x40, 0x00, 0x01, 0x00, #ADDI R0, 0x0001
+                                0x10, 0x00, 0x00, 0x00]) #JMP 0x0000
+    chip16.run(cycles)
+    return chip16
+
+def test_records_instructions():
+    chip16 = traced_loop(Trace(size=8, registers=(0x0,)), 3)
+
+    chip16.trace.entries().should.eql([
+        (0, 0x0000, (0x40, 0x00, 0x01, 0x00), {0x0: 0x0000}),
+        (1, 0x0004, (0x10, 0x00, 0x00, 0x00), {0x0: 0x0001}),
+        (2, 0x0000, (0x40, 0x00, 0x01, 0x00), {0x0: 0x0001}),
+    ])
+
+def test_keeps_the_last_instructions():
+    chip16 = traced_loop(Trace(size=4, registers=(0x0,)), 11)
+
+    chip16.trace.count.should.eql(11)
+    [entry[0] for entry in chip16.trace.entries()].should.eql([7, 8, 9, 10])
+    [entry[0] for entry in chip16.trace.entries(last=2)].should.eql([9, 10])
+
+def test_step_records_instructions():
+    chip16 = traced_loop(Trace(size=4, registers=()), 0)
+
+    chip16.step()
+
+    chip16.trace.entries().should.eql([(0, 0x0000, (0x40, 0x00, 0x01, 0x00), {})])
+
+def test_records_pc_out_of_memory_and_leaves_the_error_to_the_cpu():
+    chip16 = traced_loop(Trace(size=8, registers=()), 0)
+    chip16.r[0x0] = -4
+    chip16.write_block(0x0000, [0x16, 0x00, 0x00, 0x00]) #JMP R0
+    chip16.write_block(0xFFFC, [0x10, 0x00, 0xFE, 0xFF]) #JMP 0xFFFE
+
+    (lambda: chip16.run(3)).should.throw(IndexError)
+
+    chip16.trace.entries().should.eql([
+        (0, 0x0000, (0x16, 0x00, 0x00, 0x00), {}),
+        (1, 0xFFFC, (0x10, 0x00, 0xFE, 0xFF), {}),
+    ])
+
+def test_dump():
+    chip16 = traced_loop(Trace(size=8, registers=(0x0,)), 2)
+
+    lines = chip16.trace.dump(chip16).splitlines()
+
+    lines.should.have.length_of(2)
+    lines[0].split().should.eql(['0', '0000', '40000100', 'addi', 'r0,', '0x1', 'r0=0000'])
+    lines[1].split().should.eql(['1', '0004', '10000000', 'jmp', '0x0', 'r0=0001'])
@@ -0,0 +1,106 @@
+from pchip16 import cpu
+from pchip16 import translator
+import sure
+
+def write_program(chip16, address, program):
+    for instruction in program:
+        for index, byte in enumerate(instruction):
+            chip16.write_8bit(address + index, byte)
+        address += 4
+
+def test_block_runs_until_branch():
+    chip16 = cpu.Cpu()
+    chip16.pc = 0x0000
+    write_program(chip16, 0x0000, [
+        [0x20, 0x00, 0x0A, 0x00], #LDI R0, 0x000A
+        [0x20, 0x01, 0x02, 0x00], #LDI R1, 0x0002
+        [0x41, 0x10, 0x00, 0x00], #ADD R0, R1
+        [0x10, 0x00, 0x00, 0x01], #JMP 0x0100
+        [0x20, 0x02, 0xFF, 0x00], #LDI R2, 0x00FF
+    ])
+
+    chip16.step_block().should.eql(4)
+
+    chip16.r[0x0].should.eql(0x000C)
+    chip16.r[0x1].should.eql(0x0002)
+    chip16.r[0x2].should.eql(None)
+    chip16.flag_zero.should.eql(0)
+    chip16.pc.should.eql(0x0100)
+    chip16.current_cyles.should.eql(4)
+
+def test_block_matches_interpreter_flags():
+    program = [
+        [0x20, 0x00, 0x00, 0x80], #LDI R0, 0x8000
+        [0x40, 0x00, 0x00, 0x80], #ADDI R0, 0x8000
+        [0x53, 0x01, 0x01, 0x00], #CMPI R1, 0x0001
+        [0x10, 0x00, 0x00, 0x00], #JMP 0x0000
+    ]
+    interpreted = cpu.Cpu()
+    translated = cpu.Cpu()
+    for chip16 in (interpreted, translated):
+        chip16.pc = 0x0000
+        chip16.r[0x1] = 0x0000
+        write_program(chip16, 0x0000, program)
+
+    for x in range(0, 4):
+        interpreted.step()
+    translated.step_block()
+
+    translated.r.should.eql(interpreted.r)
+    translated.flag_carry.should.eql(interpreted.flag_carry)
+    translated.flag_zero.should.eql(interpreted.flag_zero)
+    translated.flag_overflow.should.eql(interpreted.flag_overflow)
+    translated.flag_negative.should.eql(interpreted.flag_negative)
+
+def test_block_is_invalidated_on_write():
+    chip16 = cpu.Cpu()
+    chip16.pc = 0x0000
+    write_program(chip16, 0x0000, [
+        [0x20, 0x00, 0x01, 0x00], #LDI R0, 0x0001
+        [0x10, 0x00, 0x00, 0x00], #JMP 0x0000
+    ])
+
+    chip16.step_block()
+    chip16.write_16bit(0x0002, 0x0002)
+    chip16.step_block()
+
+    chip16.r[0x0].should.eql(0x0002)
+
+def test_block_stops_when_it_overwrites_itself():
+    chip16 = cpu.Cpu()
+    chip16.pc = 0x0000
+    chip16.r[0x1] = 0x0009
+    write_program(chip16, 0x0000, [
+        [0x30, 0x01, 0x06, 0x00], #STM R1, 0x0006
+        [0x20, 0x00, 0x01, 0x00], #LDI R0, 0x0001 becomes LDI R0, 0x0009
+        [0x10, 0x00, 0x00, 0x00], #JMP 0x0000
+    ])
+
+    chip16.step_block().should.eql(1)
+    chip16.pc.should.eql(0x0004)
+
+    chip16.step_block()
+
+    chip16.r[0x0].should.eql(0x0009)
+
+def test_block_exception_leaves_state_of_failing_instruction():
+    chip16 = cpu.Cpu()
+    chip16.pc = 0x0000
+    chip16.r[0x1] = 0x0000
+    write_program(chip16, 0x0000, [
+        [0x20, 0x00, 0x0A, 0x00], #LDI R0, 0x000A
+        [0xA1, 0x10, 0x00, 0x00], #DIV R0, R1
+        [0x10, 0x00, 0x00, 0x00], #JMP 0x0000
+    ])
+
+    chip16.step_block.when.called_with().should.throw(ZeroDivisionError)
+
+    chip16.r[0x0].should.eql(0x000A)
+    chip16.pc.should.eql(0x0004)
+    chip16.current_cyles.should.eql(1)
+
+def test_translate_unknown_op_code():
+    chip16 = cpu.Cpu()
+    write_program(chip16, 0x0000, [[0xFF, 0x00, 0x00, 0x00]])
+
+    translator.translate(chip16, 0x0000).should.be.none
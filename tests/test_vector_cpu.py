@@ -0,0 +1,138 @@
+import sure
+from pchip16 import cpu
+from pchip16.vector_cpu import VectorCpu
+
+PROGRAM = [0x20, 0x01, 0x07, 0x00, #LDI R1, 0x0007
+           0x41, 0x10, 0x00, 0x00, #ADD R0, R1
+           0xA1, 0x10, 0x00, 0x00, #DIV R0, R1
+           0x50, 0x01, 0x01, 0x00, #SUBI R1, 0x0001
+           0x30, 0x00, 0x00, 0x10, #STM R0, 0x1000
+           0xC0, 0x01, 0x00, 0x00, #PUSH R1
+           0x53, 0x01, 0x00, 0x00, #CMPI R1, 0x0000
+           0x13, 0x21, 0x28, 0x00, #JME R1, R2, 0x0028
+           0x10, 0x00, 0x04, 0x00, #JMP 0x0004
+           0x00, 0x00, 0x00, 0x00, #NOP
+           0xE4, 0x00, 0x00, 0x00, #NEG R0
+           0x10, 0x00, 0x28, 0x00] #JMP 0x0028
+
+def scalar(r0):
+    chip16 = cpu.Cpu()
+    chip16.write_block(0x0000, PROGRAM)
+    chip16.r[:] = [0] * 16
+    chip16.r[0x0] = r0
+    return chip16
+
+def test_instances_match_the_cpu():
+    values = [0x0000, 0x0001, 0x7FFF, 0xFFFF, 0x1234]
+    vector = VectorCpu.from_cpu(scalar(0), len(values))
+    vector.r[:, 0x0] = values
+
+    vector.run(100).should.eql(100)
+
+    for index, value in enumerate(values):
+        chip16 = scalar(value)
+        for step in range(100):
+            chip16.step()
+        vector.cpu(index).save_state().should.eql(chip16.save_state())
+
+def test_drawing_instances_match_the_cpu():
+    def drawing(r0):
+        chip16 = cpu.Cpu()
+        chip16.write_block(0x0000, [0x04, 0x00, 0x02, 0x02, #SPR 0x0202
+                                    0x05, 0x10, 0x00, 0x10, #DRW R0, R1, 0x1000
+                                    0x05, 0x12, 0x00, 0x10, #DRW R2, R1, 0x1000
+                                    0x08, 0x00, 0x00, 0x02, #FLIP 1, 0
+                                    0x06, 0x10, 0x03, 0x00, #DRW R0, R1, R3
+                                    0x01, 0x00, 0x00, 0x00, #CLS
+                                    0x05, 0x10, 0x00, 0x10]) #DRW R0, R1, 0x1000
+        chip16.write_block(0x1000, [0x12, 0x30, 0x04, 0x56])
+        chip16.write_block(0x2000, [0x00, 0x10])
+        chip16.r[:] = [0] * 16
+        chip16.r[0x0] = r0
+        chip16.r[0x3] = 0x2000
+        return chip16
+    values = [0, 2, 4, 0xFFFE]
+    vector = VectorCpu.from_cpu(drawing(0), len(values))
+    vector.r[:, 0x0] = values
+    chips = [drawing(value) for value in values]
+
+    for step in range(7):
+        vector.step()
+        for chip16 in chips:
+            chip16.step()
+        vector.flag_carry.tolist().should.eql([chip16.flag_carry for chip16 in chips])
+
+    for index, chip16 in enumerate(chips):
+        vector.cpu(index).save_state().should.eql(chip16.save_state())
+        vector.gpu(index).save_state().should.eql(chip16.gpu.save_state())
+
+def test_faulting_instances_halt():
+    chip16 = scalar(0)
+    chip16.write_block(0x0000, [0x20, 0x01, 0x00, 0x00]) #LDI R1, 0x0000
+    vector = VectorCpu.from_cpu(chip16, 2)
+    vector.step()
+    vector.r[1, 0x1] = 0x0002
+
+    vector.step()
+    vector.step()
+
+    vector.halted.tolist().should.eql([True, False])
+    vector.pc.tolist().should.eql([0x0008, 0x000C])
+    vector.current_cyles.tolist().should.eql([2, 3])
+
+def test_stores_faulting_at_the_end_of_memory_keep_their_low_byte():
+    def store(address, sp):
+        chip16 = cpu.Cpu()
+        chip16.write_block(0x0000, [0x31, 0x10, 0x00, 0x00, #STM R0, R1
+                                    0xC0, 0x00, 0x00, 0x00]) #PUSH R0
+        chip16.r[:] = [0] * 16
+        chip16.r[0x0] = 0xBEEF
+        chip16.r[0x1] = address
+        chip16.sp = sp
+        return chip16
+    addresses = [(0xFFFE, 0x0000), (0xFFFF, 0x0000), (0x1000, 0xFFFF)]
+    vector = VectorCpu.from_cpu(store(0x0000, 0x0000), len(addresses))
+    for index, (address, sp) in enumerate(addresses):
+        vector.r[index, 0x1] = address
+        vector.sp[index] = sp
+
+    vector.run(2)
+
+    vector.halted.tolist().should.eql([False, True, True])
+    int(vector.memory[1, 0xFFFF]).should.eql(0xEF)
+    int(vector.memory[2, 0xFFFF]).should.eql(0xEF)
+    for index, (address, sp) in enumerate(addresses):
+        chip16 = store(address, sp)
+        try:
+            chip16.run(2)
+        except IndexError:
+            pass
+        vector.cpu(index).save_state().should.eql(chip16.save_state())
+
+def test_vblank_waits_for_start_vblank():
+    vector = VectorCpu(3)
+    vector.write_block(0x0000, [0x02, 0x00, 0x00, 0x00]) #VBLNK
+
+    vector.run(2)
+    vector.pc.tolist().should.eql([0, 0, 0])
+    vector.start_vblank()
+    vector.step()
+
+    vector.pc.tolist().should.eql([4, 4, 4])
+    vector.current_cyles.tolist().should.eql([3, 3, 3])
+
+def test_RND_follows_the_seed_of_each_instance():
+    vector = VectorCpu(2)
+    vector.seed([7, 8])
+    vector.write_block(0x0000, [0x07, 0x01, 0xFF, 0x00, #RND R1, 0x00FF
+                                0x10, 0x00, 0x00, 0x00]) #JMP 0x0000
+    vector.run(20)
+
+    for index, seed in enumerate([7, 8]):
+        chip16 = cpu.Cpu()
+        chip16.seed(seed)
+        chip16.write_block(0x0000, [0x07, 0x01, 0xFF, 0x00, 0x10, 0x00, 0x00, 0x00])
+        chip16.r[:] = [0] * 16
+        for step in range(20):
+            chip16.step()
+        vector.cpu(index).save_state().should.eql(chip16.save_state())